@@ -0,0 +1,203 @@
+#
+#	THIS FILE IS PART OF THE JOKOSHER PROJECT AND LICENSED UNDER THE GPL. SEE
+#	THE 'COPYING' FILE FOR DETAILS
+#
+#	ClickGenerator.py
+#
+#	This module generates the audio of the click track as it is played,
+#	pushing it into an appsrc element, instead of setting the volume of a
+#	test tone with a controller point for every beat of the project.
+#
+#-------------------------------------------------------------------------------
+
+import threading, math, sys
+from array import array
+import pygst
+pygst.require("0.10")
+import gst
+
+# the sample rate of the generated audio
+RATE = 44100
+
+# the caps of the audio pushed into the appsrc
+CAPS = "audio/x-raw-float,rate=%d,channels=1,width=32,endianness=(int)%d" % \
+		(RATE, {"little" : 1234, "big" : 4321}[sys.byteorder])
+SAMPLE_WIDTH = 4
+
+# the number of samples in each buffer
+BUFFER_SAMPLES = 2048
+
+# the number of buffers the appsrc queues, so tempo changes are heard quickly
+QUEUED_BUFFERS = 4
+
+# the time in seconds a click takes to fade in, and to fade out again
+CLICK_LENGTH = 0.1
+
+# the pitch of the clicks, the first beat of every bar is an octave higher
+FREQUENCY = 440.
+ACCENT_FREQUENCY = 880.
+
+#=========================================================================
+
+class ClickGenerator:
+	"""
+	Generates the clicks of the click track when the appsrc asks for more
+	audio. Each buffer is worked out from the Project's current tempo and
+	time signature, so changing them doesn't need any work beforehand, and
+	the clicks carry on for as long as the Project is played. Every beat
+	falls on the sample nearest to its exact time.
+	"""
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, appsrc, project):
+		"""
+		Creates a new instance of ClickGenerator.
+		
+		Parameters:
+			appsrc -- the appsrc element at the start of the click track bin.
+			project -- the Project whose tempo and time signature are used.
+		"""
+		self.appsrc = appsrc
+		self.project = project
+		self.enabled = False
+		self.lock = threading.Lock()
+		self.sample = 0		#the next sample to be generated
+		
+		# the samples of a click, centred on its beat
+		self.accentClick = self.__MakeClick(ACCENT_FREQUENCY)
+		self.click = self.__MakeClick(FREQUENCY)
+		
+		self.appsrc.set_property("caps", gst.caps_from_string(CAPS))
+		self.appsrc.set_property("format", gst.FORMAT_TIME)
+		self.appsrc.set_property("stream-type", 1)	#GST_APP_STREAM_TYPE_SEEKABLE
+		self.appsrc.set_property("max-bytes", BUFFER_SAMPLES * SAMPLE_WIDTH * QUEUED_BUFFERS)
+		self.appsrc.connect("need-data", self.__NeedData)
+		self.appsrc.connect("seek-data", self.__SeekData)
+	
+	#_____________________________________________________________________
+	
+	def SetEnabled(self, enabled):
+		"""
+		Turns the clicks on or off. While they are off, only silence
+		is generated, which costs almost nothing.
+		
+		Parameters:
+			enabled -- True to generate the clicks.
+		"""
+		self.enabled = enabled
+	
+	#_____________________________________________________________________
+	
+	def __NeedData(self, appsrc, length):
+		"""
+		Pushes the next buffer of audio into the appsrc. Called from the
+		streaming thread whenever the appsrc's queue runs low.
+		
+		Parameters:
+			appsrc -- reserved for GStreamer callbacks, don't use it explicitly.
+			length -- reserved for GStreamer callbacks, don't use it explicitly.
+		"""
+		self.lock.acquire()
+		start = self.sample
+		self.sample += BUFFER_SAMPLES
+		self.lock.release()
+		
+		buffer = gst.Buffer(self.__Generate(start, BUFFER_SAMPLES))
+		buffer.timestamp = start * gst.SECOND / RATE
+		buffer.duration = (start + BUFFER_SAMPLES) * gst.SECOND / RATE - buffer.timestamp
+		buffer.offset = start
+		buffer.offset_end = start + BUFFER_SAMPLES
+		appsrc.emit("push-buffer", buffer)
+	
+	#_____________________________________________________________________
+	
+	def __SeekData(self, appsrc, offset):
+		"""
+		Moves to the position the pipeline has been seeked to.
+		
+		Parameters:
+			appsrc -- reserved for GStreamer callbacks, don't use it explicitly.
+			offset -- the new position in nanoseconds.
+		
+		Returns:
+			True -- the seek was successful.
+		"""
+		self.lock.acquire()
+		self.sample = int(offset * RATE / gst.SECOND)
+		self.lock.release()
+		return True
+	
+	#_____________________________________________________________________
+	
+	def __Generate(self, start, count):
+		"""
+		Generates some samples of the click track.
+		
+		Parameters:
+			start -- the number of the first sample since the start of the Project.
+			count -- the number of samples.
+		
+		Returns:
+			a string of native endian 32 bit float samples.
+		"""
+		if not self.enabled:
+			return "\0" * (count * SAMPLE_WIDTH)
+		
+		samples = array("f", [0.0]) * count
+		interval = RATE * 60.0 / self.project.bpm	#samples per beat
+		beatsPerBar = max(self.project.meter_nom, 1)
+		half = len(self.click) / 2
+		
+		# the first beat whose click reaches into this buffer
+		beat = max(int(math.ceil((start - half) / interval)), 0)
+		while True:
+			centre = int(round(beat * interval))
+			clickStart = centre - half
+			if clickStart >= start + count:
+				break
+			
+			if beat % beatsPerBar == 0:
+				click = self.accentClick
+			else:
+				click = self.click
+			
+			first = max(clickStart, start)
+			last = min(clickStart + len(click), start + count)
+			if first < last:
+				samples[first - start:last - start] = click[first - clickStart:last - clickStart]
+			beat += 1
+		
+		return samples.tostring()
+	
+	#_____________________________________________________________________
+	
+	def __MakeClick(self, frequency):
+		"""
+		Parameters:
+			frequency -- the pitch of the click in Hz.
+		
+		Returns:
+			an array of the samples of a triangle wave which fades in for
+			CLICK_LENGTH seconds and then out again, with the beat in the middle.
+		"""
+		half = int(CLICK_LENGTH * RATE)
+		click = array("f")
+		for i in xrange(-half, half + 1):
+			phase = (i * frequency / RATE) % 1.0
+			wave = 4 * abs(phase - 0.5) - 1
+			click.append(wave * (1 - abs(i) / float(half)))
+		return click
+	
+	#_____________________________________________________________________
+
+#=========================================================================
+
+def IsAvailable():
+	"""
+	Returns:
+		True if the appsrc element needed by the ClickGenerator is installed.
+	"""
+	return gst.element_factory_find("appsrc") is not None
+
+#_____________________________________________________________________
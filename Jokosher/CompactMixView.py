@@ -9,7 +9,7 @@
 #-------------------------------------------------------------------------------
 
 import gtk
-import gobject
+import FrameClock
 import RecordingView
 from MixerStrip import *
 from MasterMixerStrip import *
@@ -68,6 +68,8 @@ class CompactMixView(gtk.Frame):
 		self.project.connect("instrument::added", self.OnInstrumentAdded)
 		self.project.connect("instrument::reordered", self.OnInstrumentReordered)
 		self.project.connect("instrument::removed", self.OnInstrumentRemoved)
+		self.connect("map", self.UpdateMetering)
+		self.connect("unmap", self.UpdateMetering)
 		
 		#initialize the instrument widgets
 		for instr in self.project.instruments:
@@ -155,6 +157,8 @@ class CompactMixView(gtk.Frame):
 		elif not minimisedInstrs and self.instrumentBar.parent:
 			self.vbox.remove(self.instrumentBar)
 		
+		self.UpdateMetering()
+		
 	#_____________________________________________________________________
 	
 	def OnInstrumentAdded(self, project, instrument):
@@ -236,6 +240,29 @@ class CompactMixView(gtk.Frame):
 		
 	#_____________________________________________________________________
 	
+	def UpdateMetering(self, *args):
+		"""
+		Sets how often the level elements report their levels. While this
+		view is shown, they report them as often as the VU meters are
+		redrawn. The levels of instruments which are minimised, or of all
+		of them when this view is hidden, aren't reported at all.
+		
+		Parameters:
+			args -- reserved for GTK callbacks, don't use it explicitly.
+		"""
+		rate = 0
+		if self.flags() & gtk.MAPPED:
+			rate = self.FPS
+		
+		self.project.SetMeteringRate(self.project.levelElement, rate)
+		for instr in self.project.instruments:
+			if instr.isVisible:
+				self.project.SetMeteringRate(instr.levelElement, rate)
+			else:
+				self.project.SetMeteringRate(instr.levelElement, 0)
+	
+	#_____________________________________________________________________
+	
 	def OnUpdateTimeout(self):
 		"""
 		Called at intervals (self.FPS) to update the VU meters.
@@ -245,11 +272,11 @@ class CompactMixView(gtk.Frame):
 			False -- stops the timeout when playback stops.
 		"""
 		if self.mainview.isPlaying:
-			self.mastermixer.vu.queue_draw()
+			self.mastermixer.vu.UpdateLevel()
 			
-			# redraw VU widgets for each instrument
+			# redraw VU widgets for each instrument whose level has changed
 			for mix in self.mixerStripList:
-				mix.vu.queue_draw()
+				mix.vu.UpdateLevel()
 			
 			return True
 		else:
@@ -265,7 +292,7 @@ class CompactMixView(gtk.Frame):
 		when the play button is pressed.
 		"""
 		if not self.UpdateTimeout:
-			gobject.timeout_add(int(1000 / self.FPS), self.OnUpdateTimeout, priority = gobject.PRIORITY_LOW)
+			FrameClock.clock.Subscribe(self.OnUpdateTimeout, self.FPS)
 			self.UpdateTimeout = True
 	
 #=========================================================================
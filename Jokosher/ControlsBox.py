@@ -246,4 +246,16 @@ class ControlsBox(gtk.HBox):
 		self.effectsDialog = None
 		
 	#______________________________________________________________________
+	
+	def Destroy(self):
+		"""
+		Called when the ControlsBox is closed.
+		Disconnects it from the instrument's signals.
+		"""
+		self.instrument.disconnect_by_func(self.OnInstrumentSolo)
+		self.instrument.disconnect_by_func(self.OnInstrumentArm)
+		self.instrument.disconnect_by_func(self.OnInstrumentMute)
+		self.destroy()
+		
+	#______________________________________________________________________
 #=========================================================================
@@ -17,12 +17,13 @@ import os, sys, os.path
 import pygst
 pygst.require("0.10")
 import gst, gobject
-import Utils, LevelsList
+import Utils, LevelsList, LevelAnalyzer, LevelsCache
 import UndoSystem, IncrementalSave
 import Globals
 import gettext
 import urllib
 import PlatformUtils
+import FrameClock
 
 from elements.singledecodebin import SingleDecodeBin
 _ = gettext.gettext
@@ -54,7 +55,6 @@ class Event(gobject.GObject):
 	""" The level sample interval in seconds """
 	LEVEL_INTERVAL = 0.1
 	LEVELS_FILE_EXTENSION = ".leveldata"
-	
 	#_____________________________________________________________________
 	
 	def __init__(self, instrument, file=None, id=None, filelabel=None):
@@ -70,7 +70,8 @@ class Event(gobject.GObject):
 		"""
 		gobject.GObject.__init__(self)
 		
-		self.id = instrument.project.GenerateUniqueID(id)  #check is id is already taken, then set it.
+		self.instrument = instrument	# The parent instrument
+		self.id = instrument.project.GenerateUniqueID(id, obj=self)  #check is id is already taken, then set it.
 		self.start = 0.0			# Time in seconds at which the event begins
 		self.duration = 0.0			# Duration in seconds of the event
 		# The file this event should play (without escaped characters)
@@ -100,7 +101,6 @@ class Event(gobject.GObject):
 		self.selection  = [0, 0]	# List start and end of selection (for fades, etc) measured in seconds 
 		self.levels_list = LevelsList.LevelsList()	# LevelsList class containing array of audio levels to be drawn for this event
 		
-		self.instrument = instrument	# The parent instrument
 		self.gnlsrc = None 			# The gstreamer gnlsource object.
 		self.single_decode_bin = None		# The gstreamer file decoder element.
 		
@@ -110,8 +110,12 @@ class Event(gobject.GObject):
 		self.isRecording = False		# True if the event is currently loading level data from a live recording
 		self.loadingLength = 0 		# The length of the file in seconds as its being rendered
 		self.lastEnd = 0 			# The last length of the loading file - used to minimise redraws
+		self.lengthTimeout = None	# The frame clock subscription which sends the loading length to the GUI
 		self.loadingPipeline = None	# The Gstreamer pipeline used to load the waveform
 		self.bus = None			# The bus to monitor messages on the loadingPipeline
+		self.levelAnalyzer = None	# The LevelAnalyzer reading the levels from the loadingPipeline
+		self.levelsWriter = None	# The LevelsWriter streaming levels_list to disk while loading or recording
+		self.cacheLookupID = 0		# Counts the LevelsCache lookups, so the result of a cancelled one is ignored
 		
 		self.CreateFilesource()
 
@@ -149,6 +153,34 @@ class Event(gobject.GObject):
 	
 	#_____________________________________________________________________
 	
+	def LoadLevelsFile(self):
+		"""
+		Maps this event's levels file if it was generated from the current
+		contents of the audio file, so that the waveform doesn't have to be
+		generated again when a project is opened.
+		
+		Returns:
+			True if the levels were loaded, False if GenerateWaveform()
+			has to be called instead.
+		"""
+		levels_path = self.GetAbsLevelsFile()
+		levels = LevelsList.LevelsList()
+		try:
+			levels.fromfile(levels_path, mapped=True)
+		except LevelsList.CorruptFileError:
+			Globals.debug("Cannot load levels from file", levels_path)
+			return False
+		
+		# without the audio file there is nothing to regenerate the levels from
+		if os.path.exists(self.GetAbsFile()) and not levels.IsValidFor(self.GetAbsFile()):
+			Globals.debug("Levels file", levels_path, "is out of date")
+			return False
+		
+		self.levels_list = levels
+		return bool(levels)
+	
+	#_____________________________________________________________________
+	
 	def CreateFilesource(self):	
 		"""
 		Creates a new GStreamer file source with an unique id.
@@ -260,6 +292,78 @@ class Event(gobject.GObject):
 		
 	#_____________________________________________________________________
 	
+	def __GetStart(self):
+		"""
+		Returns:
+			the time in seconds at which this Event begins.
+		"""
+		return self.__start
+	
+	#_____________________________________________________________________
+	
+	def __SetStart(self, start):
+		"""
+		Sets the time at which this Event begins, and moves it
+		in the index of the Instrument's events.
+		
+		Parameters:
+			start -- the new start time in seconds.
+		"""
+		self.__start = start
+		self.instrument.events.Update(self)
+	
+	#_____________________________________________________________________
+	
+	def __GetDuration(self):
+		"""
+		Returns:
+			the duration in seconds of this Event.
+		"""
+		return self.__duration
+	
+	#_____________________________________________________________________
+	
+	def __SetDuration(self, duration):
+		"""
+		Sets the duration of this Event, and updates it
+		in the index of the Instrument's events.
+		
+		Parameters:
+			duration -- the new duration in seconds.
+		"""
+		self.__duration = duration
+		self.instrument.events.Update(self)
+	
+	#_____________________________________________________________________
+	
+	def __GetLoadingLength(self):
+		"""
+		Returns:
+			the length in seconds of the file as it is being rendered.
+		"""
+		return self.__loadingLength
+	
+	#_____________________________________________________________________
+	
+	def __SetLoadingLength(self, loadingLength):
+		"""
+		Sets the length of the file as it is being rendered, and updates
+		where the Instrument's last event ends.
+		
+		Parameters:
+			loadingLength -- the new loading length in seconds.
+		"""
+		self.__loadingLength = loadingLength
+		self.instrument.events.UpdateEnd(self)
+	
+	#_____________________________________________________________________
+	
+	start = property(__GetStart, __SetStart)
+	duration = property(__GetDuration, __SetDuration)
+	loadingLength = property(__GetLoadingLength, __SetLoadingLength)
+	
+	#_____________________________________________________________________
+	
 	def __cmp__(self, object):
 		"""
 		Compares two Events for equality.
@@ -499,9 +603,9 @@ class Event(gobject.GObject):
 			self.start = joinEvent.start
 			self.offset = joinEvent.offset
 			
-			old_duration = int(self.duration * 1000)
+			# the joined event comes first, so our levels start where its end
+			self.levels_list = LevelsList.add(joinEvent.levels_list, self.levels_list, int(joinEvent.duration * 1000))
 			self.duration += joinEvent.duration
-			self.levels_list = LevelsList.add(old_duration, joinEvent.levels_list, self.levels_list)
 			
 			newDict = joinEvent.__fadePointsDict.copy()
 			for key, value in self.__fadePointsDict.iteritems():
@@ -651,14 +755,13 @@ class Event(gobject.GObject):
 
 		elif st.get_name() == "level":
 			self.__AppendLevelToList(st)
+			if self.levelsWriter:
+				self.levelsWriter.Flush()
 			
 			#Truncate so it updates once per second
 			self.loadingLength = st["endtime"] / gst.SECOND
 			
-			# Only send events every second processed to reduce GUI load
-			if self.loadingLength != self.lastEnd:
-				self.lastEnd = self.loadingLength 
-				self.emit("length") # tell the GUI
+			self.__QueueLengthUpdate()
 		return True
 		
 	#_____________________________________________________________________
@@ -678,39 +781,56 @@ class Event(gobject.GObject):
 			False -- stops the signal propagation. *CHECK*
 		"""
 		if message.type == gst.MESSAGE_EOS:
+			self.__FinishLoading()
+			return False
 			
-			# Update levels for partial events
+	#_____________________________________________________________________
+	
+	def __FinishLoading(self, length=None):
+		"""
+		Finalises the rendering once all the levels of the file have been
+		read, either from the level element, the LevelAnalyzer or the LevelsCache.
+		
+		Parameters:
+			length -- the length of the whole file in seconds, or None
+					to get it from the loading pipeline.
+		"""
+		if length is None:
 			q = self.loadingPipeline.query_duration(gst.FORMAT_TIME)
 			length = float(q[0] / float(gst.SECOND))
 			
-			#we're at EOS, and still have no value for duration
-			if not self.duration:
-				if length:
-					self.duration = length
-				else:
-					self.duration = self.loadingLength
-			
-			if self.levels_list:
-				final_endtime = self.levels_list[-1][0]
-				if final_endtime > int(self.duration * 1000):
-					Globals.debug("Event %d: duration (%f) is less than last level endtime (%d)."
-					              % (self.id, self.duration, final_endtime))
-					self.duration = final_endtime / 1000.0
-					self.SetProperties()
-					Globals.debug("\tduration has been increased to", self.duration)
-			
-			if length and (self.offset > 0 or self.duration != length):
-				starttime = int(self.offset * 1000)
-				stoptime = int((self.offset + self.duration) * 1000)
-				self.levels_list = self.levels_list.slice_by_endtime(starttime, stoptime)
-				
-			# We're done with the bin so release it
-			self.StopGenerateWaveform()
-			
-			# Signal to interested objects that we've changed
-			self.emit("waveform")
-			return False
+			# the file may still be growing while it is downloaded
+			if not self.isDownloading:
+				LevelsCache.Store(self.GetAbsFile(), self.levels_list)
+		
+		#we're at EOS, and still have no value for duration
+		if not self.duration:
+			if length:
+				self.duration = length
+			else:
+				self.duration = self.loadingLength
+		
+		if self.levels_list:
+			final_endtime = self.levels_list[-1][0]
+			if final_endtime > int(self.duration * 1000):
+				Globals.debug("Event %d: duration (%f) is less than last level endtime (%d)."
+				              % (self.id, self.duration, final_endtime))
+				self.duration = final_endtime / 1000.0
+				self.SetProperties()
+				Globals.debug("\tduration has been increased to", self.duration)
+		
+		# Update levels for partial events
+		if length and (self.offset > 0 or self.duration != length):
+			starttime = int(self.offset * 1000)
+			stoptime = int((self.offset + self.duration) * 1000)
+			self.levels_list = self.levels_list.slice_by_endtime(starttime, stoptime)
 			
+		# We're done with the bin so release it
+		self.StopGenerateWaveform()
+		
+		# Signal to interested objects that we've changed
+		self.emit("waveform")
+		
 	#_____________________________________________________________________
 
 	def bus_message_statechange(self, bus, message):
@@ -785,30 +905,123 @@ class Event(gobject.GObject):
 	
 	def GenerateWaveform(self):
 		"""
-		Renders the level information for the GUI.
+		Renders the level information for the GUI. The pipeline is
+		started by the project's WaveformScheduler when it has a free slot.
 		"""
-		pipe = """filesrc name=src ! decodebin ! audioconvert ! level message=true name=level_element ! fakesink"""
-		self.loadingPipeline = gst.parse_launch(pipe)
+		self.__StopWritingLevels()
+		self.levels_list = LevelsList.LevelsList()
+		self.isLoading = True
+		self.emit("loading")
 		
-		filesrc = self.loadingPipeline.get_by_name("src")
-		level = self.loadingPipeline.get_by_name("level_element")
+		levels = LevelsCache.Lookup(self.GetAbsFile())
+		if levels:
+			self.__LoadCachedLevels(levels)
+		else:
+			self.instrument.project.waveformScheduler.Schedule(self, self.__StartGenerateWaveform)
+	
+	#_____________________________________________________________________
+	
+	def __LoadCachedLevels(self, levels):
+		"""
+		Uses the levels of this event's audio file from the LevelsCache
+		instead of decoding the file again.
 		
+		Parameters:
+			levels -- LevelsList holding the levels of the whole file.
+		"""
+		length = levels[-1][0] / 1000.0
+		if not self.duration:
+			self.duration = length
+			
+			#update position with proper duration
+			self.MoveButDoNotOverlap(self.start)
+			self.SetProperties()
+			self.emit("length")
+			self.emit("position")
+		
+		self.levels_list = levels
+		self.__FinishLoading(length)
+	
+	#_____________________________________________________________________
+	
+	def __StartGenerateWaveform(self):
+		"""
+		Starts the pipeline which reads the level information of this
+		event's audio file. If the file hasn't been hashed yet, it is
+		hashed in the background first, in case the LevelsCache has its
+		levels after all.
+		"""
+		if not self.levelAnalyzer and LevelsCache.NeedsDigest(self.GetAbsFile()):
+			self.cacheLookupID += 1
+			LevelsCache.LookupInBackground(self.GetAbsFile(), self.__OnCacheLookup, self.cacheLookupID)
+			return
+		
+		self.__StartDecoding()
+	
+	#_____________________________________________________________________
+	
+	def __OnCacheLookup(self, levels, lookupID):
+		"""
+		Callback function for when the LevelsCache has looked up the
+		levels of this event's audio file in the background.
+		
+		Parameters:
+			levels -- LevelsList of the whole file, or None if it isn't cached.
+			lookupID -- the value of cacheLookupID when the lookup was started.
+		"""
+		# the loading has been cancelled or restarted since
+		if lookupID != self.cacheLookupID or not self.isLoading:
+			return
+		
+		if levels:
+			self.__LoadCachedLevels(levels)
+		else:
+			self.__StartDecoding()
+	
+	#_____________________________________________________________________
+	
+	def __StartDecoding(self):
+		"""
+		Starts the pipeline which decodes this event's audio file
+		and reads its level information.
+		"""
+		if self.levelAnalyzer:
+			# the pipeline is being restarted, e.g. after installing a missing plugin
+			self.levelAnalyzer.Stop()
+			self.levelAnalyzer = None
+		
+		if LevelAnalyzer.IsAvailable():
+			# read the samples in bulk instead of getting a bus message for every interval
+			pipe = """filesrc name=src ! decodebin ! audioconvert ! %s ! appsink name=sink sync=false max-buffers=16"""
+			self.loadingPipeline = gst.parse_launch(pipe % LevelAnalyzer.CAPS)
+			
+			sink = self.loadingPipeline.get_by_name("sink")
+			self.levelAnalyzer = LevelAnalyzer.LevelAnalyzer(sink, self.LEVEL_INTERVAL,
+					self.__AppendLevelChunk, self.__FinishLoading)
+		else:
+			pipe = """filesrc name=src ! decodebin ! audioconvert ! level message=true name=level_element ! fakesink"""
+			self.loadingPipeline = gst.parse_launch(pipe)
+			
+			level = self.loadingPipeline.get_by_name("level_element")
+			level.set_property("interval", int(self.LEVEL_INTERVAL * gst.SECOND))
+		
+		filesrc = self.loadingPipeline.get_by_name("src")
 		filesrc.set_property("location", self.GetAbsFile())
-		level.set_property("interval", int(self.LEVEL_INTERVAL * gst.SECOND))
 
 		self.bus = self.loadingPipeline.get_bus()
 		self.bus.add_signal_watch()
+		# the missing plugin messages are element messages too
 		self.bus.connect("message::element", self.bus_message)
 		self.bus.connect("message::tag", self.bus_message_tags)
 		self.bus.connect("message::state-changed", self.bus_message_statechange)
-		self.bus.connect("message::eos", self.bus_eos)
+		if not self.levelAnalyzer:
+			self.bus.connect("message::eos", self.bus_eos)
 		self.bus.connect("message::error", self.bus_error)
 
-		self.levels_list = LevelsList.LevelsList()
-		self.isLoading = True
-		self.emit("loading")
-
+		self.__StartWritingLevels(LevelsList.PartialPath(self.GetAbsLevelsFile()))
 		self.loadingPipeline.set_state(gst.STATE_PLAYING)
+		if self.levelAnalyzer:
+			self.levelAnalyzer.Start()
 
 	#_____________________________________________________________________
 	
@@ -823,6 +1036,21 @@ class Event(gobject.GObject):
 			#This means that here is no gstreamer src element on the system that can handle this URI type.
 			return False
 		
+		self.levels_list = LevelsList.LevelsList()
+		self.isLoading = True
+		self.emit("loading")
+		
+		start = lambda: self.__StartCopyAndGenerateWaveform(urisrc)
+		self.instrument.project.waveformScheduler.Schedule(self, start)
+		return True
+	
+	#_____________________________________________________________________
+	
+	def __StartCopyAndGenerateWaveform(self, urisrc):
+		"""
+		Starts the pipeline which copies the audio file from urisrc
+		and reads its level information.
+		"""
 		pipe = """tee name=mytee mytee. ! queue ! filesink name=sink """ +\
 		       """mytee. ! queue ! decodebin ! audioconvert ! level name=level_element message=true ! fakesink""" 
 		self.loadingPipeline = gst.parse_launch(pipe)
@@ -845,14 +1073,9 @@ class Event(gobject.GObject):
 		self.bus.connect("message::eos", self.bus_eos)
 		self.bus.connect("message::error", self.bus_error)
 
-		self.levels_list = LevelsList.LevelsList()
-		self.isLoading = True
-		self.emit("loading")
-
+		self.__StartWritingLevels(LevelsList.PartialPath(self.GetAbsLevelsFile()))
 		self.loadingPipeline.set_state(gst.STATE_PLAYING)
 		
-		return True
-		
 	#_____________________________________________________________________
 	
 	def StopGenerateWaveform(self, finishedLoading=True):
@@ -863,14 +1086,31 @@ class Event(gobject.GObject):
 			finishedLoading -- True if the event has finished loading the waveform,
 					False if the loading is being cancelled.
 		"""
+		# ignore any cache lookup which is still running
+		self.cacheLookupID += 1
 		if self.bus:
 			self.bus.remove_signal_watch()
 			self.bus = None
-		if self.loadingPipeline:
-			self.loadingPipeline.set_state(gst.STATE_NULL)
+		if self.levelAnalyzer:
+			# setting the pipeline to NULL below lets the analyzer's thread finish
+			self.levelAnalyzer.Stop()
+			self.levelAnalyzer = None
+		# cached levels finish loading without a pipeline
+		if self.loadingPipeline or (finishedLoading and self.isLoading):
+			if self.loadingPipeline:
+				self.loadingPipeline.set_state(gst.STATE_NULL)
 			
 			if finishedLoading and self.levels_list:
+				self.levels_list.source = LevelsList.FileFingerprint(self.GetAbsFile())
 				self.levels_list.tofile(self.GetAbsLevelsFile())
+				if self.levelsWriter:
+					# map the saved file instead of the partial one, which is removed below
+					levels = LevelsList.LevelsList()
+					try:
+						levels.fromfile(self.GetAbsLevelsFile(), mapped=True)
+						self.levels_list = levels
+					except LevelsList.CorruptFileError:
+						Globals.debug("Cannot load levels from file", self.GetAbsLevelsFile())
 				del_on_close_list = self.instrument.project.deleteOnCloseAudioFiles
 				# this event might not be in the project file yet
 				# if so, levels_file should be deleted when audio file is deleted on exit
@@ -892,6 +1132,10 @@ class Event(gobject.GObject):
 			self.loadingPipeline = None
 			self.loadingLength = 0
 			self.emit("loading")
+		
+		self.__StopWritingLevels()
+		# free the slot for the next waveform, or stop waiting for one
+		self.instrument.project.waveformScheduler.Done(self)
 	
 	#_____________________________________________________________________
 
@@ -915,19 +1159,95 @@ class Event(gobject.GObject):
 		st = message.structure
 		if st and message.src.get_name() == "recordlevel":
 			self.__AppendLevelToList(st)
+			if not self.levelsWriter:
+				# an interrupted recording keeps the levels written to its levels file
+				self.__StartWritingLevels(self.GetAbsLevelsFile())
+			self.levelsWriter.Flush()
 			
 			end = st["endtime"] / float(gst.SECOND)  #convert to float representing seconds 
 			#Round to one decimal place so it updates 10 times per second
 			self.loadingLength = round(end, 1)
 			
-			# Only send events every second processed to reduce GUI load
-			if self.loadingLength != self.lastEnd:
-				self.lastEnd = self.loadingLength 
-				self.emit("length") # tell the GUI
+			self.__QueueLengthUpdate()
 		return True
 		
 	#_____________________________________________________________________
 	
+	def __AppendLevelChunk(self, chunk):
+		"""
+		Adds the levels calculated by the LevelAnalyzer to the levels list
+		and reports on how the loading progress is going.
+		
+		Parameters:
+			chunk -- list of (endtime, levels) tuples, in milliseconds.
+		"""
+		if not self.isLoading or not chunk:
+			return
+		
+		for end, peaks in chunk:
+			self.levels_list.append(end, peaks)
+		self.levelsWriter.Flush()
+		
+		#Truncate so it updates once per second
+		self.loadingLength = chunk[-1][0] / 1000
+		
+		self.__QueueLengthUpdate()
+		
+	#_____________________________________________________________________
+	
+	def __QueueLengthUpdate(self):
+		"""
+		Tells the GUI that the loading length has changed, but no more than
+		once per frame of the frame clock. The levels of many seconds can
+		arrive between frames when decoding faster than realtime, and each
+		"length" signal makes the GUI draw the event again.
+		"""
+		if self.lengthTimeout is None:
+			self.lengthTimeout = FrameClock.clock.Subscribe(self.__SendLengthUpdate)
+	
+	#_____________________________________________________________________
+	
+	def __SendLengthUpdate(self):
+		"""
+		Emits the "length" signal if the loading length has changed since it was last sent.
+		
+		Returns:
+			False -- unsubscribes from the frame clock.
+		"""
+		self.lengthTimeout = None
+		# Only send events every second processed to reduce GUI load
+		if (self.isLoading or self.isRecording) and self.loadingLength != self.lastEnd:
+			self.lastEnd = self.loadingLength 
+			self.emit("length") # tell the GUI
+		return False
+		
+	#_____________________________________________________________________
+	
+	def __StartWritingLevels(self, path):
+		"""
+		Streams the levels in levels_list to a file as they are appended,
+		so that they don't all have to be kept in memory.
+		
+		Parameters:
+			path -- the file to write the levels to.
+		"""
+		self.__StopWritingLevels()
+		self.levelsWriter = LevelsList.LevelsWriter(self.levels_list, path)
+	
+	#_____________________________________________________________________
+	
+	def __StopWritingLevels(self):
+		"""
+		Stops streaming levels to a file. The levels written while recording
+		are kept as the event's levels file until the recorded file has been
+		loaded, while a partial file of generated levels is removed.
+		"""
+		if self.levelsWriter:
+			self.levelsWriter.Close(remove=(self.levelsWriter.path != self.GetAbsLevelsFile()))
+			self.levelsWriter = None
+	
+	#_____________________________________________________________________
+	
 	def __AppendLevelToList(self, structure):
 		(end, peaks) = Utils.CalculateAudioLevelFromStructure(structure)
 		
@@ -974,12 +1294,7 @@ class Event(gobject.GObject):
 		Returns:
 			True if it's OK to place the Event at xpos, False if not.
 		"""
-		for e in self.instrument.events:
-			if e is self:
-				continue
-			if not (e.start + e.duration <= xpos or e.start >= xpos + self.duration):
-				return False
-		return True
+		return self.instrument.events.MayPlace(self, xpos)
 		
 	#_____________________________________________________________________
 	
@@ -992,41 +1307,7 @@ class Event(gobject.GObject):
 		Parameters:
 			xpos -- the potential position to move the Event to.
 		"""
-		alreadyTriedRemovingOverlap = False
-		self.instrument.events.sort()
-		
-		for e in self.instrument.events:
-			if e is self:
-				continue
-			
-			elif alreadyTriedRemovingOverlap:
-				#we have already attempted to place to the left, on the last iteration
-				#from now on we only try placing on the right side
-				start = e.start + e.duration
-				if self.MayPlace(start):
-					self.start = start
-					return
-				continue
-			
-			rightPos = e.start + e.duration
-			leftPos = e.start - self.duration
-			#if this event IS overlapping with the other event
-			if not (rightPos <= xpos or leftPos >= xpos):
-				#if the middle of this event is on the RIGHT of the middle of the other event
-				if rightPos > xpos and e.start + (e.duration/2) < xpos + (self.duration/2):
-					order = (rightPos, max(leftPos, 0))
-				else: #if the middle is on the LEFT
-					order = (max(leftPos, 0), rightPos)
-				
-				for start in order:
-					if self.MayPlace(start):
-						self.start = start
-						return
-				
-				alreadyTriedRemovingOverlap = True
-				
-		#There are no other events overlapping with this one
-		self.start = xpos
+		self.start = self.instrument.events.FindFreeStart(self, xpos)
 	
 	#_____________________________________________________________________
 	
@@ -1136,6 +1417,7 @@ class Event(gobject.GObject):
 				self.audioFadePoints.append(last)
 			
 		self.__UpdateFadeLevels()
+		self.instrument.InvalidateController()
 		self.emit("waveform")
 	
 	#_____________________________________________________________________
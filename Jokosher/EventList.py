@@ -0,0 +1,364 @@
+#
+#	THIS FILE IS PART OF THE JOKOSHER PROJECT AND LICENSED UNDER THE GPL. SEE
+#	THE 'COPYING' FILE FOR DETAILS
+#
+#	EventList.py
+#
+#	This module contains the list which holds the events of an instrument.
+#	Besides the events in the order they were added, it keeps them sorted
+#	by their start time, so that the events overlapping a stretch of time
+#	can be found with a binary search instead of checking every event. It
+#	also keeps track of where the last of the events ends.
+#
+#-------------------------------------------------------------------------------
+
+import bisect
+
+#=========================================================================
+
+class EventList(list):
+	"""
+	A list of the Events of an Instrument, which keeps an index of them
+	sorted by start time. Events are only added and removed with append(),
+	insert(), extend() and remove(). Every Event tells the EventList of its
+	Instrument when its start or duration changes, by calling Update(), and
+	when its loading length changes, by calling UpdateEnd().
+	"""
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, endCallback=None, changeCallback=None, events=()):
+		"""
+		Creates a new instance of EventList.
+		
+		Parameters:
+			endCallback -- function called with no parameters when the
+					time at which the last Event ends may have changed.
+			changeCallback -- function called with no parameters when an
+					Event has been added, removed, moved or resized.
+			events -- the Events to start with.
+		"""
+		list.__init__(self)
+		self.endCallback = endCallback
+		self.changeCallback = changeCallback
+		self.keys = []			#(start, id) of each indexed Event, sorted in the same order as Event.__cmp__
+		self.sortedEvents = []	#the Events in the same order as keys
+		self.indexed = {}		#Event id -> (key, duration) the Event is indexed under
+		self.durations = []		#the duration of every indexed Event, sorted, so the longest is known after removing one
+		self.ends = {}			#Event id -> the time in seconds at which the Event ends
+		self.end = 0.0			#the time at which the last Event ends, if endIsValid is True
+		self.endIsValid = True	#False if the last Event has become shorter or been removed
+		self.extend(events)
+	
+	#_____________________________________________________________________
+	
+	def append(self, event):
+		"""
+		Adds an Event to the end of the list.
+		
+		Parameters:
+			event -- the Event to add.
+		"""
+		list.append(self, event)
+		self.__Index(event)
+		self.__SetEnd(event, event.start + max(event.duration, event.loadingLength))
+		self.__Changed()
+	
+	#_____________________________________________________________________
+	
+	def insert(self, position, event):
+		"""
+		Adds an Event at the given position in the list.
+		
+		Parameters:
+			position -- the position in the list.
+			event -- the Event to add.
+		"""
+		list.insert(self, position, event)
+		self.__Index(event)
+		self.__SetEnd(event, event.start + max(event.duration, event.loadingLength))
+		self.__Changed()
+	
+	#_____________________________________________________________________
+	
+	def extend(self, events):
+		"""
+		Adds several Events to the end of the list.
+		
+		Parameters:
+			events -- the Events to add.
+		"""
+		for event in events:
+			self.append(event)
+	
+	#_____________________________________________________________________
+	
+	def remove(self, event):
+		"""
+		Removes an Event from the list.
+		
+		Parameters:
+			event -- the Event to remove.
+		"""
+		list.remove(self, event)
+		self.__Unindex(event)
+		self.__SetEnd(event, None)
+		self.__Changed()
+	
+	#_____________________________________________________________________
+	
+	def Update(self, event):
+		"""
+		Moves an Event to its new place in the index after
+		its start or duration has changed.
+		
+		Parameters:
+			event -- the Event which has changed. It is ignored
+					if it isn't in the list, such as a deleted Event.
+		"""
+		if event.id not in self.indexed:
+			return
+		
+		if self.indexed[event.id] != ((event.start, event.id), event.duration):
+			self.__Unindex(event)
+			self.__Index(event)
+		self.__SetEnd(event, event.start + max(event.duration, event.loadingLength))
+		self.__Changed()
+	
+	#_____________________________________________________________________
+	
+	def UpdateEnd(self, event):
+		"""
+		Updates where an Event ends after its loading length has changed.
+		The change callback isn't called, because the loading length
+		changes with every level read while the Event loads or records,
+		and nothing but the end depends on it.
+		
+		Parameters:
+			event -- the Event which has changed. It is ignored
+					if it isn't in the list, such as a deleted Event.
+		"""
+		if event.id in self.indexed:
+			self.__SetEnd(event, event.start + max(event.duration, event.loadingLength))
+	
+	#_____________________________________________________________________
+	
+	def GetEnd(self):
+		"""
+		Returns:
+			the time in seconds at which the last Event ends,
+			or 0 if there are no Events.
+		"""
+		if not self.endIsValid:
+			self.end = max(self.ends.values() or [0.0])
+			self.endIsValid = True
+		return self.end
+	
+	#_____________________________________________________________________
+	
+	def GetOverlapping(self, start, stop, exclude=None):
+		"""
+		Finds the Events which overlap a stretch of time.
+		
+		Parameters:
+			start -- the beginning of the stretch in seconds.
+			stop -- the end of the stretch in seconds.
+			exclude -- an Event to leave out, such as the one being placed.
+		
+		Returns:
+			a list of the Events which start before stop and end after
+			start, sorted by their start time.
+		"""
+		overlapping = []
+		# no Event is longer than this, so earlier ones cannot reach start
+		maxDuration = self.durations and self.durations[-1] or 0.0
+		# the Events starting at or after stop cannot overlap
+		index = bisect.bisect_left(self.keys, (stop,)) - 1
+		while index >= 0:
+			eventStart = self.keys[index][0]
+			if eventStart + maxDuration <= start:
+				# none of the earlier Events are long enough to reach start
+				break
+			
+			event = self.sortedEvents[index]
+			if event is not exclude and eventStart + event.duration > start:
+				overlapping.append(event)
+			index -= 1
+		
+		overlapping.reverse()
+		return overlapping
+	
+	#_____________________________________________________________________
+	
+	def MayPlace(self, event, start):
+		"""
+		Checks if an Event could start at the given time without
+		overlapping any of the other Events in the list.
+		
+		Parameters:
+			event -- the Event to place.
+			start -- the potential start time in seconds.
+		
+		Returns:
+			True if it's OK to place the Event at start, False if not.
+		"""
+		return not self.GetOverlapping(start, start + event.duration, event)
+	
+	#_____________________________________________________________________
+	
+	def FindFreeStart(self, event, start):
+		"""
+		Finds where an Event should go when it is moved to the given time.
+		If it would overlap another Event there, it is put flush against
+		the closest side of the first Event in the way. If neither side has
+		enough room, it is put at the end of the first following Event
+		which has enough room after it, found by walking the gaps between
+		the following Events in order.
+		
+		Parameters:
+			event -- the Event to place.
+			start -- the start time in seconds the Event is moved to.
+		
+		Returns:
+			the start time in seconds to place the Event at.
+		"""
+		overlapping = self.GetOverlapping(start, start + event.duration, event)
+		if not overlapping:
+			return start
+		
+		other = overlapping[0]
+		rightPos = other.start + other.duration
+		leftPos = other.start - event.duration
+		#if the middle of the Event is on the RIGHT of the middle of the other Event
+		if rightPos > start and other.start + (other.duration/2) < start + (event.duration/2):
+			order = (rightPos, max(leftPos, 0))
+		else:
+			order = (max(leftPos, 0), rightPos)
+		
+		for pos in order:
+			if self.MayPlace(event, pos):
+				return pos
+		
+		# The Events before other end before start, so the furthest any Event
+		# up to the current one reaches is known without looking back.
+		reach = rightPos
+		index = bisect.bisect_right(self.keys, self.indexed[other.id][0])
+		while index < len(self.sortedEvents):
+			other = self.sortedEvents[index]
+			index += 1
+			if other is event:
+				continue
+			pos = other.start + other.duration
+			if pos < reach:
+				# an earlier Event reaches past the end of this one
+				continue
+			reach = pos
+			if self.__FitsAt(event, pos, index):
+				return pos
+		
+		#there is no room anywhere, so the Event is left overlapping
+		return start
+	
+	#_____________________________________________________________________
+	
+	def __FitsAt(self, event, pos, index):
+		"""
+		Checks if an Event would fit in the gap which starts at pos,
+		after none of the Events before index reach past pos.
+		
+		Parameters:
+			event -- the Event to place.
+			pos -- the potential start time in seconds.
+			index -- the position in sortedEvents of the first Event
+					which starts at or after the beginning of the gap.
+		
+		Returns:
+			True if none of the following Events overlap the Event at pos.
+		"""
+		stop = pos + event.duration
+		while index < len(self.sortedEvents):
+			other = self.sortedEvents[index]
+			index += 1
+			if other.start >= stop:
+				break
+			if other is not event and other.start + other.duration > pos:
+				return False
+		return True
+	
+	#_____________________________________________________________________
+	
+	def __Index(self, event):
+		"""
+		Adds an Event to the index.
+		
+		Parameters:
+			event -- the Event to add.
+		"""
+		key = (event.start, event.id)
+		index = bisect.bisect_left(self.keys, key)
+		self.keys.insert(index, key)
+		self.sortedEvents.insert(index, event)
+		self.indexed[event.id] = (key, event.duration)
+		bisect.insort(self.durations, event.duration)
+	
+	#_____________________________________________________________________
+	
+	def __Unindex(self, event):
+		"""
+		Removes an Event from the index.
+		
+		Parameters:
+			event -- the Event to remove.
+		"""
+		entry = self.indexed.pop(event.id, None)
+		if entry is None:
+			return
+		
+		key, duration = entry
+		index = bisect.bisect_left(self.keys, key)
+		del self.keys[index]
+		del self.sortedEvents[index]
+		del self.durations[bisect.bisect_left(self.durations, duration)]
+	
+	#_____________________________________________________________________
+	
+	def __Changed(self):
+		"""
+		Calls the change callback, if there is one.
+		"""
+		if self.changeCallback:
+			self.changeCallback()
+	
+	#_____________________________________________________________________
+	
+	def __SetEnd(self, event, end):
+		"""
+		Records where an Event ends, keeping track of the last end
+		without looking at the other Events when possible.
+		
+		Parameters:
+			event -- the Event.
+			end -- the time in seconds at which the Event ends,
+					or None if it has been removed.
+		"""
+		oldEnd = self.ends.pop(event.id, None)
+		if end is not None:
+			self.ends[event.id] = end
+		if end == oldEnd:
+			return
+		
+		if self.endIsValid:
+			if end is not None and end >= self.end:
+				self.end = end
+			elif oldEnd is not None and oldEnd >= self.end:
+				# the last Event got shorter, so another one may be last now
+				self.endIsValid = False
+			else:
+				return
+		
+		if self.endCallback:
+			self.endCallback()
+	
+	#_____________________________________________________________________
+
+#=========================================================================
@@ -12,14 +12,14 @@
 #-------------------------------------------------------------------------------
 
 import gtk
+import gobject
 import cairo
 from Project import Project
-import Utils
-import os, sys
+import Utils, LevelsList, WaveformCache
+import os
 import gettext
 _ = gettext.gettext
 import Globals
-import itertools
 
 #=========================================================================
 
@@ -39,6 +39,14 @@ class EventViewer(gtk.DrawingArea):
 	#making this bigger will make the waveform less crowed but also less detailed
 	_MIN_POINT_SEPARATION = 2
 	
+	#the number of pixels either side of a tile which are included in its waveform
+	#path, so that the line joins up with the one in the tile next to it
+	_TILE_MARGIN = 16
+	
+	#the number of milliseconds the zoom level must stay the same before the
+	#waveform is drawn at the new scale. Until then the old tiles are stretched.
+	_ZOOM_SETTLE_TIME = 150
+	
 	#the width and height of the volume curve handles
 	_PIXX_FADEMARKER_WIDTH = 30
 	_PIXY_FADEMARKER_HEIGHT = 11
@@ -61,6 +69,7 @@ class EventViewer(gtk.DrawingArea):
 	_PLAY_POSITION_RGB = (1, 0, 0)
 	_HIGHLIGHT_POSITION_RGB = (0, 0, 1)
 	_FADELINE_RGB = (1, 0.6, 0.6)
+	_ENVELOPE_RGBA = (32./255, 74./255, 135./255, 0.35)
 	
 	#_____________________________________________________________________
 
@@ -106,7 +115,11 @@ class EventViewer(gtk.DrawingArea):
 		self.isDraggingFade = False		# True if the user is dragging a fade marker
 		self.lane = lane				# The parent lane for this object
 		self.currentScale = 0			# Tracks if the project viewScale has changed
-		self.redrawWaveform = False		# Force redraw the cached waveform on next expose event
+		self.waveformVersion = WaveformCache.cache.NewVersion()	# Identifies the tiles drawn for the current waveform
+		self.drawnVersions = {}			# The newest waveform version drawn for each tile, shown until the current one is ready
+		self.waveformEnd = 0			# The end in milliseconds of the levels when the current waveform version was made
+		self.fallbackScale = None		# The zoom level whose tiles are stretched while the ones at the current zoom level are drawn
+		self.zoomTimeout = None			# The timeout which draws the waveform once the zoom level stops changing
 		#boolean; if the drawer should be at the left of current selection
 		#otherwise it will be put on the right
 		self.drawerAlignToLeft = True		
@@ -117,14 +130,6 @@ class EventViewer(gtk.DrawingArea):
 		self.SetAccessibleName()
 		self.set_property("can-focus", True)
 		
-		# sourceSmall/Large are offscreen canvases to hold our waveform images
-		self.sourceSmall = cairo.ImageSurface(cairo.FORMAT_ARGB32, 0, 0)
-		self.sourceLarge = cairo.ImageSurface(cairo.FORMAT_ARGB32, 0, 0)
-		
-		# rectangle of cached draw areas
-		self.cachedDrawAreaSmall = gtk.gdk.Rectangle(0, 0, 0, 0)
-		self.cachedDrawAreaLarge = gtk.gdk.Rectangle(0, 0, 0, 0)
-
 		# Monitor the things this object cares about
 		self.project.connect("zoom", self.OnProjectZoom)
 		self.event.connect("waveform", self.OnEventWaveform)
@@ -190,32 +195,28 @@ class EventViewer(gtk.DrawingArea):
 		Returns:
 			False -- stop propagating the GTK signal. *CHECK*
 		"""
-		if self.small:
-			cache = self.cachedDrawAreaSmall
-			source = self.sourceSmall
-		else:
-			cache = self.cachedDrawAreaLarge
-			source = self.sourceLarge
 		area = event.area
 		
-		#check if the expose area is within the already cached rectangle
-		if area.x < cache.x or (area.x + area.width > cache.x + cache.width) or self.redrawWaveform:
-			self.DrawWaveform(event.area)
-			if self.small:
-				cache = self.cachedDrawAreaSmall
-				source = self.sourceSmall
-			else:
-				cache = self.cachedDrawAreaLarge
-				source = self.sourceLarge
-		
 		# Get a cairo surface for this drawing op
 		context = widget.window.cairo_create()
-
-		# Give it our waveform image as a source
-		context.set_source_surface(source, cache.x, cache.y)	
-
-		# Blit our waveform across
-		context.paint()
+		# Only paint the exposed area. When just a cursor has moved
+		# it is a narrow column, so the drawing below is cheap.
+		context.rectangle(area.x, area.y, area.width, area.height)
+		context.clip()
+
+		# Blit the waveform tiles which cover the exposed area
+		tileWidth = WaveformCache.TILE_WIDTH
+		if area.width > 0:
+			for index in xrange(area.x // tileWidth, (area.x + area.width - 1) // tileWidth + 1):
+				source = self.GetWaveformTile(index)
+				if source:
+					context.set_source_surface(source, index * tileWidth, 0)
+					context.paint()
+				else:
+					self.PaintScaledTile(context, index)
+		
+		# the loading progress changes too often to be kept in the tiles
+		self.DrawStatus(context)
 
 		# Overlay an extra rect if we're selected
 		if self.event.isSelected:
@@ -316,43 +317,210 @@ class EventViewer(gtk.DrawingArea):
 		
 	#_____________________________________________________________________
 
-	def DrawWaveform(self, exposeArea):
+	def GetWaveformTile(self, index):
 		"""
-		Uses Cairo to draw the waveform level information onto a canvas in memory.
+		Finds a tile of the waveform in the shared WaveformCache. If it
+		isn't there, it is queued to be drawn in the background and the
+		last tile drawn in its place is returned until it is ready.
 		
 		Parameters:
-			exposeArea -- Cairo exposed area in which to draw the waveform.
+			index -- the index of the tile, counting from the start of the event.
+			
+		Returns:
+			the cairo surface of the tile, or None if the tile is outside
+			this widget or nothing has been drawn in its place yet.
 		"""
 		allocArea = self.get_allocation()
+		tile = (self.project.viewScale, index, self.small, allocArea.height)
+		key = (self.event.id, self.waveformVersion) + tile
+		
+		source = WaveformCache.cache.Get(key)
+		if source is None:
+			x = index * WaveformCache.TILE_WIDTH
+			width = min(WaveformCache.TILE_WIDTH, allocArea.width - x)
+			if width <= 0 or allocArea.height <= 0:
+				return None
+			
+			# while the zoom level is changing, the tiles would be out of date before they were finished
+			if self.zoomTimeout is None and not WaveformCache.renderer.IsPending(key):
+				data = self.PrepareWaveform(gtk.gdk.Rectangle(x, 0, width, allocArea.height))
+				WaveformCache.renderer.Render(key, self.DrawWaveform, data, self.OnWaveformTileDrawn)
+			
+			version = self.drawnVersions.get(tile)
+			if version is not None:
+				source = WaveformCache.cache.Get((self.event.id, version) + tile)
 		
-		rect = gtk.gdk.Rectangle(exposeArea.x - exposeArea.width, exposeArea.y,
-		                         exposeArea.width*3, exposeArea.height)
+		return source
+	
+	#_____________________________________________________________________
+	
+	def PaintScaledTile(self, context, index):
+		"""
+		Fills in a tile which hasn't been drawn at the current zoom level
+		by stretching the tiles drawn at the fallback zoom level, which is
+		much quicker than drawing the waveform. Any part not covered by
+		those tiles is left blank.
 		
-		#Check if our area to cache is outside the allocated area
-		if rect.x < 0:
-			rect.x = 0
-		if rect.x + rect.width > allocArea.width:
-			rect.width = allocArea.width - rect.x
-			
-		#set area to record where the cached surface goes
-		if self.small:
-			self.cachedDrawAreaSmall = rect
-			self.sourceSmall = cairo.ImageSurface(cairo.FORMAT_ARGB32, 
-			                                      rect.width, rect.height)
-			context = cairo.Context(self.sourceSmall)
+		Parameters:
+			context -- the cairo context of the widget.
+			index -- the index of the tile, counting from the start of the event.
+		"""
+		tileWidth = WaveformCache.TILE_WIDTH
+		height = self.allocation.height
+		x = index * tileWidth
+		
+		context.save()
+		context.rectangle(x, 0, tileWidth, height)
+		context.clip()
+		context.set_source_rgb(*self._BACKGROUND_RGB)
+		context.paint()
+		
+		scale = self.fallbackScale
+		if scale:
+			factor = float(self.project.viewScale) / scale
+			context.scale(factor, 1.0)
+			first = int(x / factor) // tileWidth
+			last = int((x + tileWidth) / factor) // tileWidth
+			for oldIndex in xrange(first, last + 1):
+				tile = (scale, oldIndex, self.small, height)
+				version = self.drawnVersions.get(tile)
+				if version is None:
+					continue
+				source = WaveformCache.cache.Get((self.event.id, version) + tile)
+				if source:
+					context.set_source_surface(source, oldIndex * tileWidth, 0)
+					context.paint()
+		
+		context.restore()
+	
+	#_____________________________________________________________________
+	
+	def DrawStatus(self, context):
+		"""
+		Writes "Loading...", "Downloading..." or "Recording..." over
+		the waveform, with a cancel button while loading.
+		
+		Parameters:
+			context -- the cairo context of the widget.
+		"""
+		if self.event.isLoading:
+			# Write "Loading..." or "Downloading..."
+			if self.event.duration <= 0:
+				# for some file types gstreamer doesn't give us a duration
+				# so don't display the percentage
+				if self.event.isDownloading:
+					message = _("Downloading...")
+				else:
+					message = _("Loading...")
+			else:
+				displayLength = int(100 * self.event.loadingLength / self.event.duration)
+				if self.event.isDownloading:
+					message = _("Downloading (%d%%)...") % displayLength
+				else:
+					message = _("Loading (%d%%)...") % displayLength
+		elif self.event.isRecording:
+			message = _("Recording...")
 		else:
-			self.cachedDrawAreaLarge = rect
-			self.sourceLarge = cairo.ImageSurface(cairo.FORMAT_ARGB32, 
-			                                      rect.width, rect.height)
-			context = cairo.Context(self.sourceLarge)
+			return
 		
-		context.set_line_width(2)
-		context.set_antialias(cairo.ANTIALIAS_SUBPIXEL)
+		# show the appropriate message
+		context.set_source_rgb(*self._TEXT_RGB)
+		context.move_to(5, 15)
+		context.show_text(message)
+		
+		if self.event.isLoading:
+			# display a cancel button
+			self.cancelButtonArea.x = int(context.get_current_point()[0]) + 3	# take the current context.x and pad it a bit
+			context.set_source_surface(self.cancelImg, self.cancelButtonArea.x, self.cancelButtonArea.y)
+			context.paint()
+	
+	#_____________________________________________________________________
+	
+	def OnWaveformTileDrawn(self, key):
+		"""
+		Callback function for when the renderer has finished a tile of
+		the waveform. Only the area of the tile is drawn again.
+		
+		Parameters:
+			key -- the key of the tile in the shared WaveformCache.
+		"""
+		version, tile = key[1], key[2:]
+		if version != self.waveformVersion:
+			return
+		
+		# the tile it replaces is no longer needed
+		oldVersion = self.drawnVersions.get(tile)
+		if oldVersion is not None and oldVersion != version:
+			WaveformCache.cache.Remove((self.event.id, oldVersion) + tile)
+		self.drawnVersions[tile] = version
+		
+		scale, index, small, height = tile
+		if scale == self.project.viewScale and small == self.small and height == self.allocation.height:
+			tileWidth = WaveformCache.TILE_WIDTH
+			self.queue_draw_area(index * tileWidth, 0, tileWidth, height)
+	
+	#_____________________________________________________________________
 
-		# Draw white background
-		context.rectangle(0, 0, rect.width, rect.height)
-		context.set_source_rgb(*self._BACKGROUND_RGB)
-		context.fill()
+	def InvalidateWaveform(self):
+		"""
+		Marks the cached waveform tiles as out of date, so that they are
+		drawn again on the next expose event. The old tiles are kept
+		to be shown until the new ones are ready.
+		"""
+		self.waveformVersion = WaveformCache.cache.NewVersion()
+		levels = self.event.levels_list
+		if levels:
+			self.waveformEnd = levels[len(levels) - 1][0]
+		else:
+			self.waveformEnd = 0
+		keepVersions = set(self.drawnVersions.values())
+		WaveformCache.cache.RemoveEvent(self.event.id, keepVersions)
+		WaveformCache.renderer.CancelEvent(self.event.id, self.waveformVersion)
+	
+	#_____________________________________________________________________
+	
+	def ExtendWaveform(self):
+		"""
+		Called when levels have been added to the end of the waveform while
+		the event is loading or recording. Only the tiles near the end can
+		change, so the others are moved to the new waveform version instead
+		of being drawn again.
+		"""
+		oldVersion, oldEnd = self.waveformVersion, self.waveformEnd
+		self.InvalidateWaveform()
+		
+		# a tile's path runs _TILE_MARGIN past its edge, and the last few
+		# points before the old end may be averaged with the new levels.
+		scale = self.project.viewScale
+		limit = min(int(oldEnd * scale / 1000) - 2 * self._TILE_MARGIN, self.allocation.width)
+		tileWidth = WaveformCache.TILE_WIDTH
+		
+		for tile, version in self.drawnVersions.items():
+			if version != oldVersion or tile[0] != scale or (tile[1] + 1) * tileWidth > limit:
+				continue
+			oldKey = (self.event.id, oldVersion) + tile
+			if WaveformCache.cache.Rename(oldKey, (self.event.id, self.waveformVersion) + tile):
+				self.drawnVersions[tile] = self.waveformVersion
+	
+	#_____________________________________________________________________
+	
+	def PrepareWaveform(self, rect):
+		"""
+		Collects everything needed to draw a tile of the waveform, so that
+		DrawWaveform() doesn't touch the event and can run on one of the
+		renderer's threads. Only a point every _MIN_POINT_SEPARATION pixels
+		is read from the levels, so this is quick. When zoomed out far enough
+		for each point to cover several levels, the quietest and loudest of
+		them are kept as well, so short peaks aren't lost in the average.
+		
+		Parameters:
+			rect -- the area of this widget to draw.
+			
+		Returns:
+			a dictionary describing the tile, to be passed to DrawWaveform().
+		"""
+		data = {"width" : rect.width, "height" : rect.height, "levels" : None,
+		        "envelope" : None, "fades" : None, "text" : None, "textx" : 5 - rect.x}
 		
 		if self.event.levels_list and (self.event.duration or self.event.loadingLength):
 			if self.event.loadingLength:
@@ -360,68 +528,138 @@ class EventViewer(gtk.DrawingArea):
 			else:
 				duration = self.event.duration
 			
-			context.move_to(0,rect.height)
+			# start a little before the area so the path joins the one in the area to the left
+			starting_x = max(rect.x - self._TILE_MARGIN, 0)
+			points = [(starting_x - rect.x, rect.height)]
 			
 			levels = self.event.GetFadeLevels()
-			length = len(levels)
-			
+
 			# time offset of the start of the drawing area in milliseconds
-			starting_time = int(rect.x / self.project.viewScale * 1000)
+			starting_time = int(starting_x / self.project.viewScale * 1000)
 			starting_index = levels.find_endtime_index(starting_time)
 
+			# use the coarsest decimation that still gives a point every _MIN_POINT_SEPARATION
+			# pixels, so the number of levels we walk depends on the width, not the event length.
+			min_bucket_time = self._MIN_POINT_SEPARATION * 1000 / self.project.viewScale
+			pyramid_level = levels.pyramid_level_for(min_bucket_time)
+
 			x = 0
-			last_x = -2
+			last_x = starting_x - rect.x - 2
 			skip_list = []
-			iterator = itertools.islice(levels, starting_index, length)
-			for endtime, peak in iterator:
-				x = int((endtime - starting_time) * self.project.viewScale / 1000)
+			lowest, highest = LevelsList.MAX_LEVEL, 0
+			maxPoints, minPoints = [], []
+			iterator = levels.iter_pyramid(pyramid_level, starting_index)
+			for endtime, minimum, maximum, peak in iterator:
+				# measure from the start of the event so every tile puts the points in the same place
+				x = int(endtime * self.project.viewScale / 1000) - rect.x
 				
-				peakOnScreen = int(peak * rect.height / sys.maxint)
+				peakOnScreen = int(peak * rect.height / LevelsList.MAX_LEVEL)
 				skip_list.append(peakOnScreen)
+				lowest = min(lowest, minimum)
+				highest = max(highest, maximum)
 				if (x - last_x) < self._MIN_POINT_SEPARATION:
 					continue
 				
 				peakOnScreen = sum(skip_list) / len(skip_list)
-				context.line_to(x, rect.height - peakOnScreen)
+				points.append((x, rect.height - peakOnScreen))
+				maxPoints.append((x, rect.height - int(highest * rect.height / LevelsList.MAX_LEVEL)))
+				minPoints.append((x, rect.height - int(lowest * rect.height / LevelsList.MAX_LEVEL)))
 				
 				skip_list = []
+				lowest, highest = LevelsList.MAX_LEVEL, 0
 				last_x = x
-				if x > rect.width:
+				if x > rect.width + self._TILE_MARGIN:
 					break
 			
-			context.line_to(x, rect.height)
+			points.append((x, rect.height))
+			data["levels"] = points
+			
+			# at full detail every point is a single level, so there is no envelope to draw
+			if pyramid_level > 0 and maxPoints:
+				minPoints.reverse()
+				data["envelope"] = maxPoints + minPoints
+		
+		if self.event.audioFadePoints:
+			data["fades"] = [(self.PixXFromSec(sec) - rect.x, self.PixYFromVol(vol))
+			                 for sec, vol in self.event.audioFadePoints]
+		
+		# the status of loading and recording events is written by DrawStatus()
+		if not self.event.isLoading and not self.event.isRecording:
+			#Draw event name
+			data["text"] = self.event.name
+		
+		return data
+	
+	#_____________________________________________________________________
+	
+	def DrawWaveform(self, data):
+		"""
+		Uses Cairo to draw a tile of the waveform onto a canvas in memory.
+		This is called on the renderer's threads, so it must only use
+		the data it is given.
+		
+		Parameters:
+			data -- the dictionary describing the tile, from PrepareWaveform().
+		
+		Returns:
+			a cairo ImageSurface holding the drawing.
+		"""
+		width, height = data["width"], data["height"]
+		source = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+		context = cairo.Context(source)
+		
+		context.set_line_width(2)
+		context.set_antialias(cairo.ANTIALIAS_SUBPIXEL)
+		
+		# Draw white background
+		context.rectangle(0, 0, width, height)
+		context.set_source_rgb(*self._BACKGROUND_RGB)
+		context.fill()
+		
+		if data["levels"]:
+			points = data["levels"]
+			context.move_to(*points[0])
+			for x, y in points[1:]:
+				context.line_to(x, y)
 			
 			#levels gradient fill
-			gradient = cairo.LinearGradient(0.0, 0.0, 0, rect.height)
+			gradient = cairo.LinearGradient(0.0, 0.0, 0, height)
 			gradient.add_color_stop_rgba(*self._OPAQUE_GRADIENT_STOP_ORGBA)
 			gradient.add_color_stop_rgba(*self._TRANSPARENT_GRADIENT_STOP_ORGBA)
 			context.set_source(gradient)
 			context.fill_preserve()
+			levelsPath = context.copy_path()
+			context.new_path()
+			
+			if data["envelope"]:
+				#the range between the quietest and loudest levels of each point
+				envelope = data["envelope"]
+				context.move_to(*envelope[0])
+				for x, y in envelope[1:]:
+					context.line_to(x, y)
+				context.close_path()
+				context.set_source_rgba(*self._ENVELOPE_RGBA)
+				context.fill()
 			
 			#levels path (on top of the fill)
+			context.append_path(levelsPath)
 			context.set_source_rgb(*self._BORDER_RGB)
 			context.set_line_join(cairo.LINE_JOIN_ROUND)
 			context.set_line_width(self._LINE_WIDTH)
 			context.stroke()
 		
-		if self.event.audioFadePoints:
-			pixelPoints = []
+		if data["fades"]:
 			# draw the fade line
 			context.set_source_rgb(*self._FADELINE_RGB)
 			
-			firstPoint = self.event.audioFadePoints[0]
-			pixx = self.PixXFromSec(firstPoint[0]) - rect.x
-			pixy = self.PixYFromVol(firstPoint[1])
-			context.move_to(pixx, pixy)
-			for sec, vol in self.event.audioFadePoints[1:]:
-				pixx = self.PixXFromSec(sec) - rect.x
-				pixy = self.PixYFromVol(vol)
-				pixelPoints.append((pixx, pixy))
+			pixelPoints = data["fades"]
+			context.move_to(*pixelPoints[0])
+			for pixx, pixy in pixelPoints[1:]:
 				context.line_to(pixx,pixy)		
 			context.stroke()
 			
 			#draw the fade points
-			for pixx, pixy in pixelPoints:
+			for pixx, pixy in pixelPoints[1:]:
 				context.arc(pixx, pixy, 3.5, 0, 7)
 				context.fill()
 		
@@ -429,42 +667,13 @@ class EventViewer(gtk.DrawingArea):
 		context.identity_matrix()
 		context.scale(1.0, 1.0)
 		
-		#check if we are at the beginning
-		if rect.x == 0:
+		if data["text"]:
+			# the text starts in the first tile but may run into the ones after it
 			context.set_source_rgb(*self._TEXT_RGB)
-			context.move_to(5, 15)
-			
-			if self.event.isLoading:
-				# Write "Loading..." or "Downloading..."
-				if self.event.duration <= 0:
-					# for some file types gstreamer doesn't give us a duration
-					# so don't display the percentage
-					if self.event.isDownloading:
-						message = _("Downloading...")
-					else:
-						message = _("Loading...")
-				else:
-					displayLength = int(100 * self.event.loadingLength / self.event.duration)
-					if self.event.isDownloading:
-						message = _("Downloading (%d%%)...") % displayLength
-					else:
-						message = _("Loading (%d%%)...") % displayLength
-				
-				# show the appropriate message
-				context.show_text(message)
-				
-				# display a cancel button
-				self.cancelButtonArea.x = context.get_current_point()[0]+3	# take the current context.x and pad it a bit
-				context.set_source_surface(self.cancelImg, self.cancelButtonArea.x, self.cancelButtonArea.y)
-				context.paint()
-								
-			elif self.event.isRecording:
-				context.show_text(_("Recording..."))
-			else:
-				#Draw event name
-				context.show_text(self.event.name)
+			context.move_to(data["textx"], 15)
+			context.show_text(data["text"])
 		
-		self.redrawWaveform = False
+		return source
 
 	#_____________________________________________________________________
 	
@@ -482,9 +691,14 @@ class EventViewer(gtk.DrawingArea):
 		self.event.disconnect_by_func(self.OnEventPosition)
 		self.event.disconnect_by_func(self.OnEventWaveform)
 		
+		if self.zoomTimeout is not None:
+			gobject.source_remove(self.zoomTimeout)
+			self.zoomTimeout = None
+		
 		#delete the cached images
-		del self.sourceSmall
-		del self.sourceLarge
+		WaveformCache.renderer.CancelEvent(self.event.id)
+		WaveformCache.cache.RemoveEvent(self.event.id)
+		self.drawnVersions = {}
 		del self.cancelImg
 		self.destroy()
 	
@@ -571,7 +785,9 @@ class EventViewer(gtk.DrawingArea):
 			self.UpdateDrawerPosition(selection_direction == "rtol")
 			
 		else:
-			self.highlightCursor = mouse.x
+			# only the columns under the old and new cursor change
+			self.MoveHighlightCursor(mouse.x)
+			return True
 		
 		self.queue_draw()
 		return True
@@ -1003,10 +1219,25 @@ class EventViewer(gtk.DrawingArea):
 		if self.messageID:   #clear status bar if not already clear
 			self.mainview.ClearStatusBar(self.messageID)
 			self.messageID = None
-		self.highlightCursor = None
-		self.queue_draw()
+		self.MoveHighlightCursor(None)
 		
 	#_____________________________________________________________________
+	
+	def MoveHighlightCursor(self, x):
+		"""
+		Moves the highlight cursor, redrawing only the columns it covered
+		before and after the move instead of the whole event.
+		
+		Parameters:
+			x -- the new position of the highlight cursor in pixels,
+				or None to hide it.
+		"""
+		for oldOrNew in (self.highlightCursor, x):
+			if oldOrNew is not None:
+				# the split icon is centred on the cursor line
+				halfWidth = self.splitImg.get_width() / 2 + 1
+				self.queue_draw_area(int(oldOrNew) - halfWidth, 0, 2 * halfWidth, self.allocation.height)
+		self.highlightCursor = x
 			
 	def OnSplit(self, gtkevent, pos):
 		"""
@@ -1155,7 +1386,7 @@ class EventViewer(gtk.DrawingArea):
 		"""
 		Callback function for when the waveform of the event changes.
 		"""
-		self.redrawWaveform = True
+		self.InvalidateWaveform()
 		self.UpdateFadeMarkers()
 		self.queue_draw()
 		
@@ -1166,6 +1397,8 @@ class EventViewer(gtk.DrawingArea):
 		Callback function for when the loading status of the event changes.
 		"""
 		self.drawer.set_sensitive(not self.event.isLoading)
+		# the event name is only drawn in the tiles once it has loaded
+		self.InvalidateWaveform()
 		self.queue_draw()
 		
 	#_____________________________________________________________________
@@ -1174,7 +1407,11 @@ class EventViewer(gtk.DrawingArea):
 		"""
 		Callback function for when the length of the event changes.
 		"""
-		self.redrawWaveform = True
+		if self.event.isLoading or self.event.isRecording:
+			# the levels are only added to the end
+			self.ExtendWaveform()
+		else:
+			self.InvalidateWaveform()
 		self.SetAccessibleName()
 		self.queue_resize()
 		self.queue_draw()
@@ -1216,11 +1453,36 @@ class EventViewer(gtk.DrawingArea):
 		Parameters:
 			project -- The project instance that send the signal.
 		"""
+		# the tiles are cached for each scale, so they don't need to be thrown away
 		if self.currentScale != self.project.viewScale:
-			self.redrawWaveform = True
+			# stretch the tiles of the zoom level we started from until the zooming stops,
+			# unless none were drawn at the last one because it didn't settle.
+			if self.zoomTimeout is None:
+				for tile in self.drawnVersions:
+					if tile[0] == self.currentScale:
+						self.fallbackScale = self.currentScale
+						break
+			else:
+				gobject.source_remove(self.zoomTimeout)
+			self.zoomTimeout = gobject.timeout_add(self._ZOOM_SETTLE_TIME, self.OnZoomSettled)
+			
 			self.queue_resize()
 			self.currentScale = self.project.viewScale
 			self.queue_draw()
+	
+	#_____________________________________________________________________
+	
+	def OnZoomSettled(self):
+		"""
+		Called once the zoom level has stopped changing,
+		to draw the waveform at the new scale.
+		
+		Returns:
+			False -- stop calling the callback on a timeout_add.
+		"""
+		self.zoomTimeout = None
+		self.queue_draw()
+		return False
 
 	#_____________________________________________________________________
 
@@ -0,0 +1,116 @@
+#
+#	THIS FILE IS PART OF THE JOKOSHER PROJECT AND LICENSED UNDER THE GPL. SEE
+#	THE 'COPYING' FILE FOR DETAILS
+#
+#	FrameClock.py
+#
+#	This module holds the clock which drives everything in the GUI that is
+#	updated at regular intervals, such as the playhead and the VU meters,
+#	so that the main loop only wakes up once per frame for all of them.
+#
+#-------------------------------------------------------------------------------
+
+import gobject, traceback
+
+# the number of frames per second
+FPS = 30.
+
+#=========================================================================
+
+class FrameClock:
+	"""
+	A single timeout which calls all of its subscribers once per frame, or
+	once every few frames for those which need fewer updates. The timeout
+	only runs while there is at least one subscriber.
+	"""
+
+	#_____________________________________________________________________
+
+	def __init__(self, fps):
+		"""
+		Creates a new instance of FrameClock.
+
+		Parameters:
+			fps -- the number of frames per second.
+		"""
+		self.fps = fps
+		self.frame = 0
+		self.lastID = 0
+		self.subscribers = {}	#id -> [callback, number of frames between calls, frame of the next call]
+		self.source = None
+
+	#_____________________________________________________________________
+
+	def Subscribe(self, callback, rate=None):
+		"""
+		Calls a function at regular intervals until it returns False,
+		in the same way as gobject.timeout_add().
+
+		Parameters:
+			callback -- function called with no parameters.
+			rate -- the number of calls per second, or None to call it
+					every frame. It is rounded to a whole number of frames.
+
+		Returns:
+			the id to pass to Unsubscribe().
+		"""
+		frames = 1
+		if rate:
+			frames = max(int(round(self.fps / rate)), 1)
+
+		self.lastID += 1
+		self.subscribers[self.lastID] = [callback, frames, self.frame + frames]
+
+		if self.source is None:
+			self.source = gobject.timeout_add(int(1000 / self.fps), self.__OnFrame)
+		return self.lastID
+
+	#_____________________________________________________________________
+
+	def Unsubscribe(self, subscriberID):
+		"""
+		Stops calling a function.
+
+		Parameters:
+			subscriberID -- the id returned by Subscribe().
+		"""
+		self.subscribers.pop(subscriberID, None)
+
+	#_____________________________________________________________________
+
+	def __OnFrame(self):
+		"""
+		Calls the subscribers which are due in this frame.
+
+		Returns:
+			True -- continue calling the callback on the timeout.
+			False -- stop calling the callback once nobody is subscribed.
+		"""
+		self.frame += 1
+		# the subscribers can subscribe or unsubscribe while being called
+		for subscriberID, subscriber in self.subscribers.items():
+			callback, frames, nextFrame = subscriber
+			if nextFrame > self.frame or subscriberID not in self.subscribers:
+				continue
+
+			subscriber[2] = self.frame + frames
+			try:
+				keep = callback()
+			except Exception:
+				# a failing callback is dropped, like a failing timeout would be
+				traceback.print_exc()
+				keep = False
+			if not keep:
+				self.subscribers.pop(subscriberID, None)
+
+		if not self.subscribers:
+			self.source = None
+			return False
+		return True
+
+	#_____________________________________________________________________
+
+#=========================================================================
+
+# the clock shared by the whole GUI
+clock = FrameClock(FPS)
@@ -41,6 +41,7 @@ class Settings:
 				"addinstrumentwindowwidth" : 300,
 				"instrumenteffectwindowheight" : 450,				
 				"instrumenteffectwindowwidth" : 650,
+				"levelscachesize" : 256, # megabytes of waveform levels shared between projects
 				
 				}
 
@@ -402,6 +403,7 @@ create_dirs = [
 	('presets', 'mixdown'),
 	'mixdownprofiles',
 	'templates',
+	'levelscache',
 ]
 
 # do a listing before we create the dirs so we know if it was empty (ie first run)
@@ -434,6 +436,7 @@ for dirs in create_dirs:
 EFFECT_PRESETS_PATH = os.path.join(JOKOSHER_DATA_HOME, "presets", "effects")
 TEMPLATES_PATH = os.path.join(JOKOSHER_DATA_HOME, "templates")
 MIXDOWN_PROFILES_PATH = os.path.join(JOKOSHER_DATA_HOME, "mixdownprofiles")
+LEVELS_CACHE_PATH = os.path.join(JOKOSHER_DATA_HOME, "levelscache")
 
 IMAGE_PATH = os.getenv("JOKOSHER_IMAGE_PATH")
 if not IMAGE_PATH:
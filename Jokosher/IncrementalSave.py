@@ -1,6 +1,6 @@
 
 import Event
-import Utils
+import Utils, LevelsList
 import os.path
 import xml.dom.minidom as xml
 
@@ -32,6 +32,26 @@ class NewEvent:
 			
 		instr.addEventFromFile(self.event_start, filename, copyfile=False,
 		              name=event_name, duration=event_duration, levels_file=event_levels_file)
+	
+	def RecoverLevels(self, project):
+		"""
+		Finds the levels which were streamed to disk while recording,
+		for a recording that never finished loading.
+		
+		Returns:
+			a (duration, levels_file) tuple which can be passed to Execute(),
+			or (None, None) if no levels were written.
+		"""
+		levels_file = os.path.basename(self.filename) + Event.Event.LEVELS_FILE_EXTENSION
+		levels = LevelsList.LevelsList()
+		try:
+			levels.fromfile(os.path.join(project.levels_path, levels_file), mapped=True)
+		except LevelsList.CorruptFileError:
+			return (None, None)
+		
+		if not levels:
+			return (None, None)
+		return (levels[-1][0] / 1000.0, levels_file)
 		
 	def StoreToString(self):
 		doc = xml.Document()
@@ -314,6 +334,11 @@ def FilterAndExecuteAll(save_action_list, project):
 			# just restore from the data on disk
 			complete_load = complete_load_ids[action.id]
 			action.Execute(project, complete_load.duration, complete_load.levels_file)
+		elif isinstance(action, NewEvent) and action.recording:
+			# the recording was interrupted, so use the levels written while
+			# recording instead of decoding what was recorded
+			duration, levels_file = action.RecoverLevels(project)
+			action.Execute(project, duration, levels_file)
 		else:
 			action.Execute(project)
 			
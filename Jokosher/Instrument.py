@@ -19,7 +19,8 @@ import PlatformUtils
 import os, time, shutil
 import urlparse # To split up URI's
 import gobject
-import Event
+import Event, EventList
+import FrameClock
 import UndoSystem, IncrementalSave
 import Utils
 
@@ -95,7 +96,7 @@ class Instrument(gobject.GObject):
 		
 		self.project = project
 		
-		self.events = []				# List of events attached to this instrument
+		self.events = EventList.EventList(project.InvalidateLength, self.InvalidateController)	# List of events attached to this instrument, indexed by their start
 		self.graveyard = []			# List of events that have been deleted (kept for undo)
 		self.effects = []				# List of GStreamer effect elements
 		
@@ -116,9 +117,13 @@ class Instrument(gobject.GObject):
 		self.currentchainpreset = None	# current instrument wide chain preset
 		self.output = ""
 		self.recordingbin = None
-		self.id = project.GenerateUniqueID(id)	#check is id is already being used before setting
+		self.id = project.GenerateUniqueID(id, obj=self)	#check is id is already being used before setting
 		
 		self.input = None	# the device to use for recording on this instrument.
+		self.fadePoints = {}		# The points set on the volumeFadeController, as time in nanoseconds -> volume
+		self.fadeOperationLength = None	# The project length in seconds the volumeFadeOperation lasts for
+		self.controllerIsDirty = True	# True if the events or their fades have changed since the controller was filled
+		self.controllerUpdateSource = None	# The frame clock subscription which updates the controller
 		self.inTrack = 0	# Input track to record from if device is multichannel.
 	
 		# CREATE GSTREAMER ELEMENTS #
@@ -165,6 +170,7 @@ class Instrument(gobject.GObject):
 		self.levelElement.set_property("message", True)
 		self.levelElement.set_property("peak-ttl", 0)
 		self.levelElement.set_property("peak-falloff", 20)
+		self.project.AddLevelHandler(self.levelElement, self.__LevelCb)
 		
 		self.panElement.set_property("panorama", 0)
 
@@ -619,7 +625,7 @@ class Instrument(gobject.GObject):
 		if duration and levels_file:
 			ev.duration = duration
 			ev.levels_file = levels_file
-			ev.levels_list.fromfile(ev.GetAbsLevelsFile())
+			ev.levels_list.fromfile(ev.GetAbsLevelsFile(), mapped=True)
 			# update properties and position when duration changes.
 			ev.MoveButDoNotOverlap(ev.start)
 			ev.SetProperties()
@@ -766,6 +772,18 @@ class Instrument(gobject.GObject):
 
 	#_____________________________________________________________________
 
+	def __LevelCb(self, bus, message):
+		"""
+		Handles the level messages of this Instrument's level element.
+		
+		Parameters:
+			bus -- reserved for GStreamer callbacks, don't use it explicitly.
+			message -- reserved for GStreamer callbacks, don't use it explicitly.
+		"""
+		self.project.QueueLevel(self, message)
+
+	#_____________________________________________________________________
+
 	def SetLevel(self, level):
 		"""
 		Sets the level of this Instrument.
@@ -1048,19 +1066,26 @@ class Instrument(gobject.GObject):
 	def PrepareController(self):
 		"""
 		Fills the gst.Controller for this Instrument with its list of fade times.
+		Only the points which have changed since the last time are set or
+		unset, and nothing is done if no event has changed in between.
 		"""
-		
-		Globals.debug("Preparing the controller")
 		# set the length of the operation to be the full length of the project
-		self.volumeFadeOperation.set_property("duration", self.project.GetProjectLength() * gst.SECOND)
-		self.volumeFadeController.unset_all("volume")
+		length = self.project.GetProjectLength()
+		if length != self.fadeOperationLength:
+			self.fadeOperationLength = length
+			self.volumeFadeOperation.set_property("duration", length * gst.SECOND)
+		
+		if not self.controllerIsDirty:
+			return
+		self.controllerIsDirty = False
+		
+		points = {}
 		firstpoint = False
 		for ev in self.events:
 			if not ev.audioFadePoints:
 				#there are no fade points, so just make it 100% all the way through
-				for point, vol in ((ev.start, 0.99), (ev.start+ev.duration, 0.99)):
-					Globals.debug("FADE POINT: time(%.2f) vol(%.2f)" % (point, vol))
-					self.volumeFadeController.set("volume", (point) * gst.SECOND, vol)
+				points[long(ev.start * gst.SECOND)] = 0.99
+				points[long((ev.start + ev.duration) * gst.SECOND)] = 0.99
 				continue
 			
 			for point in ev.audioFadePoints:
@@ -1071,11 +1096,44 @@ class Instrument(gobject.GObject):
 					vol = 0.99
 				else:
 					vol = point[1]
-				Globals.debug("FADE POINT: time(%.2f) vol(%.2f)" % (ev.start + point[0], vol))
-				self.volumeFadeController.set("volume", (ev.start + point[0]) * gst.SECOND, vol)
+				points[long((ev.start + point[0]) * gst.SECOND)] = vol
 		if not firstpoint:
-			Globals.debug("Set extra zero fade point")
-			self.volumeFadeController.set("volume", 0, 0.99)
+			points[0L] = 0.99
+		
+		removed = [time for time in self.fadePoints if time not in points]
+		changed = [(time, vol) for time, vol in points.iteritems() if self.fadePoints.get(time) != vol]
+		if changed or removed:
+			Globals.debug("Preparing the controller: %d fade points set, %d unset" % (len(changed), len(removed)))
+		for time in removed:
+			self.volumeFadeController.unset("volume", time)
+		for time, vol in changed:
+			self.volumeFadeController.set("volume", time, vol)
+		self.fadePoints = points
+	
+	#_____________________________________________________________________
+	
+	def InvalidateController(self):
+		"""
+		Called when an Event has been added, removed, moved or resized, or
+		its fades have changed. The gst.Controller is updated on the next frame.
+		"""
+		self.controllerIsDirty = True
+		if not self.controllerUpdateSource:
+			self.controllerUpdateSource = FrameClock.clock.Subscribe(self.__UpdateController)
+	
+	#_____________________________________________________________________
+	
+	def __UpdateController(self):
+		"""
+		Updates the gst.Controller after the events have changed.
+		
+		Returns:
+			False -- unsubscribes from the frame clock.
+		"""
+		self.controllerUpdateSource = None
+		self.PrepareController()
+		return False
+	
 	#_____________________________________________________________________
 	
 	def RemoveEventsUnderEvent(self, mainEvent, undoAction=None):
@@ -1095,10 +1153,8 @@ class Instrument(gobject.GObject):
 		start = mainEvent.start
 		stop = mainEvent.start + max(mainEvent.duration, mainEvent.loadingLength)
 		leftTrimEvent = rightTrimEvent = None
-		for event in self.events:
-			if event is mainEvent:
-				continue
-			
+		#the events are found before any of them are deleted from the list
+		for event in self.events.GetOverlapping(start, stop, mainEvent):
 			eventLeft = event.start
 			eventRight = event.start + event.duration
 			if start <= eventLeft and eventRight <= stop:
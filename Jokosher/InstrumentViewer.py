@@ -307,6 +307,9 @@ class InstrumentViewer(gtk.EventBox):
 		This method also destroys the corresponding EventLaneViewer.
 		"""
 		self.instrument.disconnect_by_func(self.OnInstrumentImage)
+		self.instrument.disconnect_by_func(self.OnInstrumentName)
+		self.instrument.disconnect_by_func(self.OnInstrumentSelected)
+		self.controlsBox.Destroy()
 		self.eventLane.Destroy()
 		self.destroy()
 	
@@ -27,7 +27,7 @@ import ProjectManager, Globals, WelcomeDialog
 import InstrumentConnectionsDialog
 import EffectPresets, Extension, ExtensionManager
 import Utils, AudioPreview, MixdownProfileDialog, MixdownActions
-import PlatformUtils
+import PlatformUtils, FrameClock
 import ui.StatusBar as StatusBar
 
 #=========================================================================
@@ -165,6 +165,7 @@ class MainApp:
 		
 		self.statusbar = StatusBar.StatusBar()
 		self.main_vbox.pack_end(self.statusbar, False)
+		self.waveformMessageID = None	#status bar message showing the progress of waveform generation
 		
 		# Initialise some useful vars
 		self.mode = None
@@ -930,6 +931,25 @@ class MainApp:
 
 	#_____________________________________________________________________
 	
+	def OnWaveformProgress(self, scheduler, finished, total):
+		"""
+		Callback for when waveforms start or finish being generated.
+		
+		Parameters:
+			scheduler -- the WaveformScheduler that sent the signal.
+			finished -- the number of waveforms which have been generated.
+			total -- the number of waveforms being generated altogether.
+		"""
+		if self.waveformMessageID:
+			self.ClearStatusBar(self.waveformMessageID)
+			self.waveformMessageID = None
+		
+		if total > 1:
+			message = _("Generating waveforms: %(finished)d of %(total)d") % {"finished":finished, "total":total}
+			self.waveformMessageID = self.SetStatusBar(message)
+	
+	#_____________________________________________________________________
+	
 	def OnProjectAudioState(self, project):
 		"""
 		Callback for when the project starts playing or recording, or when it is
@@ -986,7 +1006,7 @@ class MainApp:
 		
 		self.exportprogress = export.get_widget("progressBar")
 		
-		gobject.timeout_add(100, self.UpdateExportDialog)
+		FrameClock.clock.Subscribe(self.UpdateExportDialog, 10)
 		
 	#_____________________________________________________________________
 	
@@ -1546,6 +1566,7 @@ class MainApp:
 		self.project.connect("audio-state::export-start", self.OnProjectExportStart)
 		self.project.connect("audio-state::export-stop", self.OnProjectExportStop)
 		self.project.connect("undo", self.OnProjectUndo)
+		self.project.waveformScheduler.connect("progress", self.OnWaveformProgress)
 		
 		self.project.transport.connect("transport-mode", self.OnTransportMode)
 		self.OnTransportMode()
@@ -1821,9 +1842,9 @@ class MainApp:
 				break
 		
 		if instrID != None:
-			for id, instrViewer in self.workspace.recordingView.views:
-				if instrID == id:
-					instrViewer.eventLane.CreateEventFromFile()
+			instrViewer = self.workspace.recordingView.GetInstrumentViewer(instr)
+			if instrViewer:
+				instrViewer.eventLane.CreateEventFromFile()
 		
 	#_____________________________________________________________________
 
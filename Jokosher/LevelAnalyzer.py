@@ -0,0 +1,213 @@
+#
+#	THIS FILE IS PART OF THE JOKOSHER PROJECT AND LICENSED UNDER THE GPL. SEE
+#	THE 'COPYING' FILE FOR DETAILS
+#
+#	LevelAnalyzer.py
+#
+#	This module calculates the levels of an audio file from the raw samples
+#	pulled out of an appsink element, instead of receiving a bus message
+#	from a level element for every interval.
+#
+#-------------------------------------------------------------------------------
+
+import threading, audioop, math, sys
+from array import array
+import pygst
+pygst.require("0.10")
+import gst, gobject
+import Utils
+
+# the caps the audio must be converted to before it reaches the appsink
+CAPS = "audio/x-raw-int,width=16,depth=16,signed=(boolean)true,endianness=(int)%d" % \
+		{"little" : 1234, "big" : 4321}[sys.byteorder]
+SAMPLE_WIDTH = 2
+MAX_SAMPLE = 32768.0
+
+#=========================================================================
+
+class LevelAnalyzer:
+	"""
+	Pulls the decoded audio out of an appsink element on a worker thread
+	and calculates the peak and RMS level of every channel in each interval.
+	The levels are handed to the main thread in chunks, so the main loop
+	is woken a few times per second of audio instead of once per interval.
+	"""
+
+	# number of intervals calculated before they are sent to the main thread
+	INTERVALS_PER_CHUNK = 50
+
+	#_____________________________________________________________________
+
+	def __init__(self, appsink, interval, levelsCallback, eosCallback):
+		"""
+		Creates a new instance of LevelAnalyzer.
+
+		Parameters:
+			appsink -- the appsink element at the end of the decoding pipeline.
+			interval -- the length of each interval in seconds.
+			levelsCallback -- function called in the main thread with a list
+					of (endtime, levels) tuples, as returned by
+					Utils.CalculateAudioLevelFromStructure().
+			eosCallback -- function called in the main thread once all the
+					levels have been sent.
+		"""
+		self.appsink = appsink
+		self.interval = interval
+		self.levelsCallback = levelsCallback
+		self.eosCallback = eosCallback
+		self.stopped = False
+
+		self.thread = threading.Thread(target=self.__Run)
+		self.thread.setDaemon(True)
+
+	#_____________________________________________________________________
+
+	def Start(self):
+		"""
+		Starts pulling buffers. The pipeline should be set to playing first.
+		"""
+		self.thread.start()
+
+	#_____________________________________________________________________
+
+	def Stop(self):
+		"""
+		Stops sending levels to the main thread. The worker thread
+		finishes once the pipeline is set to the NULL state.
+		"""
+		self.stopped = True
+
+	#_____________________________________________________________________
+
+	def __Run(self):
+		"""
+		The worker thread. Reads buffers from the appsink until
+		the end of the stream, calculating the levels of each interval.
+		"""
+		pending = ""	#samples of the interval which isn't complete yet
+		frames = 0	#number of frames analysed so far
+		endtime = 0
+		chunk = []
+		rate = None
+
+		while not self.stopped:
+			buffer = self.appsink.emit("pull-buffer")
+			if buffer is None:
+				# end of stream, or the pipeline has been stopped
+				break
+
+			if rate is None:
+				structure = buffer.caps[0]
+				rate, channels = structure["rate"], structure["channels"]
+				frameSize = channels * SAMPLE_WIDTH
+				intervalSize = max(int(rate * self.interval), 1) * frameSize
+
+			pending += buffer.data
+			offset = 0
+			while len(pending) - offset >= intervalSize:
+				frames += intervalSize / frameSize
+				endtime = frames * 1000 / rate
+				chunk.append((endtime, self.__CalculateLevels(pending[offset:offset + intervalSize], channels)))
+				offset += intervalSize
+			pending = pending[offset:]
+
+			if len(chunk) >= self.INTERVALS_PER_CHUNK:
+				gobject.idle_add(self.__SendLevels, chunk)
+				chunk = []
+
+		# the pipeline was set to NULL before the end of the stream
+		if self.stopped or not self.appsink.get_property("eos"):
+			return
+
+		# the last interval is usually shorter than the others
+		if rate is not None and len(pending) >= frameSize:
+			pending = pending[:len(pending) - len(pending) % frameSize]
+			frames += len(pending) / frameSize
+			if frames * 1000 / rate > endtime:
+				chunk.append((frames * 1000 / rate, self.__CalculateLevels(pending, channels)))
+
+		if chunk:
+			gobject.idle_add(self.__SendLevels, chunk)
+		gobject.idle_add(self.__SendEOS)
+
+	#_____________________________________________________________________
+
+	def __CalculateLevels(self, samples, channels):
+		"""
+		Calculates the levels of some interleaved samples.
+
+		Parameters:
+			samples -- string of native endian 16 bit samples.
+			channels -- number of interleaved channels.
+
+		Returns:
+			the levels list, holding the average RMS level followed by
+			the peak and RMS level of each channel.
+		"""
+		if channels == 1:
+			fragments = [samples]
+		else:
+			interleaved = array("h")
+			interleaved.fromstring(samples)
+			fragments = [interleaved[i::channels].tostring() for i in xrange(channels)]
+
+		peaks = [ToDecibels(audioop.max(fragment, SAMPLE_WIDTH)) for fragment in fragments]
+		rms = [ToDecibels(audioop.rms(fragment, SAMPLE_WIDTH)) for fragment in fragments]
+		return Utils.CalculateAudioLevel(peaks, rms)
+
+	#_____________________________________________________________________
+
+	def __SendLevels(self, chunk):
+		"""
+		Passes a chunk of levels to the levels callback in the main thread.
+
+		Parameters:
+			chunk -- list of (endtime, levels) tuples.
+
+		Returns:
+			False -- stops the idle callback.
+		"""
+		if not self.stopped:
+			self.levelsCallback(chunk)
+		return False
+
+	#_____________________________________________________________________
+
+	def __SendEOS(self):
+		"""
+		Calls the end of stream callback in the main thread.
+
+		Returns:
+			False -- stops the idle callback.
+		"""
+		if not self.stopped:
+			self.eosCallback()
+		return False
+
+	#_____________________________________________________________________
+
+#=========================================================================
+
+def IsAvailable():
+	"""
+	Returns:
+		True if the appsink element needed by the LevelAnalyzer is installed.
+	"""
+	return gst.element_factory_find("appsink") is not None
+
+#_____________________________________________________________________
+
+def ToDecibels(value):
+	"""
+	Parameters:
+		value -- an absolute 16 bit sample value.
+
+	Returns:
+		the value in decibels relative to full scale. Silence is returned
+		as twice DECIBEL_RANGE below 0dB, which is drawn as the lowest level.
+	"""
+	if value <= 0:
+		return -Utils.DECIBEL_RANGE * 2.0
+	return 20 * math.log10(value / MAX_SAMPLE)
+
+#_____________________________________________________________________
@@ -0,0 +1,264 @@
+#
+#	THIS FILE IS PART OF THE JOKOSHER PROJECT AND LICENSED UNDER THE GPL. SEE
+#	THE 'COPYING' FILE FOR DETAILS
+#
+#	LevelsCache.py
+#
+#	This module keeps the levels of every audio file decoded by Jokosher in
+#	a cache shared by all projects, so that importing the same file into
+#	another project doesn't need to decode it again.
+#
+#	The entries are named after a hash of the audio file's contents. Hashing
+#	a large file takes a while, so it is done on a thread of its own and the
+#	digest is remembered for as long as the file's size, modification time
+#	and inode stay the same.
+#
+#-------------------------------------------------------------------------------
+
+import os, hashlib, threading
+import gobject
+import Globals, LevelsList
+
+# the number of bytes hashed at a time
+READ_SIZE = 1024 * 1024
+
+# digests of the files hashed so far, keyed by their path and stat fingerprint
+_digests = {}
+
+#=========================================================================
+
+def Lookup(audioPath):
+	"""
+	Finds the cached levels of an audio file. This is quick enough for the
+	main thread, because the file is only looked up if it has been hashed
+	before. Otherwise use LookupInBackground().
+	
+	Parameters:
+		audioPath -- absolute path of the audio file.
+	
+	Returns:
+		a LevelsList holding the levels of the whole file, or None
+		if the file isn't in the cache or hasn't been hashed yet.
+	"""
+	cachePath = GetCachePath(audioPath)
+	if not cachePath or not os.path.exists(cachePath):
+		return None
+	
+	levels = LevelsList.LevelsList()
+	try:
+		# only the blocks which are drawn get read from the entry
+		levels.fromfile(cachePath, mapped=True)
+		# mark the entry as recently used
+		os.utime(cachePath, None)
+	except EnvironmentError, e:
+		Globals.debug("Cannot read cached levels", cachePath, e)
+		return None
+	
+	if not levels:
+		return None
+	
+	Globals.debug("Using cached levels for", audioPath)
+	return levels
+
+#_____________________________________________________________________
+
+def NeedsDigest(audioPath):
+	"""
+	Parameters:
+		audioPath -- absolute path of the audio file.
+	
+	Returns:
+		True if the cache is enabled and the file has to be hashed
+		before its levels can be looked up or stored.
+	"""
+	return GetMaxSize() > 0 and GetKnownDigest(audioPath) is None
+
+#_____________________________________________________________________
+
+def LookupInBackground(audioPath, callback, *args):
+	"""
+	Hashes an audio file on a thread of its own and then looks up its
+	levels in the cache.
+	
+	Parameters:
+		audioPath -- absolute path of the audio file.
+		callback -- function called in the main thread with the LevelsList
+				returned by Lookup() once the file has been hashed.
+		args -- any extra parameters to pass to callback.
+	"""
+	def Run():
+		GetFileDigest(audioPath)
+		gobject.idle_add(Finished)
+	
+	def Finished():
+		callback(Lookup(audioPath), *args)
+		return False
+	
+	thread = threading.Thread(target=Run)
+	thread.setDaemon(True)
+	thread.start()
+
+#_____________________________________________________________________
+
+def Store(audioPath, levels):
+	"""
+	Adds the levels of an audio file to the cache, removing the least
+	recently used entries if the cache has grown larger than its limit.
+	Nothing is stored if the file hasn't been hashed.
+	
+	Parameters:
+		audioPath -- absolute path of the audio file.
+		levels -- LevelsList holding the levels of the whole file.
+	"""
+	if not levels:
+		return
+	
+	cachePath = GetCachePath(audioPath)
+	if not cachePath:
+		return
+	
+	try:
+		levels.tofile(cachePath)
+	except EnvironmentError, e:
+		Globals.debug("Cannot write cached levels", cachePath, e)
+		return
+	
+	Trim(GetMaxSize())
+
+#_____________________________________________________________________
+
+def Trim(maxSize):
+	"""
+	Removes the least recently used entries until the
+	cache is no larger than maxSize.
+	
+	Parameters:
+		maxSize -- the largest total size of the cache in bytes.
+	"""
+	entries = []
+	total = 0
+	for filename in os.listdir(Globals.LEVELS_CACHE_PATH):
+		if not filename.endswith(".leveldata"):
+			continue
+		path = os.path.join(Globals.LEVELS_CACHE_PATH, filename)
+		try:
+			stat = os.stat(path)
+		except OSError:
+			continue
+		entries.append((stat.st_mtime, stat.st_size, path))
+		total += stat.st_size
+	
+	entries.sort()
+	for mtime, size, path in entries:
+		if total <= maxSize:
+			break
+		try:
+			os.remove(path)
+		except OSError, e:
+			Globals.debug("Cannot remove cached levels", path, e)
+			continue
+		total -= size
+
+#_____________________________________________________________________
+
+def GetMaxSize():
+	"""
+	Returns:
+		the size limit of the cache in bytes, from the user's settings.
+	"""
+	try:
+		return int(Globals.settings.general["levelscachesize"]) * 1024 * 1024
+	except (KeyError, ValueError):
+		return 0
+
+#_____________________________________________________________________
+
+def GetCachePath(audioPath):
+	"""
+	Parameters:
+		audioPath -- absolute path of the audio file.
+	
+	Returns:
+		the path of the cache entry for the audio file's contents, or None
+		if the cache is disabled or the file hasn't been hashed yet.
+	"""
+	if GetMaxSize() <= 0:
+		return None
+	
+	digest = GetKnownDigest(audioPath)
+	if not digest:
+		return None
+	return os.path.join(Globals.LEVELS_CACHE_PATH, digest + ".leveldata")
+
+#_____________________________________________________________________
+
+def GetKnownDigest(path):
+	"""
+	Parameters:
+		path -- absolute path of the file.
+	
+	Returns:
+		the digest returned by GetFileDigest(), or None if the file
+		hasn't been hashed since it last changed.
+	"""
+	key = GetFingerprint(path)
+	if key is None:
+		return None
+	return _digests.get(key)
+
+#_____________________________________________________________________
+
+def GetFingerprint(path):
+	"""
+	Parameters:
+		path -- absolute path of the file.
+	
+	Returns:
+		a tuple which changes whenever the file does, or None
+		if the file cannot be read.
+	"""
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return None
+	return (path, stat.st_size, stat.st_mtime, stat.st_ino)
+
+#_____________________________________________________________________
+
+def GetFileDigest(path):
+	"""
+	Hashes the contents of a file, so that copies of the same audio file
+	in different projects share one cache entry. The digest is remembered
+	until the file is changed. This reads the whole file, so it must not
+	be called from the main thread.
+	
+	Parameters:
+		path -- absolute path of the file.
+	
+	Returns:
+		the hexadecimal SHA-1 digest of the file, or None if it cannot be read.
+	"""
+	key = GetFingerprint(path)
+	if key is None:
+		return None
+	if key in _digests:
+		return _digests[key]
+	
+	sha = hashlib.sha1()
+	try:
+		file = open(path, "rb")
+		try:
+			data = file.read(READ_SIZE)
+			while data:
+				sha.update(data)
+				data = file.read(READ_SIZE)
+		finally:
+			file.close()
+	except IOError, e:
+		Globals.debug("Cannot hash", path, e)
+		return None
+	
+	_digests[key] = sha.hexdigest()
+	return _digests[key]
+
+#_____________________________________________________________________
@@ -3,49 +3,152 @@
 #	THE 'COPYING' FILE FOR DETAILS
 #
 #	LevelsList.py
-#	
+#
 #	This module contains the class which is responable for storing a list of
 #	all of the audio levels of each channel of audio along with the time of that
 #	level within the audio track. This data is used to draw the a graphical
 #	representation of the audio waveform for the user.
 #
+#	Version 2 levels files are laid out as follows, all little-endian:
+#		header -- LevelsList.HEADER, describing the time axis, the number
+#			of series and the audio file the levels were read from.
+#		blocks -- one per BLOCK_SIZE levels, each a BLOCK_HEADER followed by
+#			the (optionally zlib compressed) explicit times of the block, if
+#			any, and then each series as a 32-bit count and 16-bit levels
+#			in which runs of silence may be replaced by SILENCE_MARKER, count.
+#		index -- the 64-bit file offset of every block.
+#		footer -- LevelsList.FOOTER, giving the offset of the index.
+#
+#	Files which are still being written by a LevelsWriter have the
+#	FLAG_STREAMING header flag set and a header length of zero. Their
+#	length is counted from the blocks, and if the index was not written
+#	completely the blocks are found by reading them one after another.
+#
 #-------------------------------------------------------------------------------
 
-import Utils
-
 from array import array
 import itertools
 import sys
+import os
 import bisect
 import copy
+import operator
+import mmap
+import struct
+import zlib
+
+# the level stored for a signal at 0dB, silence is stored as 0
+MAX_LEVEL = 32767
+
+#=========================================================================
 
 class LevelsList:
+	"""
+	Stores the levels of an event along with the end time in milliseconds
+	of each of them. Several series of levels are kept for every end time.
+	The first series is the average RMS level of all the channels, which
+	is the one that gets drawn. It is followed by the peak and RMS level
+	of each channel in turn.
+	"""
+	
+	SIGNATURE = "JKLEVEL\n"	# version 1 files start with MAGIC_NUMBER instead
 	MAGIC_NUMBER = 0x00011011	# an integer with 4 unique bytes used to check endianness
-	VERSION = 1
-	ARRAY_TYPE = 'l'
+	VERSION = 2
+	V1_ARRAY_TYPE = 'l'
+	TIME_TYPE = 'l'
+	SERIES_TYPE = 'h'
+	
+	# signature, version, flags, interval, first endtime, last endtime, length,
+	# number of series, block size, audio file size, audio file modification time
+	HEADER = struct.Struct("<8sHHIqqQHHQd")
+	# magic, flags, number of levels, size of the payload in bytes
+	BLOCK_HEADER = struct.Struct("<4sHHI")
+	# offset of the block index, number of blocks, magic
+	FOOTER = struct.Struct("<QI4s")
+	BLOCK_MAGIC = "LVBK"
+	INDEX_MAGIC = "LVIX"
+	
+	FLAG_EXPLICIT_TIMES = 1		# header flag: each block stores its endtimes
+	FLAG_STREAMING = 2		# header flag: the file was not closed by its LevelsWriter
+	BLOCK_RLE = 1			# block flag: silent runs are run-length encoded
+	BLOCK_ZLIB = 2			# block flag: the payload is zlib compressed
+	
+	BLOCK_SIZE = 1024
+	SILENCE_MARKER = -32768
+	MIN_SILENT_RUN = 3
+	
+	# buckets in each page of the drawing pyramid, and pages kept per list
+	PYRAMID_PAGE_SIZE = 512
+	PYRAMID_PAGES = 16
+	
+	#_____________________________________________________________________
 	
 	def __init__(self):
-		self.channels = []
-		self.times = array(self.ARRAY_TYPE)
+		self.series = []
+		self.times = TimeAxis()
+		# (size, modification time) of the audio file these levels were read from
+		self.source = (0, 0.0)
+		# Decimated pages of the first series used for drawing, built as they
+		# are drawn. (level, page) -> (minimums, maximums, means, stop) for
+		# buckets of 2**level levels, where stop is the index after the last
+		# level the page was built from. Only the recently used are kept.
+		self.__pyramid = {}
+		self.__pyramid_order = []
+		# the file the levels are mapped from, or None if they have changed since
+		self.__mapped_path = None
 	
 	#_____________________________________________________________________
 	
-	def CreateChannels(self,  num_channels):
-		self.channels = []
-		for i in xrange(num_channels):
-			self.channels.append(array(self.ARRAY_TYPE))
+	def CreateSeries(self, num_series):
+		self.series = []
+		self.__pyramid = {}
+		self.__pyramid_order = []
+		self.__mapped_path = None
+		for i in xrange(num_series):
+			self.series.append(LevelSeries())
+	
+	#_____________________________________________________________________
+	
+	def IsMapped(self):
+		"""
+		Returns:
+			True if the levels are being read straight from a memory
+			mapped levels file and have not been changed since.
+		"""
+		return self.__mapped_path is not None
+	
+	#_____________________________________________________________________
+	
+	def IsValidFor(self, path):
+		"""
+		Checks whether these levels were generated from the current
+		contents of an audio file. Only files of the current format version
+		store the size and modification time of their audio file, so levels
+		converted from older files are never valid.
+		
+		Parameters:
+			path -- the audio file the levels should match.
+		
+		Returns:
+			True if the levels are not empty and the audio file
+			has not changed since they were generated.
+		"""
+		if not self.series or self.source == (0, 0.0):
+			return False
+		return self.source == FileFingerprint(path)
 	
 	#_____________________________________________________________________
 	
 	def copy(self):
 		levelslist = LevelsList()
 		levelslist.times = copy.copy(self.times)
-		levelslist.channels = []
-		for chan in self.channels:
-			levelslist.channels.append(copy.copy(chan))
-	
+		levelslist.series = []
+		for values in self.series:
+			levelslist.series.append(copy.copy(values))
+		levelslist.source = self.source
+		
 		return levelslist
-
+	
 	#_____________________________________________________________________
 	
 	def append(self, endtime, levels):
@@ -53,19 +156,20 @@ class LevelsList:
 		Append a set of waveforms to the current list,
 		and associates them with the given end time.
 		"""
-		if not self.channels:
-			self.CreateChannels(len(levels))
+		if not self.series:
+			self.CreateSeries(len(levels))
 		
-		assert len(self.channels) == len(levels)
+		assert len(self.series) == len(levels)
 		# make sure the endtime is greater than the previous endtime
 		# if this is the first endtime, make sure its bigger than 0
 		assert endtime > (self.times[-1] if self.times else 0)
 		
+		self.__mapped_path = None
 		self.times.append(endtime)
 		
-		for level,  chan in itertools.izip(levels,  self.channels):
-			chan.append(level)
-			assert len(self.times) == len(chan)
+		for level, values in itertools.izip(levels, self.series):
+			values.append(level)
+			assert len(self.times) == len(values)
 	
 	#_____________________________________________________________________
 	
@@ -74,44 +178,126 @@ class LevelsList:
 			last_time = self.times[-1]
 		else:
 			last_time = 0
-			
+		
 		self.append(last_time + time_delta, levels)
 	
 	#_____________________________________________________________________
 	
 	def extend(self, basetime, levelslist):
-		old_length = len(self.times)
-		self.times.extend(levelslist.times)
+		"""
+		Appends the levels of another list, sharing its arrays.
 		
+		Parameters:
+			basetime -- the time in milliseconds at which levelslist starts.
+			levelslist -- the LevelsList to append. Nothing is done if it
+					is empty, such as when its levels failed to load.
+		
+		Raises:
+			ValueError -- the lists have different numbers of series, and
+					neither of them was converted from a version 1 file.
+		"""
+		if not levelslist.series or not len(levelslist):
+			return
+		
+		if not self.series or not len(self):
+			self.CreateSeries(len(levelslist.series))
+		elif len(self.series) != len(levelslist.series) and min(len(self.series), len(levelslist.series)) != 1:
+			raise ValueError("cannot join levels with %d and %d series" % (len(self.series), len(levelslist.series)))
+		
+		self.__mapped_path = None
 		# shift the new endtimes to match the length of the original audio clip
-		for idx in xrange(old_length, len(self.times)):
-			time = self.times[idx]
-			self.times[idx] = time + basetime
+		self.times.extend(levelslist.times, basetime)
 		
-		assert len(self.channels) == len(levelslist.channels)
-		for chan, lchan in itertools.izip(self.channels, levelslist.channels):
-			chan.extend(lchan)
+		# levels converted from version 1 files only have the first series,
+		# so only keep the series which both lists have.
+		del self.series[len(levelslist.series):]
+		for values, lvalues in itertools.izip(self.series, levelslist.series):
+			values.extend(lvalues)
 	
 	
 	#_____________________________________________________________________
 	
-	def fromfile(self,  path):
+	def fromfile(self, path, mapped=False):
+		"""
+		Loads the levels from a file written by tofile(). Version 1
+		files are converted as they are read.
+		
+		Parameters:
+			path -- the levels file to load.
+			mapped -- if True, the file is memory mapped instead of being read
+					into memory. The list can be used straight away and each
+					block of levels is only decoded when it is accessed.
+					Slices of the list keep reading from the file, and any
+					levels appended later are kept in memory.
+		"""
 		try:
-			self.__fromfile(path)
-		except (EOFError, IOError):
+			if mapped:
+				self.__mapfile(path)
+			else:
+				self.__fromfile(path)
+		except (CorruptFileError, EOFError, IOError, ValueError, struct.error, zlib.error, mmap.error):
 			# on error delete all partially loaded data
-			self.channels = []
-			self.times = array(self.ARRAY_TYPE)
+			self.series = []
+			self.times = TimeAxis()
+			self.source = (0, 0.0)
+			self.__pyramid = {}
+			self.__pyramid_order = []
+			self.__mapped_path = None
 			raise CorruptFileError()
 	
 	#_____________________________________________________________________
 	
-	def __fromfile(self,  path):
-		f = open(path,  "rb")
-		info = array(self.ARRAY_TYPE)
-		info.fromfile(f,  4)
+	def __fromfile(self, path):
+		f = open(path, "rb")
+		data = f.read()
+		f.close()
+		
+		if not data.startswith(self.SIGNATURE):
+			self.__fromfileV1(path)
+			return
+		
+		reader = LevelsFileReader(data)
+		series = [array(self.SERIES_TYPE) for i in xrange(reader.num_series)]
+		for index in xrange(reader.num_blocks):
+			times, block = reader.DecodeBlock(index)
+			for values, block_values in itertools.izip(series, block):
+				values.extend(block_values)
+		
+		self.CreateSeries(0)
+		self.times = reader.ReadTimes()
+		self.series = [LevelSeries(values) for values in series]
+		self.source = reader.source
+	
+	#_____________________________________________________________________
+	
+	def __mapfile(self, path):
+		f = open(path, "rb")
+		try:
+			mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		finally:
+			# the mapping stays valid after the file is closed
+			f.close()
+		
+		if mapping[:len(self.SIGNATURE)] != self.SIGNATURE:
+			mapping.close()
+			self.__fromfileV1(path)
+			return
+		
+		reader = LevelsFileReader(mapping)
+		self.CreateSeries(0)
+		self.times = reader.ReadTimes()
+		self.series = [LevelSeries(BlockArray(reader, index)) for index in xrange(reader.num_series)]
+		self.source = reader.source
+		self.__mapped_path = os.path.abspath(path)
+	
+	#_____________________________________________________________________
+	
+	def __fromfileV1(self, path):
+		f = open(path, "rb")
+		info = array(self.V1_ARRAY_TYPE)
+		info.fromfile(f, 4)
 		
-		magic,  version,  length,  num_channels = info
+		magic, version, length, num_channels = info
 		
 		byteswap = False
 		if info[0] != self.MAGIC_NUMBER:
@@ -120,41 +306,124 @@ class LevelsList:
 				raise CorruptFileError("unknown endianness in levels file")
 			else:
 				byteswap = True
+				magic, version, length, num_channels = info
 		
-		#currently there is only one version
-		assert version == self.VERSION
+		if version != 1:
+			raise CorruptFileError("unknown levels file version %d" % version)
 		
-		self.times = array(self.ARRAY_TYPE)
-		self.times.fromfile(f,  length)
+		times = array(self.V1_ARRAY_TYPE)
+		times.fromfile(f, length)
 		if byteswap:
-			self.times.byteswap()
+			times.byteswap()
+		self.times = TimeAxis()
+		for endtime in times:
+			self.times.append(endtime)
 		
-		self.CreateChannels(num_channels)
-		for chan in self.channels:
-			chan.fromfile(f,  length)
+		# version 1 levels are scaled to sys.maxint instead of MAX_LEVEL
+		self.CreateSeries(0)
+		for i in xrange(num_channels):
+			chan = array(self.V1_ARRAY_TYPE)
+			chan.fromfile(f, length)
 			if byteswap:
-				self.times.byteswap()
-			assert len(self.times) == len(chan)
+				chan.byteswap()
+			values = array(self.SERIES_TYPE, [min(max(level * MAX_LEVEL // sys.maxint, 0), MAX_LEVEL) for level in chan])
+			self.series.append(LevelSeries(values))
+			assert len(self.times) == len(values)
+		f.close()
+	
+	#_____________________________________________________________________
+	
+	def tofile(self, path, compress=True):
+		"""
+		Writes the levels to the given file in the version 2 format. The
+		levels are written to a temporary file first and then moved into
+		place, so that a list which is mapped from the same file can still
+		be read while saving.
+		
+		Parameters:
+			path -- the file to write the levels to.
+			compress -- True to zlib compress each block when that makes
+					it smaller.
+		"""
+		if self.__mapped_path == os.path.abspath(path):
+			# nothing has changed since the file was mapped
+			return
+		
+		temp_path = path + "~"
+		f = open(temp_path, "wb")
+		try:
+			self.__WriteVersion2(f, compress)
+		finally:
+			f.close()
+		
+		try:
+			os.rename(temp_path, path)
+		except OSError:
+			# on Windows rename() will not replace an existing file
+			os.remove(path)
+			os.rename(temp_path, path)
 	
 	#_____________________________________________________________________
 	
-	def tofile(self,  path):
-		f = open(path,  "wb")
-		info = array(self.ARRAY_TYPE)
-		info.append(self.MAGIC_NUMBER)
-		info.append(self.VERSION)
-		info.append(len(self.times))
-		info.append(len(self.channels))
+	def __WriteVersion2(self, f, compress):
+		length = len(self.times)
+		interval = self.times.uniform_interval()
+		flags = 0
+		if interval is None:
+			interval = 0
+			flags |= self.FLAG_EXPLICIT_TIMES
+		
+		first = last = 0
+		if length:
+			first, last = self.times[0], self.times[-1]
+		
+		source_size, source_mtime = self.source
+		f.write(self.HEADER.pack(self.SIGNATURE, self.VERSION, flags, interval, first, last, length,
+		                         len(self.series), self.BLOCK_SIZE, source_size, source_mtime))
+		
+		offsets = []
+		for start in xrange(0, length, self.BLOCK_SIZE):
+			stop = min(start + self.BLOCK_SIZE, length)
+			offsets.append(f.tell())
+			f.write(self.__EncodeBlock(start, stop, flags & self.FLAG_EXPLICIT_TIMES, compress))
 		
-		info.tofile(f)
-		self.times.tofile(f)
-		for chan in self.channels:
-			chan.tofile(f)
+		index_offset = f.tell()
+		f.write(struct.pack("<%dQ" % len(offsets), *offsets))
+		f.write(self.FOOTER.pack(index_offset, len(offsets), self.INDEX_MAGIC))
+	
+	#_____________________________________________________________________
+	
+	def __EncodeBlock(self, start, stop, explicit_times, compress):
+		times = None
+		if explicit_times:
+			times = self.times[start:stop]
+		return EncodeBlock(times, [values[start:stop] for values in self.series], compress)
+	
+	#_____________________________________________________________________
+	
+	def MapHead(self, reader):
+		"""
+		Replaces the first levels of every series with the ones in a file
+		which is being written by a LevelsWriter, so that they are read
+		back from the file instead of being kept in memory.
+		
+		Parameters:
+			reader -- LevelsFileReader for the file, which must hold
+					the same levels as the start of this list.
+		"""
+		count = reader.length
+		series = []
+		for index, values in enumerate(self.series):
+			head = LevelSeries(BlockArray(reader, index))
+			# copy the rest, so the arrays holding the written levels can be freed
+			head.extend(LevelSeries(values[count:]))
+			series.append(head)
+		self.series = series
 	
 	#_____________________________________________________________________
 	
 	def find_endtime_index(self, time):
-		return bisect.bisect_left(self.times, time)
+		return self.times.find(time)
 	
 	#_____________________________________________________________________
 	
@@ -164,34 +433,213 @@ class LevelsList:
 		else:
 			assert starttime < stoptime
 			stop_idx = self.find_endtime_index(stoptime)
-			
+		
 		start_idx = self.find_endtime_index(starttime)
 		levelslist = LevelsList()
-		levelslist.times = self.times[start_idx:stop_idx]
-		
 		# adjust the endtimes so they are relative to the new start time.
-		for idx, time in enumerate(levelslist.times):
-			levelslist.times[idx] = time - starttime
+		levelslist.times = self.times.slice(start_idx, stop_idx, -starttime)
+		levelslist.source = self.source
 		
-		levelslist.channels = []
-		for chan in self.channels:
-			levelslist.channels.append(chan[start_idx:stop_idx])
+		levelslist.series = []
+		for values in self.series:
+			levelslist.series.append(values.slice(start_idx, stop_idx))
 		
 		return levelslist
 	
 	#_____________________________________________________________________
 	
+	def average_interval(self):
+		"""
+		Returns the average time in milliseconds between two levels.
+		"""
+		if len(self.times) > 1:
+			return (self.times[-1] - self.times[0]) / float(len(self.times) - 1)
+		elif self.times:
+			return float(self.times[0])
+		return 0.0
+	
+	#_____________________________________________________________________
+	
+	def pyramid_level_for(self, min_bucket_time):
+		"""
+		Finds the coarsest decimation whose buckets are still no longer
+		than min_bucket_time milliseconds.
+		
+		Parameters:
+			min_bucket_time -- the smallest span of time in milliseconds
+					that is worth drawing as a separate point.
+		
+		Returns:
+			the pyramid level to pass to iter_pyramid(). Level 0 is the
+			undecimated list, level k averages 2**k levels per bucket.
+		"""
+		interval = self.average_interval()
+		level = 0
+		if interval <= 0:
+			return level
+		
+		while (2 << level) * interval <= min_bucket_time and (1 << level) < len(self.times):
+			level += 1
+		return level
+	
+	#_____________________________________________________________________
+	
+	def iter_pyramid(self, level, start_index=0):
+		"""
+		Iterates over the first series at the given decimation level.
+		
+		Parameters:
+			level -- the pyramid level as returned by pyramid_level_for().
+			start_index -- index into the undecimated list to start from.
+				Iteration begins with the bucket which contains this index.
+		
+		Returns:
+			an iterator of (endtime, minimum, maximum, mean) tuples, where
+			endtime is the endtime of the last level in the bucket.
+		"""
+		if not self.series:
+			return iter([])
+		
+		if level == 0:
+			values = self.series[0]
+			return itertools.izip(itertools.islice(self.times, start_index, None),
+			                      values.iter_from(start_index),
+			                      values.iter_from(start_index),
+			                      values.iter_from(start_index))
+		
+		return self.__IterPyramid(level, start_index)
+	
+	#_____________________________________________________________________
+	
+	def __IterPyramid(self, level, start_index):
+		"""
+		Generator behind iter_pyramid() for the decimated levels. The
+		pages of buckets are only built when the iteration reaches them,
+		so a drawing which stops early never reads the rest of the list.
+		"""
+		length = len(self.series[0])
+		last = len(self.times) - 1
+		num_buckets = (length + (1 << level) - 1) >> level
+		bucket = start_index >> level
+		
+		while bucket < num_buckets:
+			page, offset = divmod(bucket, self.PYRAMID_PAGE_SIZE)
+			mins, maxs, means = self.__GetPyramidPage(level, page)
+			for index in xrange(offset, len(means)):
+				endtime = self.times[min(((bucket + 1) << level) - 1, last)]
+				yield (endtime, mins[index], maxs[index], means[index])
+				bucket += 1
+	
+	#_____________________________________________________________________
+	
+	def __PyramidPageRange(self, level, page):
+		"""
+		Returns:
+			the (start, stop) indexes of the levels of the first series
+			which are covered by a page of the pyramid.
+		"""
+		size = self.PYRAMID_PAGE_SIZE << level
+		start = page * size
+		return start, min(start + size, len(self.series[0]))
+	
+	#_____________________________________________________________________
+	
+	def __GetCachedPyramidPage(self, level, page):
+		"""
+		Returns:
+			the cached (minimums, maximums, means) of a page of the
+			pyramid, or None if it isn't cached or levels have been
+			appended to it since it was built.
+		"""
+		key = (level, page)
+		entry = self.__pyramid.get(key)
+		if entry is None:
+			return None
+		if entry[3] != self.__PyramidPageRange(level, page)[1]:
+			del self.__pyramid[key]
+			self.__pyramid_order.remove(key)
+			return None
+		
+		self.__pyramid_order.remove(key)
+		self.__pyramid_order.append(key)
+		return entry[:3]
+	
+	#_____________________________________________________________________
+	
+	def __GetPyramidPage(self, level, page):
+		"""
+		Finds a page of PYRAMID_PAGE_SIZE buckets of 2**level levels each,
+		building it if it isn't cached. A page is built from the two pages
+		below it if they are cached, which is usually the case after zooming
+		out. Otherwise only the levels it covers are read from the series,
+		so a memory mapped list only decodes the blocks in that range.
+		
+		Returns:
+			a (minimums, maximums, means) tuple of arrays.
+		"""
+		cached = self.__GetCachedPyramidPage(level, page)
+		if cached:
+			return cached
+		
+		start, stop = self.__PyramidPageRange(level, page)
+		mins, maxs, means = array(self.SERIES_TYPE), array(self.SERIES_TYPE), array(self.SERIES_TYPE)
+		
+		finer = None
+		if level > 1:
+			finer = [self.__GetCachedPyramidPage(level - 1, page * 2)]
+			if self.__PyramidPageRange(level - 1, page * 2 + 1)[0] < stop:
+				finer.append(self.__GetCachedPyramidPage(level - 1, page * 2 + 1))
+			if None in finer:
+				finer = None
+		
+		if finer:
+			fine_mins, fine_maxs, fine_means = [array(self.SERIES_TYPE) for i in xrange(3)]
+			for page_mins, page_maxs, page_means in finer:
+				fine_mins.extend(page_mins)
+				fine_maxs.extend(page_maxs)
+				fine_means.extend(page_means)
+			
+			length = len(fine_means)
+			for idx in xrange(0, length, 2):
+				if idx + 1 < length:
+					mins.append(min(fine_mins[idx], fine_mins[idx + 1]))
+					maxs.append(max(fine_maxs[idx], fine_maxs[idx + 1]))
+					means.append((fine_means[idx] + fine_means[idx + 1]) / 2)
+				else:
+					mins.append(fine_mins[idx])
+					maxs.append(fine_maxs[idx])
+					means.append(fine_means[idx])
+		else:
+			source = self.series[0]
+			bucket = 1 << level
+			# read whole buckets at a time, a piece of the series at once
+			piece = bucket * max(LevelSeries.PIECE_SIZE // bucket, 1)
+			for pos in xrange(start, stop, piece):
+				values = source[pos:min(pos + piece, stop)]
+				for idx in xrange(0, len(values), bucket):
+					chunk = values[idx:idx + bucket]
+					mins.append(min(chunk))
+					maxs.append(max(chunk))
+					means.append(sum(chunk) // len(chunk))
+		
+		key = (level, page)
+		self.__pyramid[key] = (mins, maxs, means, stop)
+		self.__pyramid_order.append(key)
+		if len(self.__pyramid_order) > self.PYRAMID_PAGES:
+			del self.__pyramid[self.__pyramid_order.pop(0)]
+		return mins, maxs, means
+	
+	#_____________________________________________________________________
+	
 	def __iter__(self):
-		# FIXME: hard coded single channel
-		if not self.channels:
-			self.CreateChannels(1)
-		return itertools.izip(self.times,  self.channels[0])
+		if not self.series:
+			self.CreateSeries(1)
+		return itertools.izip(self.times, self.series[0])
 	
 	#_____________________________________________________________________
 	
 	def __getitem__(self, index):
-		# FIXME: hard coded single channel
-		return (self.times[index], self.channels[0][index])
+		return (self.times[index], self.series[0][index])
 	
 	#_____________________________________________________________________
 	
@@ -201,15 +649,979 @@ class LevelsList:
 
 #=========================================================================
 
-def add(list_one, list_two):
+def add(list_one, list_two, basetime):
+	"""
+	Joins two lists of levels.
+	
+	Parameters:
+		list_one -- the LevelsList to start with.
+		list_two -- the LevelsList to follow it.
+		basetime -- the time in milliseconds at which list_two starts.
+	
+	Returns:
+		a new LevelsList sharing the levels of the other two.
+	"""
 	levelslist = list_one.copy()
-	levelslist.extend(list_two)
+	levelslist.extend(basetime, list_two)
 	return levelslist
 
 #=========================================================================
+
+def FileFingerprint(path):
+	"""
+	Cheaply identifies the current contents of a file.
+	
+	Parameters:
+		path -- the file to identify.
+	
+	Returns:
+		a (size, modification time) tuple, or (0, 0.0) if the file
+		cannot be read.
+	"""
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return (0, 0.0)
+	return (stat.st_size, stat.st_mtime)
+
+#=========================================================================
+
+def EncodeSilence(values):
+	"""
+	Replaces each run of at least LevelsList.MIN_SILENT_RUN silent levels
+	with LevelsList.SILENCE_MARKER followed by the length of the run.
+	
+	Parameters:
+		values -- array of levels.
+	
+	Returns:
+		the encoded array.
+	"""
+	encoded = array(LevelsList.SERIES_TYPE)
+	for loud, run in itertools.groupby(values, bool):
+		if loud:
+			encoded.extend(run)
+			continue
+		
+		count = sum(1 for level in run)
+		if count < LevelsList.MIN_SILENT_RUN:
+			encoded.extend([0] * count)
+			continue
+		
+		while count:
+			run_length = min(count, MAX_LEVEL)
+			encoded.append(LevelsList.SILENCE_MARKER)
+			encoded.append(run_length)
+			count -= run_length
+	
+	return encoded
+
+#_____________________________________________________________________
+
+def DecodeSilence(encoded):
+	"""
+	Reverses EncodeSilence().
 	
+	Parameters:
+		encoded -- array of levels written by EncodeSilence().
+	
+	Returns:
+		the decoded array.
+	"""
+	marker = LevelsList.SILENCE_MARKER
+	if marker not in encoded:
+		return encoded
+	
+	values = array(LevelsList.SERIES_TYPE)
+	levels = encoded.tolist()
+	start = 0
+	while True:
+		try:
+			idx = levels.index(marker, start)
+		except ValueError:
+			values.extend(encoded[start:])
+			return values
+		values.extend(encoded[start:idx])
+		values.extend(array(LevelsList.SERIES_TYPE, [0]) * levels[idx + 1])
+		start = idx + 2
+
+#_____________________________________________________________________
+
+def ToLittleEndian(values):
+	"""
+	Returns:
+		the contents of the given array as a little-endian string.
+	"""
+	if sys.byteorder == "big":
+		values = copy.copy(values)
+		values.byteswap()
+	return values.tostring()
+
+#_____________________________________________________________________
+
+def FromLittleEndian(typecode, data):
+	"""
+	Returns:
+		an array of the given type read from a little-endian string.
+	"""
+	values = array(typecode)
+	values.fromstring(data)
+	if sys.byteorder == "big":
+		values.byteswap()
+	return values
+
+#_____________________________________________________________________
+
+def EncodeBlock(times, series, compress):
+	"""
+	Encodes one block of a version 2 levels file.
+	
+	Parameters:
+		times -- the endtimes of the levels in the block, or None
+				if the file does not store them.
+		series -- list with an array of levels for each series.
+		compress -- True to zlib compress the block when that makes it smaller.
+	
+	Returns:
+		the block, including its header, as a string.
+	"""
+	parts = []
+	if times is not None:
+		parts.append(ToLittleEndian(array('i', times)))
+	
+	for values in series:
+		encoded = EncodeSilence(values)
+		parts.append(struct.pack("<I", len(encoded)))
+		parts.append(ToLittleEndian(encoded))
+	
+	flags = LevelsList.BLOCK_RLE
+	payload = "".join(parts)
+	if compress:
+		compressed = zlib.compress(payload)
+		if len(compressed) < len(payload):
+			payload = compressed
+			flags |= LevelsList.BLOCK_ZLIB
+	
+	return LevelsList.BLOCK_HEADER.pack(LevelsList.BLOCK_MAGIC, flags, len(series[0]), len(payload)) + payload
+
+#_____________________________________________________________________
+
+def PartialPath(path):
+	"""
+	Returns:
+		the path of the file a LevelsWriter streams levels to while they are
+		being generated for the levels file at path.
+	"""
+	return path + ".part"
+
+#=========================================================================
+
 class CorruptFileError(EnvironmentError):
 	pass
 
 #=========================================================================
 
+class LevelSeries:
+	"""
+	One series of levels in a LevelsList. It is made up of slices of arrays
+	which may be shared with other series, so slicing and joining only copy
+	the list of slices and splitting an event does not copy its levels.
+	The shared arrays are only ever appended to, and only by a series which
+	ends where the array does, so no series ever sees another one change.
+	"""
+	
+	# number of levels converted at a time while iterating
+	PIECE_SIZE = 4096
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, values=None):
+		"""
+		Creates a new instance of LevelSeries.
+		
+		Parameters:
+			values -- array or BlockArray holding the initial levels.
+		"""
+		# each chunk is a [values, start, stop] list
+		self.__chunks = []
+		self.__starts = []	# index of the first level of each chunk
+		self.__length = 0
+		if values is not None and len(values):
+			self.__chunks.append([values, 0, len(values)])
+			self.__Reindex()
+	
+	#_____________________________________________________________________
+	
+	def __Reindex(self):
+		self.__starts = []
+		length = 0
+		for values, start, stop in self.__chunks:
+			self.__starts.append(length)
+			length += stop - start
+		self.__length = length
+	
+	#_____________________________________________________________________
+	
+	def append(self, level):
+		if self.__chunks:
+			chunk = self.__chunks[-1]
+			values, start, stop = chunk
+			if isinstance(values, array) and stop == len(values):
+				values.append(level)
+				chunk[2] += 1
+				self.__length += 1
+				return
+		
+		# the last array is read-only or is being appended to by another series
+		self.__chunks.append([array(LevelsList.SERIES_TYPE, [level]), 0, 1])
+		self.__starts.append(self.__length)
+		self.__length += 1
+	
+	#_____________________________________________________________________
+	
+	def extend(self, series):
+		"""
+		Appends the levels of another LevelSeries, sharing its arrays.
+		"""
+		for values, start, stop in series.__chunks:
+			last = self.__chunks and self.__chunks[-1]
+			if last and last[0] is values and last[2] == start:
+				# rejoining two halves of the same array
+				last[2] = stop
+			else:
+				self.__chunks.append([values, start, stop])
+		self.__Reindex()
+	
+	#_____________________________________________________________________
+	
+	def slice(self, start, stop):
+		"""
+		Creates a new series from part of this one, sharing its arrays.
+		
+		Parameters:
+			start -- index of the first level to include.
+			stop -- index after the last level to include.
+		
+		Returns:
+			the new LevelSeries.
+		"""
+		series = LevelSeries()
+		for (values, chunk_start, chunk_stop), offset in itertools.izip(self.__chunks, self.__starts):
+			first = chunk_start + max(start - offset, 0)
+			last = min(chunk_start + stop - offset, chunk_stop)
+			if first < last:
+				series.__chunks.append([values, first, last])
+		series.__Reindex()
+		return series
+	
+	#_____________________________________________________________________
+	
+	def __Pieces(self, start):
+		for (values, chunk_start, chunk_stop), offset in itertools.izip(self.__chunks, self.__starts):
+			first = chunk_start + max(start - offset, 0)
+			for piece in xrange(first, chunk_stop, self.PIECE_SIZE):
+				yield values[piece:min(piece + self.PIECE_SIZE, chunk_stop)]
+	
+	#_____________________________________________________________________
+	
+	def iter_from(self, start):
+		"""
+		Returns:
+			an iterator over the levels from index start onwards.
+		"""
+		return itertools.chain.from_iterable(self.__Pieces(start))
+	
+	#_____________________________________________________________________
+	
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			start, stop, step = index.indices(self.__length)
+			values = array(LevelsList.SERIES_TYPE)
+			for chunk_values, chunk_start, chunk_stop in self.slice(start, stop).__chunks:
+				values.extend(chunk_values[chunk_start:chunk_stop])
+			if step != 1:
+				values = values[::step]
+			return values
+		
+		if index < 0:
+			index += self.__length
+		if not 0 <= index < self.__length:
+			raise IndexError("LevelSeries index out of range")
+		
+		chunk = bisect.bisect_right(self.__starts, index) - 1
+		values, start, stop = self.__chunks[chunk]
+		return values[start + index - self.__starts[chunk]]
+	
+	#_____________________________________________________________________
+	
+	def __iter__(self):
+		return self.iter_from(0)
+	
+	#_____________________________________________________________________
+	
+	def __copy__(self):
+		return self.slice(0, self.__length)
+	
+	#_____________________________________________________________________
+	
+	def __len__(self):
+		return self.__length
+	
+	#_____________________________________________________________________
+
+#=========================================================================
+
+class TimeAxis:
+	"""
+	The endtimes of a LevelsList. Levels normally arrive at a fixed interval,
+	so each run of evenly spaced endtimes is stored as just its first endtime,
+	interval and length. Irregular stretches, such as those appended with
+	LevelsList.append_time_delta(), are kept in an array instead. Shifting,
+	slicing and joining only touch the runs, never the individual endtimes.
+	"""
+	
+	# evenly spaced endtimes needed at the end of an irregular stretch
+	# before they are moved into a run of their own
+	MIN_UNIFORM_RUN = 16
+	
+	#_____________________________________________________________________
+	
+	def __init__(self):
+		# Each segment is a [base, interval, count, times, offset] list. Endtime i
+		# of a segment is base + i * interval if times is None, otherwise it is
+		# base + times[offset + i]. The times arrays may be shared between axes,
+		# but each axis only ever appends to one it is using the end of.
+		self.__segments = []
+		self.__starts = []	# index of the first endtime of each segment
+		self.__firsts = []	# first endtime of each segment
+		self.__length = 0
+	
+	#_____________________________________________________________________
+	
+	def __Reindex(self):
+		self.__starts = []
+		self.__firsts = []
+		length = 0
+		for base, interval, count, times, offset in self.__segments:
+			self.__starts.append(length)
+			if times is None:
+				self.__firsts.append(base)
+			else:
+				self.__firsts.append(base + times[offset])
+			length += count
+		self.__length = length
+	
+	#_____________________________________________________________________
+	
+	def append(self, endtime):
+		"""
+		Adds an endtime, which must be later than the last one.
+		"""
+		if not self.__segments:
+			self.append_run(endtime, 0, 1)
+			return
+		
+		segment = self.__segments[-1]
+		base, interval, count, times, offset = segment
+		if times is None:
+			if count == 1 or endtime == base + count * interval:
+				segment[1] = endtime - base if count == 1 else interval
+				segment[2] += 1
+				self.__length += 1
+				return
+			elif count > 2:
+				self.append_run(endtime, 0, 1)
+				return
+			
+			# two endtimes do not make a run, so start an irregular stretch
+			times = array(LevelsList.TIME_TYPE, [0, interval])
+			segment[1:] = [0, 2, times, 0]
+		
+		elif offset + count != len(times):
+			# the array has been appended to through another axis
+			times = times[offset:offset + count]
+			segment[3:] = [times, 0]
+		
+		times.append(endtime - base)
+		segment[2] += 1
+		self.__length += 1
+		self.__SplitUniformTail()
+	
+	#_____________________________________________________________________
+	
+	def __SplitUniformTail(self):
+		"""
+		Moves the end of an irregular stretch into a run of its own
+		once enough evenly spaced endtimes have been appended to it.
+		"""
+		segment = self.__segments[-1]
+		base, interval, count, times, offset = segment
+		run = self.MIN_UNIFORM_RUN
+		if count < run:
+			return
+		
+		tail = times[offset + count - run:offset + count]
+		interval = tail[1] - tail[0]
+		if interval <= 0 or tail != array(LevelsList.TIME_TYPE, xrange(tail[0], tail[0] + run * interval, interval)):
+			return
+		
+		if count == run:
+			del self.__segments[-1]
+		else:
+			segment[2] -= run
+		self.__segments.append([base + tail[0], interval, run, None, 0])
+		self.__Reindex()
+	
+	#_____________________________________________________________________
+	
+	def append_run(self, first, interval, count):
+		"""
+		Adds count evenly spaced endtimes.
+		
+		Parameters:
+			first -- the first endtime to add.
+			interval -- time between consecutive endtimes.
+			count -- number of endtimes to add.
+		"""
+		if count > 0:
+			if count == 1:
+				interval = 0
+			self.__segments.append([first, interval, count, None, 0])
+			self.__starts.append(self.__length)
+			self.__firsts.append(first)
+			self.__length += count
+	
+	#_____________________________________________________________________
+	
+	def extend(self, axis, shift):
+		"""
+		Appends the endtimes of another axis, moved later by shift
+		milliseconds. The irregular stretches are shared, not copied.
+		"""
+		for base, interval, count, times, offset in axis.__segments:
+			last = self.__segments and self.__segments[-1]
+			if last and times is None and last[3] is None and last[2] > 1 \
+					and last[1] == interval and base + shift == last[0] + last[2] * interval:
+				# the runs line up, as they do when joining two halves of a split
+				last[2] += count
+			else:
+				self.__segments.append([base + shift, interval, count, times, offset])
+		self.__Reindex()
+	
+	#_____________________________________________________________________
+	
+	def slice(self, start, stop, shift=0):
+		"""
+		Creates a new axis from part of this one.
+		
+		Parameters:
+			start -- index of the first endtime to include.
+			stop -- index after the last endtime to include.
+			shift -- milliseconds to add to each endtime.
+		
+		Returns:
+			the new TimeAxis, which shares any irregular stretches with this one.
+		"""
+		axis = TimeAxis()
+		for (base, interval, count, times, offset), seg_start in itertools.izip(self.__segments, self.__starts):
+			first = max(start - seg_start, 0)
+			last = min(stop - seg_start, count)
+			if first >= last:
+				continue
+			
+			if times is None:
+				axis.__segments.append([base + first * interval + shift, (last - first > 1) and interval or 0, last - first, None, 0])
+			else:
+				axis.__segments.append([base + shift, 0, last - first, times, offset + first])
+		
+		axis.__Reindex()
+		return axis
+	
+	#_____________________________________________________________________
+	
+	def find(self, time):
+		"""
+		Finds where an endtime would be inserted, as bisect.bisect_left() does.
+		
+		Returns:
+			the index of the first endtime which is not earlier than time.
+		"""
+		index = bisect.bisect_left(self.__firsts, time) - 1
+		if index < 0:
+			return 0
+		
+		base, interval, count, times, offset = self.__segments[index]
+		if times is None:
+			# the first endtime is earlier than time, so at least one is skipped
+			if count == 1:
+				skip = 1
+			else:
+				skip = -(-(time - base) // interval)
+			return self.__starts[index] + min(skip, count)
+		return self.__starts[index] + bisect.bisect_left(times, time - base, offset, offset + count) - offset
+	
+	#_____________________________________________________________________
+	
+	def uniform_interval(self):
+		"""
+		Checks whether every endtime but the last is the same interval
+		after the one before it, as is usually the case because the last
+		level covers less time than the others.
+		
+		Returns:
+			the interval in milliseconds, or None if the endtimes are not
+			evenly spaced.
+		"""
+		if self.__length < 2:
+			return 0
+		elif self.__length == 2:
+			return self[1] - self[0]
+		
+		segments = self.__segments
+		if segments[0][3] is None:
+			if len(segments) == 1 or (len(segments) == 2 and segments[1][2] == 1):
+				return segments[0][1]
+		
+		first = self[0]
+		interval = self[1] - first
+		if interval > 0 and self[:-1] == array(LevelsList.TIME_TYPE, xrange(first, first + (self.__length - 1) * interval, interval)):
+			return interval
+		return None
+	
+	#_____________________________________________________________________
+	
+	def __SegmentTimes(self, segment, first, last):
+		base, interval, count, times, offset = segment
+		if times is None:
+			if last - first == 1:
+				return [base + first * interval]
+			return xrange(base + first * interval, base + last * interval, interval)
+		elif base:
+			return itertools.imap(operator.add, itertools.repeat(base), itertools.islice(times, offset + first, offset + last))
+		return itertools.islice(times, offset + first, offset + last)
+	
+	#_____________________________________________________________________
+	
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			start, stop, step = index.indices(self.__length)
+			values = array(LevelsList.TIME_TYPE)
+			for segment, seg_start in itertools.izip(self.__segments, self.__starts):
+				first = max(start - seg_start, 0)
+				last = min(stop - seg_start, segment[2])
+				if first < last:
+					values.extend(self.__SegmentTimes(segment, first, last))
+			if step != 1:
+				values = values[::step]
+			return values
+		
+		if index < 0:
+			index += self.__length
+		if not 0 <= index < self.__length:
+			raise IndexError("TimeAxis index out of range")
+		
+		seg = bisect.bisect_right(self.__starts, index) - 1
+		base, interval, count, times, offset = self.__segments[seg]
+		index -= self.__starts[seg]
+		if times is None:
+			return base + index * interval
+		return base + times[offset + index]
+	
+	#_____________________________________________________________________
+	
+	def __iter__(self):
+		return itertools.chain(*[self.__SegmentTimes(segment, 0, segment[2]) for segment in self.__segments])
+	
+	#_____________________________________________________________________
+	
+	def __copy__(self):
+		return self.slice(0, self.__length)
+	
+	#_____________________________________________________________________
+	
+	def __len__(self):
+		return self.__length
+	
+	#_____________________________________________________________________
+
+#=========================================================================
+
+class LevelsFileReader:
+	"""
+	Reads the blocks of a version 2 levels file. Any block can be found
+	from the index at the end of the file, so decoding a range of levels
+	only touches the blocks which contain it.
+	"""
+	
+	# number of decoded blocks to keep around
+	CACHE_BLOCKS = 8
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, data):
+		"""
+		Creates a new instance of LevelsFileReader.
+		
+		Parameters:
+			data -- the contents of the file, as a string or an mmap object.
+		"""
+		self.data = data
+		(signature, version, flags, self.interval, self.first, self.last, self.length,
+		 self.num_series, self.block_size, source_size, source_mtime) = LevelsList.HEADER.unpack_from(data, 0)
+		
+		if signature != LevelsList.SIGNATURE or version != LevelsList.VERSION:
+			raise CorruptFileError("unknown levels file version")
+		self.explicit_times = bool(flags & LevelsList.FLAG_EXPLICIT_TIMES)
+		self.streaming = bool(flags & LevelsList.FLAG_STREAMING)
+		self.source = (source_size, source_mtime)
+		
+		self.__cache = {}
+		self.__cache_order = []
+		
+		try:
+			self.__ReadIndex()
+		except (CorruptFileError, struct.error):
+			if not self.streaming:
+				raise
+			# the file was being written when Jokosher stopped
+			self.__ScanBlocks()
+	
+	#_____________________________________________________________________
+	
+	def __ReadIndex(self):
+		"""
+		Reads the block offsets from the index at the end of the file.
+		"""
+		data = self.data
+		index_offset, num_blocks, magic = LevelsList.FOOTER.unpack_from(data, len(data) - LevelsList.FOOTER.size)
+		if magic != LevelsList.INDEX_MAGIC:
+			raise CorruptFileError("levels file has no block index")
+		offsets = struct.unpack_from("<%dQ" % num_blocks, data, index_offset)
+		
+		counts = []
+		for offset in offsets:
+			magic, block_flags, count, size = LevelsList.BLOCK_HEADER.unpack_from(data, offset)
+			if magic != LevelsList.BLOCK_MAGIC or offset + LevelsList.BLOCK_HEADER.size + size > len(data):
+				raise CorruptFileError("bad block in levels file")
+			counts.append(count)
+		
+		if self.streaming:
+			self.length = sum(counts)
+		self.num_blocks = len(offsets)
+		if self.num_blocks != -(-self.length // self.block_size):
+			raise CorruptFileError("levels file index does not match its length")
+		for index, count in enumerate(counts):
+			if count != self.BlockLength(index):
+				raise CorruptFileError("bad block in levels file")
+		
+		self.offsets = offsets
+	
+	#_____________________________________________________________________
+	
+	def __ScanBlocks(self):
+		"""
+		Finds the blocks of a file which was never closed by reading them
+		one after another, up to the first one that is incomplete.
+		"""
+		data = self.data
+		self.offsets = []
+		self.length = self.num_blocks = 0
+		
+		offset = LevelsList.HEADER.size
+		while offset + LevelsList.BLOCK_HEADER.size <= len(data):
+			magic, block_flags, count, size = LevelsList.BLOCK_HEADER.unpack_from(data, offset)
+			# only complete blocks are written before the file is closed
+			if magic != LevelsList.BLOCK_MAGIC or count != self.block_size:
+				break
+			if offset + LevelsList.BLOCK_HEADER.size + size > len(data):
+				break
+			
+			self.offsets.append(offset)
+			self.length += count
+			self.num_blocks += 1
+			try:
+				self.DecodeBlock(self.num_blocks - 1)
+			except (CorruptFileError, struct.error, zlib.error):
+				# the block was only partly written
+				self.offsets.pop()
+				self.length -= count
+				self.num_blocks -= 1
+				break
+			offset += LevelsList.BLOCK_HEADER.size + size
+	
+	#_____________________________________________________________________
+	
+	def BlockLength(self, index):
+		"""
+		Returns:
+			the number of levels in the block with the given index.
+		"""
+		return min(self.block_size, self.length - index * self.block_size)
+	
+	#_____________________________________________________________________
+	
+	def ReadTimes(self):
+		"""
+		Returns:
+			a TimeAxis with all the endtimes in the file.
+		"""
+		times = TimeAxis()
+		if self.explicit_times:
+			for index in xrange(self.num_blocks):
+				for endtime in self.DecodeBlock(index)[0]:
+					times.append(endtime)
+		elif self.length:
+			times.append_run(self.first, self.interval, self.length - 1)
+			times.append(self.last)
+		return times
+	
+	#_____________________________________________________________________
+	
+	def GetBlock(self, index):
+		"""
+		Same as DecodeBlock(), but recently used blocks are cached.
+		"""
+		block = self.__cache.get(index)
+		if block is None:
+			block = self.DecodeBlock(index)
+			self.__cache[index] = block
+			self.__cache_order.append(index)
+			if len(self.__cache_order) > self.CACHE_BLOCKS:
+				del self.__cache[self.__cache_order.pop(0)]
+		return block
+	
+	#_____________________________________________________________________
+	
+	def DecodeBlock(self, index):
+		"""
+		Reads one block of levels from the file.
+		
+		Parameters:
+			index -- the index of the block to read.
+		
+		Returns:
+			a (times, series) tuple, where times is an array of the endtimes
+			in the block, or None if the file does not store them, and series
+			is a list with an array of levels for each series.
+		"""
+		offset = self.offsets[index]
+		magic, flags, count, size = LevelsList.BLOCK_HEADER.unpack_from(self.data, offset)
+		offset += LevelsList.BLOCK_HEADER.size
+		payload = self.data[offset:offset + size]
+		if flags & LevelsList.BLOCK_ZLIB:
+			payload = zlib.decompress(payload)
+		
+		pos = 0
+		times = None
+		if self.explicit_times:
+			times = FromLittleEndian('i', payload[:count * 4])
+			pos = count * 4
+		
+		series = []
+		for i in xrange(self.num_series):
+			(encoded_length,) = struct.unpack_from("<I", payload, pos)
+			pos += 4
+			values = FromLittleEndian(LevelsList.SERIES_TYPE, payload[pos:pos + encoded_length * 2])
+			pos += encoded_length * 2
+			if flags & LevelsList.BLOCK_RLE:
+				values = DecodeSilence(values)
+			if len(values) != count:
+				raise CorruptFileError("bad block in levels file")
+			series.append(values)
+		
+		return (times, series)
+	
+	#_____________________________________________________________________
+
+#=========================================================================
+
+class BlockArray:
+	"""
+	A read-only sequence of the levels of one series in a version 2 levels
+	file. It supports the parts of the array interface that LevelsList uses
+	for reading, so a mapped LevelsList can be drawn, searched and sliced
+	while only decoding the blocks that are actually used.
+	"""
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, reader, series_index):
+		"""
+		Creates a new instance of BlockArray.
+		
+		Parameters:
+			reader -- the LevelsFileReader for the file.
+			series_index -- index of the series in the file.
+		"""
+		self.reader = reader
+		self.series_index = series_index
+	
+	#_____________________________________________________________________
+	
+	def __len__(self):
+		return self.reader.length
+	
+	#_____________________________________________________________________
+	
+	def __getitem__(self, index):
+		block_size = self.reader.block_size
+		if isinstance(index, slice):
+			start, stop, step = index.indices(self.reader.length)
+			values = array(LevelsList.SERIES_TYPE)
+			while start < stop:
+				block, offset = divmod(start, block_size)
+				block_values = self.reader.GetBlock(block)[1][self.series_index]
+				end = min(len(block_values), offset + stop - start)
+				values.extend(block_values[offset:end])
+				start += end - offset
+			if step != 1:
+				values = values[::step]
+			return values
+		
+		if index < 0:
+			index += self.reader.length
+		if not 0 <= index < self.reader.length:
+			raise IndexError("BlockArray index out of range")
+		block, offset = divmod(index, block_size)
+		return self.reader.GetBlock(block)[1][self.series_index][offset]
+	
+	#_____________________________________________________________________
+	
+	def __iter__(self):
+		for block in xrange(self.reader.num_blocks):
+			for level in self.reader.GetBlock(block)[1][self.series_index]:
+				yield level
+	
+	#_____________________________________________________________________
+	
+	def __copy__(self):
+		# the data is read-only so copies can share it
+		return self
+	
+	#_____________________________________________________________________
+
+#=========================================================================
+
+class LevelsWriter:
+	"""
+	Streams the levels of a LevelsList to a version 2 levels file while they
+	are being generated. Every complete block is appended to the file as soon
+	as it is filled, followed by a new block index, and is then read back
+	from the file instead of being kept in memory. If Jokosher stops before
+	the file is closed, the levels written so far can still be loaded.
+	"""
+	
+	# levels per block, fewer than LevelsList.BLOCK_SIZE so that
+	# not much is lost when the file is never closed
+	BLOCK_SIZE = 128
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, levelslist, path):
+		"""
+		Creates a new instance of LevelsWriter. The file is
+		not created until there is a complete block to write.
+		
+		Parameters:
+			levelslist -- the LevelsList the levels are appended to.
+			path -- the file to write the levels to.
+		"""
+		self.levelslist = levelslist
+		self.path = path
+		self.file = None
+		self.offsets = []		# file offset of every block written
+		self.length = 0			# number of levels written
+		self.index_offset = 0		# file offset of the block index
+	
+	#_____________________________________________________________________
+	
+	def Flush(self):
+		"""
+		Writes the complete blocks of levels which have been appended since
+		the last call, and maps them back from the file.
+		"""
+		if len(self.levelslist) - self.length < self.BLOCK_SIZE:
+			return
+		
+		if not self.file:
+			self.file = open(self.path, "wb")
+			self.__WriteHeader(LevelsList.FLAG_STREAMING)
+			self.index_offset = self.file.tell()
+		self.__WriteBlocks(self.BLOCK_SIZE)
+		
+		f = open(self.path, "rb")
+		try:
+			mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		finally:
+			f.close()
+		self.levelslist.MapHead(LevelsFileReader(mapping))
+	
+	#_____________________________________________________________________
+	
+	def Close(self, remove=False):
+		"""
+		Writes the remaining levels and a complete header, so that the file
+		can be read like any other levels file.
+		
+		Parameters:
+			remove -- True to delete the file instead, because
+					the levels are being saved somewhere else.
+		"""
+		if remove:
+			if self.file:
+				self.file.close()
+				self.file = None
+			try:
+				os.remove(self.path)
+			except OSError:
+				pass
+			return
+		
+		if not self.file:
+			# not even one block was filled
+			self.levelslist.tofile(self.path)
+			return
+		
+		self.__WriteBlocks(1)
+		self.file.seek(0)
+		self.__WriteHeader(0)
+		self.file.close()
+		self.file = None
+	
+	#_____________________________________________________________________
+	
+	def __WriteHeader(self, flags):
+		first = last = 0
+		if self.length:
+			first, last = self.levelslist.times[0], self.levelslist.times[self.length - 1]
+		
+		source_size, source_mtime = self.levelslist.source
+		self.file.write(LevelsList.HEADER.pack(LevelsList.SIGNATURE, LevelsList.VERSION,
+		                LevelsList.FLAG_EXPLICIT_TIMES | flags, 0, first, last, self.length,
+		                len(self.levelslist.series), self.BLOCK_SIZE, source_size, source_mtime))
+	
+	#_____________________________________________________________________
+	
+	def __WriteBlocks(self, minimum):
+		"""
+		Writes blocks of at least minimum levels over the old index,
+		followed by a new index, and makes sure they reach the disk.
+		"""
+		levelslist = self.levelslist
+		self.file.seek(self.index_offset)
+		while len(levelslist) - self.length >= minimum:
+			stop = min(self.length + self.BLOCK_SIZE, len(levelslist))
+			self.offsets.append(self.file.tell())
+			self.file.write(EncodeBlock(levelslist.times[self.length:stop],
+			                [values[self.length:stop] for values in levelslist.series], True))
+			self.length = stop
+		
+		self.index_offset = self.file.tell()
+		self.file.write(struct.pack("<%dQ" % len(self.offsets), *self.offsets))
+		self.file.write(LevelsList.FOOTER.pack(self.index_offset, len(self.offsets), LevelsList.INDEX_MAGIC))
+		self.file.flush()
+		os.fsync(self.file.fileno())
+	
+	#_____________________________________________________________________
+
+#=========================================================================
@@ -28,6 +28,9 @@ import Utils
 import AudioBackend
 import ProjectManager
 import PlatformUtils
+import WaveformScheduler
+import FrameClock
+import ClickGenerator
 
 #=========================================================================
 
@@ -64,6 +67,7 @@ class Project(gobject.GObject):
 			"instrument::added" -- An instrument was added to this project.
 			"instrument::removed" -- An instrument was removed from this project.
 			"instrument::reordered" -- The order of the instruments for this project changed.
+		"length" -- The time at which the last event of this project ends has changed.
 		"time-signature" -- The time signature values were changed.
 		"undo" -- The undo or redo stacks for this project have been changed.
 		"view-start" -- The starting position of the view of this project's timeline has changed.
@@ -78,6 +82,7 @@ class Project(gobject.GObject):
 		"gst-bus-error"	: ( gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, (gobject.TYPE_STRING, gobject.TYPE_STRING) ),
 		"incremental-save" : ( gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, () ),
 		"instrument"		: ( gobject.SIGNAL_RUN_LAST | gobject.SIGNAL_DETAILED, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,) ),
+		"length"			: ( gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, () ),
 		"time-signature"	: ( gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, () ),
 		"undo"			: ( gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, () ),
 		"view-start"		: ( gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, () ),
@@ -99,9 +104,14 @@ class Project(gobject.GObject):
 		self.projectfile = ""		#the name of the project file, complete with path
 		self.audio_path = ""
 		self.levels_path = ""
-		self.___id_list = []		#the list of IDs that have already been used, to avoid collisions
+		self.__objects = {}		#Keys are the IDs that have already been used, to avoid collisions; values are the Instruments and Events holding them, including deleted ones
+		self.__nextID = 0			#the lowest ID which may still be free
 		self.instruments = []		#the list of instruments held by this project
 		self.graveyard = []			# The place where deleted instruments are kept, to later be retrieved by undo functions
+		self.__length = 0.0			#the length of the project, if __lengthIsValid is True
+		self.__lengthIsValid = True		#False if an event or instrument has changed since the length was found
+		self.__lengthUpdateSource = None	#the frame clock subscription which sends the "length" signal
+		self.__sentLength = 0.0		#the length sent with the last "length" signal
 		#used to delete copied audio files if the event that uses them is not saved in the project file
 		#also contains paths to levels_data files corresponding to those audio files
 		self.deleteOnCloseAudioFiles = []	# WARNING: any paths in this list will be deleted on exit!
@@ -117,10 +127,13 @@ class Project(gobject.GObject):
 		self.meter_denom = 4		# time signature denominator
 		self.clickbpm = 120			#the number of beats per minute that the click track will play
 		self.clickVolumeValue = 0	#The value of the click track volume between 0.0 and 1.0
-		#Keys are instruments which are recording; values are 3-tuples of the event being recorded, the recording bin and bus handler id
+		#Keys are instruments which are recording; values are 3-tuples of the event being recorded, the recording bin and its level element
 		self.recordingEvents = {}	#Dict containing recording information for each recording instrument
 		self.volume = 1.0			#The volume setting for the entire project
 		self.level = 0.0			#The level of the entire project as reported by the gstreamer element
+		self.levelHandlers = {}		#Keys are level elements; values are functions called with the bus and each of the element's messages
+		self.pendingLevels = {}		#Keys are the Instruments and Project whose level has changed since the last update; values are their decay in dB
+		self.levelUpdateSource = None	#the frame clock subscription which applies the pending levels
 		self.currentSinkString = None	#to keep track if the sink changes or not
 
 		self.hasDoneIncrementalSave = False	# True if we have already written to the .incremental file from this project.
@@ -135,6 +148,8 @@ class Project(gobject.GObject):
 		self.__performingUndo = False	#True if we are currently in the process of performing an undo command
 		self.__performingRedo = False	#True if we are currently in the process of performing a redo command
 		self.__savedUndo = False		#True if we are performing an undo/redo command that was previously saved
+		
+		self.waveformScheduler = WaveformScheduler.WaveformScheduler(self)	#queues the waveform generation of all the events
 	
 		
 		# CREATE GSTREAMER ELEMENTS AND SET PROPERTIES #
@@ -147,6 +162,7 @@ class Project(gobject.GObject):
 		self.levelElement = gst.element_factory_make("level", "MasterLevel")
 		self.levelElement.set_property("interval", gst.SECOND / 50)
 		self.levelElement.set_property("message", True)
+		self.AddLevelHandler(self.levelElement, self.__MasterLevelCb)
 		
 		#Restrict adder's output caps due to adder bug 341431
 		self.levelElementCaps = gst.element_factory_make("capsfilter", "levelcaps")
@@ -169,8 +185,14 @@ class Project(gobject.GObject):
 		
 		# CONSTRUCT CLICK TRACK BIN #
 		self.clickTrackBin = gst.Bin("Click_Track_Bin")
-		self.clickTrackAudioSrc = gst.element_factory_make("audiotestsrc", "Click_Track_AudioSource")
-		self.clickTrackAudioSrc.set_property("wave", 3)
+		if ClickGenerator.IsAvailable():
+			self.clickTrackAudioSrc = gst.element_factory_make("appsrc", "Click_Track_AudioSource")
+			self.clickGenerator = ClickGenerator.ClickGenerator(self.clickTrackAudioSrc, self)
+		else:
+			#without appsrc, the clicks are made by changing the volume of a test tone
+			self.clickTrackAudioSrc = gst.element_factory_make("audiotestsrc", "Click_Track_AudioSource")
+			self.clickTrackAudioSrc.set_property("wave", 3)
+			self.clickGenerator = None
 		self.clickTrackVolume = gst.element_factory_make("volume", "Click_Track_Volume")
 		self.clickTrackVolume.set_property("mute", True)
 		self.clickTrackConvert = gst.element_factory_make("audioconvert", "Click_Track_Audioconvert")
@@ -181,7 +203,10 @@ class Project(gobject.GObject):
 		
 		clickTrackSrc = gst.GhostPad("src", self.clickTrackConvert.get_pad("src"))
 		self.clickTrackBin.add_pad(clickTrackSrc)
-		self.clickTrackController = gst.Controller(self.clickTrackAudioSrc, "volume")
+		if self.clickGenerator:
+			self.clickTrackController = None
+		else:
+			self.clickTrackController = gst.Controller(self.clickTrackAudioSrc, "volume")
 		
 		self.clickTrackAudioSrc.link(self.clickTrackVolume)
 		self.clickTrackVolume.link(self.clickTrackConvert)
@@ -256,9 +281,8 @@ class Project(gobject.GObject):
 		Globals.debug("current state:", self.mainpipeline.get_state(0)[1].value_name)
 		
 		#If we've been recording then add new events to instruments
-		for instr, (event, bin, handle) in self.recordingEvents.iteritems():
+		for instr, (event, bin, level) in self.recordingEvents.iteritems():
 			instr.FinalizeRecording(event)
-			self.bus.disconnect(handle)
 
 		self.TerminateRecording()
 		
@@ -274,7 +298,8 @@ class Project(gobject.GObject):
 		Globals.debug("State just set to READY")
 		
 		#Relink instruments and stop their recording bins
-		for instr, (event, bin, handle) in self.recordingEvents.iteritems():
+		for instr, (event, bin, level) in self.recordingEvents.iteritems():
+			self.RemoveLevelHandler(level)
 			try:
 				Globals.debug("Removing recordingEvents bin")
 				self.mainpipeline.remove(bin)
@@ -409,7 +434,7 @@ class Project(gobject.GObject):
 				level.set_property("interval", int(event.LEVEL_INTERVAL * gst.SECOND))
 				
 				#update the levels in real time
-				handle = self.bus.connect("message::element", event.recording_bus_level)
+				self.AddLevelHandler(level, event.recording_bus_level)
 				
 				try:
 					src_element = recordingbin.iterate_sources().next()
@@ -419,7 +444,7 @@ class Project(gobject.GObject):
 					if hasattr(src_element.props, "device"):
 						src_element.set_property("device", device)
 				
-				self.recordingEvents[instr] = (event, recordingbin, handle)
+				self.recordingEvents[instr] = (event, recordingbin, level)
 				
 				Globals.debug("Recording in single-input mode")
 				Globals.debug("Using input track: %s" % instr.inTrack)
@@ -629,12 +654,12 @@ class Project(gobject.GObject):
 				filesink.set_property("location", event.GetAbsFile())
 				level.set_property("interval", int(event.LEVEL_INTERVAL * gst.SECOND))
 				
-				handle = self.bus.connect("message::element", event.recording_bus_level)
+				self.AddLevelHandler(level, event.recording_bus_level)
 				
 				# since we are adding the encodebin to an already playing pipeline, sync up there states
 				encodeBin.set_state(gst.STATE_PLAYING)
 
-				self.recordingEvents[instr] = (event, bin, handle)
+				self.recordingEvents[instr] = (event, bin, level)
 				Globals.debug("Linked recording channel: instrument (%s), track %d" % (instr.name, instr.inTrack))
 				break
 
@@ -669,7 +694,8 @@ class Project(gobject.GObject):
 	def __PipelineBusLevelCb(self, bus, message):
 		"""
 		Handles GStreamer bus messages about the currently reported level
-		for the Project or any of the Instruments.
+		for the Project, any of the Instruments or any recording Event,
+		by passing them to the handler added for the element which sent them.
 		
 		Parameters:
 			bus -- reserved for GStreamer callbacks, don't use it explicitly.
@@ -678,20 +704,97 @@ class Project(gobject.GObject):
 		Returns:
 			True -- TODO
 		"""
-		struct = message.structure
-		
-		if struct and struct.get_name() == "level":
-			if not message.src is self.levelElement:
-				for instr in self.instruments:
-					if message.src is instr.levelElement:
-						instr.SetLevel(Utils.DbToFloat(struct["decay"][0]))
-						break
-			else:
-				self.SetLevel(Utils.DbToFloat(struct["decay"][0]))
+		handler = self.levelHandlers.get(message.src)
+		if handler:
+			struct = message.structure
+			if struct and struct.get_name() == "level":
+				handler(bus, message)
 			
 		return True
 
 	#_____________________________________________________________________
+	
+	def __MasterLevelCb(self, bus, message):
+		"""
+		Handles the level messages of the Project's level element.
+		
+		Parameters:
+			bus -- reserved for GStreamer callbacks, don't use it explicitly.
+			message -- reserved for GStreamer callbacks, don't use it explicitly.
+		"""
+		self.QueueLevel(self, message)
+
+	#_____________________________________________________________________
+	
+	def AddLevelHandler(self, element, handler):
+		"""
+		Sets the function which handles the messages of a level element.
+		
+		Parameters:
+			element -- the level element.
+			handler -- function called with the bus and the message.
+		"""
+		self.levelHandlers[element] = handler
+
+	#_____________________________________________________________________
+	
+	def RemoveLevelHandler(self, element):
+		"""
+		Stops handling the messages of a level element.
+		
+		Parameters:
+			element -- the level element.
+		"""
+		self.levelHandlers.pop(element, None)
+
+	#_____________________________________________________________________
+	
+	def QueueLevel(self, target, message):
+		"""
+		Remembers the level reported for an Instrument or the Project, so that
+		the levels of all of them are set together once per frame of the
+		frame clock instead of after every message.
+		
+		Parameters:
+			target -- the Instrument or Project the level belongs to.
+			message -- the message of its level element.
+		"""
+		self.pendingLevels[target] = message.structure["decay"][0]
+		if not self.levelUpdateSource:
+			self.levelUpdateSource = FrameClock.clock.Subscribe(self.__SendLevelUpdates)
+
+	#_____________________________________________________________________
+	
+	def __SendLevelUpdates(self):
+		"""
+		Sets the levels which have been reported since the last frame.
+		
+		Returns:
+			False -- unsubscribes from the frame clock.
+		"""
+		self.levelUpdateSource = None
+		for target, decay in self.pendingLevels.iteritems():
+			target.SetLevel(Utils.DbToFloat(decay))
+		self.pendingLevels = {}
+		return False
+
+	#_____________________________________________________________________
+	
+	def SetMeteringRate(self, element, rate):
+		"""
+		Changes how often a level element reports its level, so that the
+		levels of meters which aren't shown aren't reported at all.
+		
+		Parameters:
+			element -- the level element of an Instrument or the Project.
+			rate -- the number of messages per second, or 0 to stop them.
+		"""
+		if rate > 0:
+			element.set_property("interval", int(gst.SECOND / rate))
+		if element.get_property("message") != (rate > 0):
+			element.set_property("message", rate > 0)
+
+	#_____________________________________________________________________
 
 	def __PipelineBusErrorCb(self, bus, message):
 		"""
@@ -926,6 +1029,9 @@ class Project(gobject.GObject):
 		except OSError:
 			Globals.debug("Removal of .incremental failed! Next load we will try to restore unrestorable state!")
 		
+		# stop decoding the audio files before any of them are deleted
+		self.waveformScheduler.CancelAll()
+		
 		for file in self.deleteOnCloseAudioFiles:
 			if os.path.exists(file):
 				Globals.debug("Deleting copied audio file:", file)
@@ -1101,19 +1207,13 @@ class Project(gobject.GObject):
 		if string[0] == "P":		# Check if the object is a Project
 			return self
 		elif string[0] == "I":		# Check if the object is an Instrument
-			id = int(string[1:])
-			for instr in self.instruments:
-				if instr.id == id:
-					return instr
+			obj = self.__objects.get(int(string[1:]))
+			if isinstance(obj, Instrument.Instrument):
+				return obj
 		elif string[0] == "E":		# Check if the object is an Event
-			id = int(string[1:])
-			for instr in self.instruments:
-				for event in instr.events:
-					if event.id == id:
-						return event
-				for event in instr.graveyard:
-					if event.id == id:
-						return event
+			obj = self.__objects.get(int(string[1:]))
+			if isinstance(obj, Event.Event):
+				return obj
 				
 	#_____________________________________________________________________
 	
@@ -1128,7 +1228,6 @@ class Project(gobject.GObject):
 		self.temp = self.bpm
 		if self.bpm != bpm:
 			self.bpm = bpm
-			#FIXME: find a better way to do project.PrepareClick() it doesn't take a really long time with large bpm
 			self.PrepareClick()
 			self.emit("bpm")
 	
@@ -1222,6 +1321,7 @@ class Project(gobject.GObject):
 		
 		self.temp = instr.id
 		self.instruments.append(instr)
+		self.InvalidateLength()
 		
 		self.emit("instrument::added", instr)
 		return instr
@@ -1250,6 +1350,7 @@ class Project(gobject.GObject):
 		
 		self.graveyard.append(instr)
 		self.instruments.remove(instr)
+		self.InvalidateLength()
 		if instr.isSolo:
 			self.soloInstrCount -= 1
 			self.OnAllInstrumentsMute()
@@ -1275,6 +1376,7 @@ class Project(gobject.GObject):
 		instr.AddAndLinkPlaybackbin()
 		
 		self.instruments.append(instr)
+		self.InvalidateLength()
 		if instr.isSolo:
 			self.soloInstrCount += 1
 			self.OnAllInstrumentsMute()
@@ -1391,17 +1493,45 @@ class Project(gobject.GObject):
 
 	def GetProjectLength(self):
 		"""
-		Returns the length of the Project.
+		Returns the length of the Project. It is only found again after
+		an event or instrument has changed, and each Instrument knows
+		where its own last event ends, so this is cheap to call often.
 		
 		Returns:
 			lenght of the Project in seconds.
 		"""
-		length = 0
-		for instr in self.instruments:
-			for event in instr.events:
-				size = event.start + max(event.duration, event.loadingLength)
-				length = max(length, size)
-		return length
+		if not self.__lengthIsValid:
+			self.__length = max([instr.events.GetEnd() for instr in self.instruments] or [0])
+			self.__lengthIsValid = True
+		return self.__length
+
+	#_____________________________________________________________________
+	
+	def InvalidateLength(self):
+		"""
+		Called when the time at which the last event of an Instrument ends
+		may have changed, or an Instrument has been added or removed. The
+		"length" signal is sent on the next frame if the length has changed.
+		"""
+		self.__lengthIsValid = False
+		if not self.__lengthUpdateSource:
+			self.__lengthUpdateSource = FrameClock.clock.Subscribe(self.__SendLengthUpdate)
+
+	#_____________________________________________________________________
+	
+	def __SendLengthUpdate(self):
+		"""
+		Emits the "length" signal if the length has changed since it was last sent.
+		
+		Returns:
+			False -- unsubscribes from the frame clock.
+		"""
+		self.__lengthUpdateSource = None
+		length = self.GetProjectLength()
+		if length != self.__sentLength:
+			self.__sentLength = length
+			self.emit("length")
+		return False
 
 	#_____________________________________________________________________
 	
@@ -1414,32 +1544,33 @@ class Project(gobject.GObject):
 			
 	#_____________________________________________________________________
 	
-	def GenerateUniqueID(self, id = None,  reserve=True):
+	def GenerateUniqueID(self, id = None,  reserve=True, obj=None):
 		"""
 		Creates a new unique ID which can be assigned to an new Project object.
 		
 		Parameters:
 			id -- an unique ID proposal. If it's already taken, a new one is generated.
 			reserve -- if True, the ID will be recorded and never returned again.
+			obj -- the Instrument or Event the ID is reserved for, so that
+					JokosherObjectFromString() can find it, even after it is deleted.
 			
 		Returns:
 			an unique ID suitable for a new Project.
 		"""
 		if id != None:
-			if id in self.___id_list:
+			if id in self.__objects:
 				Globals.debug("Error: id", id, "already taken")
 			else:
 				if reserve:
-					self.___id_list.append(id)
+					self.__objects[id] = obj
 				return id
-				
-		counter = 0
-		while True:
-			if not counter in self.___id_list:
-				if reserve:
-					self.___id_list.append(counter)
-				return counter
-			counter += 1
+		
+		# IDs are never freed, so the ones below the counter never need checking again
+		while self.__nextID in self.__objects:
+			self.__nextID += 1
+		if reserve:
+			self.__objects[self.__nextID] = obj
+		return self.__nextID
 	
 	#_____________________________________________________________________
 
@@ -1485,8 +1616,12 @@ class Project(gobject.GObject):
 
 	def PrepareClick(self):
 		"""
-		Prepares the click track.
+		Prepares the click track. The ClickGenerator reads the tempo as it
+		plays, so this is only needed when appsrc isn't available and the
+		clicks are made with controller points for the first 600 seconds.
 		"""
+		if self.clickGenerator:
+			return
 
 		self.ClearClickTimes()
 
@@ -1494,7 +1629,7 @@ class Project(gobject.GObject):
 		
 		# FIXME: currently hard coded to 600 seconds
 		length = (600 * second)
-		interval = second / (self.bpm/60)
+		interval = second * 60 / self.bpm
 		
 		self.clickTrackController.set("volume", 0 * gst.SECOND, 0.0)
 
@@ -1518,6 +1653,8 @@ class Project(gobject.GObject):
 		"""
 		if self.clickVolumeValue != value:
 			self.clickTrackVolume.set_property("mute", (value < 0.01))
+			if self.clickGenerator:
+				self.clickGenerator.SetEnabled(value >= 0.01)
 			# convert the 0.0 to 1.0 range to 0.0 to 2.0 range (to let the user make it twice as loud)
 			self.clickTrackVolume.set_property("volume", value * 2)
 			self.clickVolumeValue = value
@@ -1529,7 +1666,8 @@ class Project(gobject.GObject):
 		"""
 		Clears the click track controller times.
 		"""
-		self.clickTrackController.unset_all("volume")
+		if self.clickTrackController:
+			self.clickTrackController.unset_all("volume")
 		
 	#_____________________________________________________________________
 	
@@ -255,7 +255,6 @@ class _LoadZPOFile:
 				id = None
 			e = Event.Event(instr, None, id)
 			self.LoadEvent(e, ev)
-			e.levels_file = e.GetFilename() + Event.Event.LEVELS_FILE_EXTENSION
 			instr.events.append(e)
 		
 		pixbufFilename = os.path.basename(instr.pixbufPath)
@@ -281,6 +280,8 @@ class _LoadZPOFile:
 		"""
 		params = xmlNode.getElementsByTagName("Parameters")[0]
 		Utils.LoadParametersFromXML(event, params)
+		# 0.1 projects don't store the levels file, so the waveform is saved next to the audio
+		event.levels_file = event.GetFilename() + Event.Event.LEVELS_FILE_EXTENSION
 		
 		try:
 			xmlPoints = xmlNode.getElementsByTagName("FadePoints")[0]
@@ -394,7 +395,6 @@ class _LoadZPTFile:
 				id = None
 			event = Event.Event(instr, None, id)
 			self.LoadEvent(event, ev)
-			event.levels_file = event.GetFilename() + Event.Event.LEVELS_FILE_EXTENSION
 			instr.events.append(event)
 		
 		for ev in xmlNode.getElementsByTagName("DeadEvent"):
@@ -404,7 +404,6 @@ class _LoadZPTFile:
 				id = None
 			event = Event.Event(instr, None, id)
 			self.LoadEvent(event, ev, True)
-			event.levels_file = event.GetFilename() + Event.Event.LEVELS_FILE_EXTENSION
 			instr.graveyard.append(event)
 
 
@@ -433,6 +432,9 @@ class _LoadZPTFile:
 		params = xmlNode.getElementsByTagName("Parameters")[0]
 		
 		Utils.LoadParametersFromXML(event, params)
+		# these projects don't store the levels file, and it must be known
+		# before the levels are loaded or the waveform is generated.
+		event.levels_file = event.GetFilename() + Event.Event.LEVELS_FILE_EXTENSION
 		
 		try:
 			xmlPoints = xmlNode.getElementsByTagName("FadePoints")[0]
@@ -441,10 +443,15 @@ class _LoadZPTFile:
 		else:
 			event._Event__fadePointsDict = Utils.LoadDictionaryFromXML(xmlPoints)
 
+		# older projects used a different levels format, which is converted
+		# to the current one the first time the waveform is generated.
+		loaded = False
+		if not (event.isLoading or event.isRecording):
+			loaded = event.LoadLevelsFile()
+		
 		if not isDead:
-			#if event.isLoading or event.isRecording:
-			# we have to always generate waveform because 0.10 uses different levels format
-			event.GenerateWaveform()
+			if not loaded:
+				event.GenerateWaveform()
 			event._Event__UpdateAudioFadePoints()
 			event.CreateFilesource()
 	
@@ -563,17 +570,15 @@ class _LoadZPTenFile(_LoadZPNFile):
 		else:
 			event._Event__fadePointsDict = Utils.LoadDictionaryFromXML(xmlPoints)
 
+		# levels are mapped rather than read, so loading them costs next to
+		# nothing and dead events no longer need regenerating when resurrected.
+		loaded = False
+		if not (event.isLoading or event.isRecording):
+			loaded = event.LoadLevelsFile()
+		
 		if not isDead:
-			if event.isLoading or event.isRecording:  
+			if not loaded:
 				event.GenerateWaveform()
-			else:
-				levels_path = event.GetAbsLevelsFile()
-				try:
-					event.levels_list.fromfile(levels_path)
-				except LevelsList.CorruptFileError:
-					Globals.debug("Cannot load levels from file", levels_path)
-				if not event.levels_list:
-					event.GenerateWaveform()
 			event._Event__UpdateAudioFadePoints()
 			event.CreateFilesource()
 	
@@ -10,6 +10,7 @@
 #-------------------------------------------------------------------------------
 
 import gtk
+import gobject
 import InstrumentViewer
 import TimeLineBar
 import Globals
@@ -47,6 +48,14 @@ class RecordingView(gtk.Frame):
 	
 	"""The number of seconds shown after the end of the last event"""
 	EXTRA_SCROLL_TIME = 25
+	
+	"""
+	How many pages above and below the visible part of the instrument list
+	have their InstrumentViewers created, and how far out of view they are
+	kept before being replaced by a LanePlaceholder again.
+	"""
+	LANE_CREATE_MARGIN = 1.0
+	LANE_RELEASE_MARGIN = 2.0
 
 	#_____________________________________________________________________
 
@@ -85,7 +94,9 @@ class RecordingView(gtk.Frame):
 		self.instrumentWindow.set_policy(gtk.POLICY_NEVER, gtk.POLICY_AUTOMATIC)
 		self.vbox.pack_start(self.instrumentWindow, True, True)
 		self.instrumentWindow.child.set_shadow_type(gtk.SHADOW_NONE)
-		self.views = []	
+		self.views = []		#(instrument id, InstrumentViewer or LanePlaceholder) of each instrument
+		self.defaultLaneHeight = None	#height of a lane, for the placeholders of new instruments
+		self.laneUpdateSource = None
 		
 		self.header_size_group = gtk.SizeGroup(gtk.SIZE_GROUP_HORIZONTAL)
 		self.header_size_group.add_widget(self.timelinebar.GetHeaderWidget())
@@ -146,6 +157,8 @@ class RecordingView(gtk.Frame):
 		self.scrollRange.step_increment = 1
 		
 		self.scrollBar.connect("value-changed", self.OnScroll)
+		self.instrumentWindow.get_vadjustment().connect("value-changed", self.QueueLaneUpdate)
+		self.instrumentBox.connect("size-allocate", self.QueueLaneUpdate)
 		self.connect("expose-event", self.OnExpose)
 		self.connect("button_release_event", self.OnExpose)
 		self.connect("button_press_event", self.OnMouseDown)
@@ -157,6 +170,7 @@ class RecordingView(gtk.Frame):
 		self.project.connect("instrument::reordered", self.OnInstrumentReordered)
 		self.project.connect("instrument::removed", self.OnInstrumentRemoved)
 		self.project.connect("view-start", self.OnViewStartChanged)
+		self.project.connect("length", self.OnProjectLength)
 		
 		self.vbox.drag_dest_set(	gtk.DEST_DEFAULT_DROP,
 									self.DRAG_TARGETS, 
@@ -222,6 +236,7 @@ class RecordingView(gtk.Frame):
 		# calculate scrollable width (scroll bar should always be same width as viewable area)
 		self.scrollRange.page_size = (self.scrollBar.allocation.width) / self.project.viewScale
 		self.scrollRange.page_increment = self.scrollRange.page_size
+		self.UpdateVisibleRange()
 		# add EXTRA_SCROLL_TIME extra seconds
 		length = self.project.GetProjectLength() + self.EXTRA_SCROLL_TIME
 		self.scrollRange.upper = length
@@ -256,14 +271,141 @@ class RecordingView(gtk.Frame):
 			project -- The project that the instrument was added to.
 			instrument -- The instrument that was added.
 		"""
-		instrViewer = InstrumentViewer.InstrumentViewer(project, instrument, self, self.mainview, self.small)
+		if self.defaultLaneHeight is None:
+			# the first lane is created straight away to find out how tall lanes are
+			lane = self.CreateInstrumentViewer(instrument)
+		else:
+			# the lane is created once it is scrolled into view
+			lane = LanePlaceholder(instrument, self.defaultLaneHeight)
 		
 		#Add it to the views
-		self.views.append((instrument.id, instrViewer))
+		self.views.append((instrument.id, lane))
+		
+		self.instrumentBox.pack_start(lane, False, False)
+		lane.show()
+		self.QueueLaneUpdate()
+	
+	#_____________________________________________________________________
+	
+	def CreateInstrumentViewer(self, instrument):
+		"""
+		Creates the InstrumentViewer of an instrument. The height of the
+		first one is used for the placeholders of new instruments.
+		
+		Parameters:
+			instrument -- the Instrument to create the viewer of.
+		
+		Returns:
+			the new InstrumentViewer.
+		"""
+		instrViewer = InstrumentViewer.InstrumentViewer(self.project, instrument, self, self.mainview, self.small)
 		self.header_size_group.add_widget(instrViewer.GetHeaderWidget())
 		
-		self.instrumentBox.pack_start(instrViewer, False, False)
-		instrViewer.show()
+		if self.defaultLaneHeight is None:
+			self.defaultLaneHeight = instrViewer.size_request()[1]
+		return instrViewer
+	
+	#_____________________________________________________________________
+	
+	def GetInstrumentViewer(self, instrument):
+		"""
+		Finds the InstrumentViewer of an instrument,
+		creating it if the instrument is out of view.
+		
+		Parameters:
+			instrument -- an Instrument in the project.
+		
+		Returns:
+			the InstrumentViewer of the instrument, or None if it has none.
+		"""
+		for ID, lane in self.views:
+			if ID == instrument.id:
+				if isinstance(lane, LanePlaceholder):
+					lane = self.ReplaceLane(lane, self.CreateInstrumentViewer(instrument))
+				return lane
+		return None
+	
+	#_____________________________________________________________________
+	
+	def ReplaceLane(self, oldLane, newLane):
+		"""
+		Puts a lane in the place of another one in the instrument list.
+		
+		Parameters:
+			oldLane -- the InstrumentViewer or LanePlaceholder to replace.
+			newLane -- the InstrumentViewer or LanePlaceholder replacing it.
+		
+		Returns:
+			the new lane.
+		"""
+		position = self.instrumentBox.get_children().index(oldLane)
+		self.instrumentBox.remove(oldLane)
+		self.instrumentBox.pack_start(newLane, False, False)
+		self.instrumentBox.reorder_child(newLane, position)
+		newLane.show()
+		
+		ID = oldLane.instrument.id
+		self.views[self.views.index((ID, oldLane))] = (ID, newLane)
+		
+		if isinstance(oldLane, InstrumentViewer.InstrumentViewer):
+			self.header_size_group.remove_widget(oldLane.GetHeaderWidget())
+			oldLane.Destroy()
+		return newLane
+	
+	#_____________________________________________________________________
+	
+	def QueueLaneUpdate(self, *args):
+		"""
+		Updates which lanes have an InstrumentViewer once GTK is idle, after
+		the instrument list has been scrolled or its size has changed.
+		The lanes can't be changed while GTK is allocating their sizes.
+		
+		Parameters:
+			args -- reserved for GTK callbacks, don't use it explicitly.
+		"""
+		if self.laneUpdateSource is None:
+			self.laneUpdateSource = gobject.idle_add(self.UpdateLanes)
+	
+	#_____________________________________________________________________
+	
+	def UpdateLanes(self):
+		"""
+		Creates the InstrumentViewers of the instruments which are in view,
+		or nearly in view, and replaces the ones far out of view with
+		placeholders, so the number of widgets depends on the height of
+		the view rather than the number of instruments.
+		
+		Returns:
+			False -- stop calling the callback on an idle_add.
+		"""
+		self.laneUpdateSource = None
+		
+		adjustment = self.instrumentWindow.get_vadjustment()
+		pageSize = adjustment.page_size
+		if pageSize <= 1:
+			# the view hasn't been allocated yet
+			pageSize = gtk.gdk.screen_height()
+		top = adjustment.value
+		bottom = top + pageSize
+		
+		y = 0
+		for lane in self.instrumentBox.get_children():
+			height = lane.size_request()[1]
+			
+			if isinstance(lane, LanePlaceholder):
+				if y + height >= top - pageSize * self.LANE_CREATE_MARGIN \
+						and y <= bottom + pageSize * self.LANE_CREATE_MARGIN:
+					self.ReplaceLane(lane, self.CreateInstrumentViewer(lane.instrument))
+			
+			elif y + height < top - pageSize * self.LANE_RELEASE_MARGIN \
+					or y > bottom + pageSize * self.LANE_RELEASE_MARGIN:
+				# keep the lanes the user is working with
+				if not lane.instrument.isSelected and not lane.editlabelPacked:
+					self.ReplaceLane(lane, LanePlaceholder(lane.instrument, height))
+			
+			y += height
+		
+		return False
 	
 	#_____________________________________________________________________
 	
@@ -279,9 +421,12 @@ class RecordingView(gtk.Frame):
 			if ID == instrument.id:
 				if instrViewer.parent:
 					self.instrumentBox.remove(instrViewer)
-				instrViewer.Destroy()
+				if isinstance(instrViewer, InstrumentViewer.InstrumentViewer):
+					self.header_size_group.remove_widget(instrViewer.GetHeaderWidget())
+					instrViewer.Destroy()
 				self.views.remove((ID, instrViewer))
 				break
+		self.QueueLaneUpdate()
 	
 	#_____________________________________________________________________
 	
@@ -300,6 +445,7 @@ class RecordingView(gtk.Frame):
 					self.instrumentBox.reorder_child(instrViewer, pos)
 					instrViewer.show_all()
 				break
+		self.QueueLaneUpdate()
 		
 	
 	#_____________________________________________________________________
@@ -452,6 +598,29 @@ class RecordingView(gtk.Frame):
 			project -- The project instance that send the signal.
 		"""
 		self.scrollRange.value = project.viewStart
+		self.UpdateVisibleRange()
+	
+	#_____________________________________________________________________
+	
+	def OnProjectLength(self, project):
+		"""
+		Callback for when the length of the project changes, so that
+		the scrollbar reaches the end while recording or loading.
+		
+		Parameters:
+			project -- The project instance that send the signal.
+		"""
+		self.scrollRange.upper = project.GetProjectLength() + self.EXTRA_SCROLL_TIME
+	
+	#_____________________________________________________________________
+	
+	def UpdateVisibleRange(self):
+		"""
+		Tells the project's WaveformScheduler which part of the timeline is
+		in view, so that the waveforms the user can see are generated first.
+		"""
+		start = self.project.viewStart
+		self.project.waveformScheduler.SetVisibleRange(start, start + self.scrollRange.page_size)
 	
 	#_____________________________________________________________________
 	
@@ -546,9 +715,19 @@ class RecordingView(gtk.Frame):
 		if small == self.small:
 			return
 		self.small = small
+		# the lanes change height, so the placeholders have to be measured again
+		self.defaultLaneHeight = None
 		children = self.instrumentBox.get_children()
 		for instrView in children:
-			instrView.ChangeSize(small)
+			if isinstance(instrView, InstrumentViewer.InstrumentViewer):
+				instrView.ChangeSize(small)
+				if self.defaultLaneHeight is None:
+					self.defaultLaneHeight = instrView.size_request()[1]
+		if self.defaultLaneHeight is not None:
+			for instrView in children:
+				if isinstance(instrView, LanePlaceholder):
+					instrView.set_size_request(-1, self.defaultLaneHeight)
+		self.QueueLaneUpdate()
 		if self.small:
 			self.inbutton.hide()
 			self.outbutton.hide()
@@ -580,3 +759,31 @@ class RecordingView(gtk.Frame):
 	
 	#____________________________________________________________________
 #=========================================================================
+
+class LanePlaceholder(gtk.Alignment):
+	"""
+	An empty widget standing in for the InstrumentViewer of an instrument
+	which is scrolled out of view in the RecordingView. It takes up the
+	same height, so the scrollbar and the positions of the other lanes
+	don't change when it is swapped for the real InstrumentViewer.
+	"""
+	
+	""" Placeholders have no header, so they can't be dragged to reorder instruments """
+	headerEventBox = None
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, instrument, height):
+		"""
+		Creates a new instance of LanePlaceholder.
+		
+		Parameters:
+			instrument -- the Instrument whose lane this stands in for.
+			height -- the height of the lane in pixels.
+		"""
+		gtk.Alignment.__init__(self)
+		self.instrument = instrument
+		self.set_size_request(-1, height)
+	
+	#_____________________________________________________________________
+#=========================================================================
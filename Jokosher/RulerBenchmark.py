@@ -0,0 +1,151 @@
+#!/usr/bin/python
+
+#
+#    THIS FILE IS PART OF THE JOKOSHER PROJECT AND LICENSED UNDER THE GPL. SEE
+#    THE 'COPYING' FILE FOR DETAILS
+#
+#    This module is meant for testing and profiling the code only.
+#    This file should not be included in any release.
+#
+#    It times the exposes of the TimeLine ruler while it follows the playhead,
+#    once drawing every tile in view on every expose as the ruler did before
+#    it cached its tiles, and once using the tile cache.
+#
+#-------------------------------------------------------------------------------
+
+import time
+import cairo
+import gtk
+import TimeLine, WaveformCache, FrameClock
+
+# the size of the ruler in pixels
+WIDTH = 1200
+HEIGHT = 44
+
+# the number of seconds of playback to simulate, and the zoom in pixels per second
+SECONDS = 120
+VIEW_SCALE = 50.
+
+#=========================================================================
+
+class Transport:
+	"""
+	The parts of the TransportManager which the ruler reads.
+	"""
+	MODE_HOURS_MINS_SECS = 1
+	MODE_BARS_BEATS = 2
+
+	def __init__(self, project, mode):
+		self.project = project
+		self.mode = mode
+		self.position = 0.0
+
+	def GetPixelPosition(self):
+		return int((self.position - self.project.viewStart) * self.project.viewScale)
+
+#=========================================================================
+
+class Project:
+	"""
+	The parts of the Project which the ruler reads.
+	"""
+	def __init__(self, mode):
+		self.bpm = 120
+		self.meter_nom = 4
+		self.meter_denom = 4
+		self.viewScale = VIEW_SCALE
+		self.viewStart = 0.0
+		self.transport = Transport(self, mode)
+
+#=========================================================================
+
+class ExposeEvent:
+	"""
+	The part of a gtk.gdk.Event which TimeLine.OnDraw() reads.
+	"""
+	def __init__(self, x, width):
+		self.area = gtk.gdk.Rectangle(x, 0, width, HEIGHT)
+
+#=========================================================================
+
+class Ruler:
+	"""
+	Runs the drawing methods of TimeLine on an offscreen surface, so
+	that no window is needed. Everything else is taken from TimeLine.
+	"""
+	def __init__(self, project):
+		self.project = project
+		self.tiles = WaveformCache.WaveformCache(TimeLine.TimeLine._TILE_CACHE_BYTES)
+		self.allocation = gtk.gdk.Rectangle(0, 0, WIDTH, HEIGHT)
+		self.window = self
+		self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+		self.tilesDrawn = 0
+
+	def __getattr__(self, name):
+		attr = getattr(TimeLine.TimeLine, name)
+		if hasattr(attr, "im_func"):
+			return attr.im_func.__get__(self, Ruler)
+		return attr
+
+	def get_allocation(self):
+		return self.allocation
+
+	def cairo_create(self):
+		return cairo.Context(self.surface)
+
+	def DrawLine(self, index, height):
+		self.tilesDrawn += 1
+		return TimeLine.TimeLine.DrawLine.im_func(self, index, height)
+
+	def Expose(self, x, width, cached):
+		if not cached:
+			# the whole ruler was drawn again on almost every expose
+			self.tiles = WaveformCache.WaveformCache(TimeLine.TimeLine._TILE_CACHE_BYTES)
+			x, width = 0, WIDTH
+		self.OnDraw(self, ExposeEvent(x, width))
+
+#=========================================================================
+
+def Simulate(mode, cached):
+	"""
+	Plays SECONDS of the project at FrameClock.FPS, exposing the ruler
+	as TimeLine.OnTransportPosition does.
+
+	Returns:
+		a (seconds taken, number of exposes, number of tiles drawn) tuple.
+	"""
+	project = Project(mode)
+	ruler = Ruler(project)
+	transport = project.transport
+	exposes = 0
+
+	started = time.time()
+	for frame in xrange(int(SECONDS * FrameClock.FPS)):
+		oldX = transport.GetPixelPosition()
+		transport.position = frame / FrameClock.FPS
+		if transport.position >= project.viewStart + WIDTH / project.viewScale:
+			# the playhead ran off the right edge, so the view follows it
+			project.viewStart += WIDTH / project.viewScale
+			ruler.Expose(0, WIDTH, cached)
+			exposes += 1
+		for x in (oldX, transport.GetPixelPosition()):
+			ruler.Expose(x - 1, 3, cached)
+			exposes += 1
+
+	return time.time() - started, exposes, ruler.tilesDrawn
+
+#_____________________________________________________________________
+
+def main():
+	modes = ((Transport.MODE_HOURS_MINS_SECS, "minutes and seconds"),
+	         (Transport.MODE_BARS_BEATS, "bars and beats"))
+	for mode, name in modes:
+		for cached, label in ((False, "before"), (True, "after")):
+			seconds, exposes, tiles = Simulate(mode, cached)
+			print "%-20s %-6s %8.3fs %6d exposes %7d tiles drawn %8.3fms per expose" % \
+					(name, label, seconds, exposes, tiles, seconds * 1000 / exposes)
+
+#_____________________________________________________________________
+
+if __name__ == "__main__":
+	main()
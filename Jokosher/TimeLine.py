@@ -11,7 +11,7 @@
 import gtk
 import pango
 import cairo
-import gobject
+import WaveformCache, FrameClock
 
 import gettext
 _ = gettext.gettext
@@ -58,8 +58,8 @@ class TimeLine(gtk.DrawingArea):
 			gtk.gdk.BUTTON_RELEASE_MASK |
 			gtk.gdk.BUTTON_PRESS_MASK)
 	
-	"""Number of milliseconds between each scrollbar update while autoscrolling"""
-	_AUTOSCROLL_UPDATE_INTERVAL = 100
+	"""Number of scrollbar updates per second while autoscrolling"""
+	_AUTOSCROLL_UPDATE_RATE = 10
 	
 	"""
 		Speed is relative to distance between mouse and closest edge of the timeline.
@@ -68,6 +68,15 @@ class TimeLine(gtk.DrawingArea):
 	"""
 	_AUTOSCROLL_SPEED = 0.2
 	
+	"""Total size in bytes of the ruler tiles kept for reuse"""
+	_TILE_CACHE_BYTES = 4 * 1024 * 1024
+	
+	"""
+		Number of pixels before a tile where ticks are still drawn, so that
+		labels which start in the tile to the left are continued in this one.
+	"""
+	_LABEL_MARGIN = 80
+	
 	#_____________________________________________________________________
 
 	def __init__(self, project, mainview):
@@ -95,11 +104,8 @@ class TimeLine(gtk.DrawingArea):
 		self.buttonDown = False
 		self.current_autoscroll_diff = 0
 
-		# source is an offscreen canvas to hold our waveform image
-		self.source = cairo.ImageSurface(cairo.FORMAT_ARGB32, 0, 0)
-		
-		#rectangle of cached draw area
-		self.cachedDrawArea = gtk.gdk.Rectangle(0, 0, 0, 0)
+		# ruler tiles drawn from the start of the project, so scrolling reuses them
+		self.tiles = WaveformCache.WaveformCache(self._TILE_CACHE_BYTES)
 
 		# Accessibility helpers
 		self.SetAccessibleName()
@@ -128,10 +134,7 @@ class TimeLine(gtk.DrawingArea):
 		"""
 		self.allocation = allocation
 		
-		# Reconstruct the timeline because the size allocation changed
-		self.DrawLine()
-		
-		# Redraw the reconstructed timeline
+		# The tiles only depend on the height, which is part of their key
 		self.queue_draw()
 		
 	#_____________________________________________________________________
@@ -145,99 +148,98 @@ class TimeLine(gtk.DrawingArea):
 			event -- reserved for GTK callbacks, don't use it explicitly.
 		"""
 		area = event.area
-		cache = self.cachedDrawArea
-		
-		#check if the expose area is within the already cached rectangle
-		if area.x < cache.x or (area.x + area.width > cache.x + cache.width):
-			self.DrawLine()
+		allocArea = self.get_allocation()
 		
 		# Get a cairo surface for this drawing op
 		context = widget.window.cairo_create()
-
-		# Give it our timeline image as a source
-		context.set_source_surface(self.source, 0, 0)
-		# TODO: see what's the problem with using the cached (x,y) values
-		#context.set_source_surface(self.source, self.cachedDrawArea.x, self.cachedDrawArea.y)
-
-		# Blit our timeline
-		context.paint()
+		context.rectangle(area.x, area.y, area.width, area.height)
+		context.clip()
+		
+		# Blit the tiles covering the exposed area. They are drawn from the
+		# start of the project, so scrolling only moves them.
+		tileWidth = WaveformCache.TILE_WIDTH
+		offset = int(round(self.project.viewStart * self.project.viewScale))
+		first = (offset + area.x) // tileWidth
+		last = (offset + area.x + area.width - 1) // tileWidth
+		for index in xrange(first, last + 1):
+			context.set_source_surface(self.GetTile(index, allocArea.height), index * tileWidth - offset, 0)
+			context.paint()
+		
+		# Draw the widget border
+		context.set_antialias(cairo.ANTIALIAS_NONE)
+		context.set_line_width(0.2)
+		context.rectangle(0, 0, allocArea.width, allocArea.height)
+		context.set_source_rgb(*self._BORDER_RGB)
+		context.stroke()
 		
 		# Draw play cursor position (add 1 so it lines up correctly)
 		x = self.project.transport.GetPixelPosition()
 		context.set_line_width(1)
 		context.move_to(x+0.5, 0)
 		context.line_to(x+0.5, self.allocation.height)
-		context.set_antialias(cairo.ANTIALIAS_NONE)
 		context.set_source_rgb(*self._PLAY_CURSOR_RGB)
 		context.stroke()
 	
 	#_____________________________________________________________________
-		
-	def DrawLine(self):
-		""" 
-		Uses Cairo to draw the timeline onto a canvas in memory.
-		Must be called initially and to redraw the timeline
-		after moving the project start.
+	
+	def GetTile(self, index, height):
+		"""
+		Finds a tile of the ruler in the cache, drawing it if it isn't there.
 		
 		Parameters:
-			allocation -- the gtk.gdk.Rectangle allocated to the widget.
+			index -- the index of the tile, counting from the start of the project.
+			height -- the height of the widget.
+			
+		Returns:
+			the cairo ImageSurface of the tile.
 		"""
-		allocArea = self.get_allocation()
-		
-		#rect = gtk.gdk.Rectangle(allocArea.x - allocArea.width, allocArea.y,
-		#				allocArea.width*3, allocArea.height)
+		transport = self.project.transport
+		if transport.mode == transport.MODE_BARS_BEATS:
+			key = (transport.mode, self.project.bpm, self.project.meter_nom,
+			       self.project.meter_denom, self.project.viewScale, height, index)
+		else:
+			# the tempo and meter don't change the minutes and seconds
+			key = (transport.mode, self.project.viewScale, height, index)
+		
+		source = self.tiles.Get(key)
+		if source is None:
+			source = self.DrawLine(index, height)
+			self.tiles.Put(key, source)
+		return source
+	
+	#_____________________________________________________________________
 		
-		# TODO: temporary rect initialization
-		rect = allocArea
+	def DrawLine(self, index, height):
+		""" 
+		Uses Cairo to draw a tile of the timeline onto a canvas in memory.
 		
-		#Check if our area to cache is outside the allocated area
-		#if rect.x < 0:
-		#	rect.x = 0
-		#if rect.x + rect.width > allocArea.width:
-		#	rect.width = allocArea.width - rect.x
+		Parameters:
+			index -- the index of the tile, counting from the start of the project.
+			height -- the height of the widget.
+			
+		Returns:
+			a cairo ImageSurface holding the drawing.
+		"""
+		tileWidth = WaveformCache.TILE_WIDTH
+		tileStart = index * tileWidth
 		
-		self.source = cairo.ImageSurface(cairo.FORMAT_ARGB32, rect.width, rect.height)
+		source = cairo.ImageSurface(cairo.FORMAT_ARGB32, tileWidth, height)
 		
-		context = cairo.Context(self.source)
+		context = cairo.Context(source)
 		context.set_line_width(2)
 		context.set_antialias(cairo.ANTIALIAS_NONE)
 
 		# Draw white background
-		context.rectangle(0, 0, rect.width, rect.height)
+		context.rectangle(0, 0, tileWidth, height)
 		context.set_source_rgb(*self._BACKGROUND_RGB)
 		context.fill()
 		
-		# Draw the widget border
-		context.set_line_width(0.2)
-		context.rectangle(0, 0, rect.width, rect.height)
-		context.set_source_rgb(*self._BORDER_RGB)
-		context.stroke()
+		# start a little before the tile to finish the labels of the tile to the left
+		leftEdge = max(tileStart - self._LABEL_MARGIN, 0)
 		
-		x = 0
 		transport = self.project.transport
 		if transport.mode == transport.MODE_BARS_BEATS:
-			# Calculate our scroll offset
-			# viewStart is in seconds. Seconds/60 = minutes. Minutes * Beat/Minute = beats (not an integer here)
-			pos = (self.project.viewStart / 60.) * self.project.bpm
-			
-			# floor to an integer. beat = the last beat before viewStart
-			beat = int(pos)
-			
-			# offset = part of a beat that has past since the last beat (offset < 1)
-			offset = pos - beat
-			
-			if offset > 0.:
-				# beats * ( pixels/minute ) / ( beats/minute ) = pixels
-				# Set x to the position in pixels of the last beat 
-				x -= offset * ((self.project.viewScale * 60.) / self.project.bpm)
-				
-				# (pixels/minute) / (beats/minute) * 1 beat = pixels
-				# Add the length of one beat, in pixels
-				x += (self.project.viewScale * 60.) / self.project.bpm
-				
-				# x is now at the pixel-position of the first beat after the viewStart
-				beat += 1
-
+			# (pixels/minute) / (beats/minute) * 1 beat = pixels
 			spacing = (60. / self.project.bpm) * self.project.viewScale
 
 			if self.project.meter_denom == 8 and (self.project.meter_nom % 3) == 0 and self.project.meter_nom != 3:
@@ -247,15 +249,21 @@ class TimeLine(gtk.DrawingArea):
 			else:
 				# Simple meter
 				beats_per_bar = self.project.meter_nom
+			
+			# the first beat after the left edge
+			beat = int(leftEdge / spacing)
+			if beat * spacing < leftEdge:
+				beat += 1
+			x = beat * spacing
 		
-			while x < self.get_allocation().width:
+			while x <= tileStart + tileWidth:
 				# Draw the beat/bar divisions
-				ix = int(x)
+				ix = int(x) - tileStart
 
 				if beat % beats_per_bar:
-					lineHeight = int(self.get_allocation().height/1.2)
+					lineHeight = int(height/1.2)
 				else:
-					lineHeight = int(self.get_allocation().height/2)
+					lineHeight = int(height/2)
 					
 					# Draw the bar number
 					context.set_source_rgb(*self._TEXT_RGB)
@@ -272,46 +280,33 @@ class TimeLine(gtk.DrawingArea):
 				
 				# Draw the bar itself	
 				context.move_to(ix, lineHeight)
-				context.line_to(ix, self.get_allocation().height)
+				context.line_to(ix, height)
 				context.set_source_rgb(*self._BEAT_BAR_RGB)
 				context.stroke()
 					
 				beat += 1
 
-				x += spacing
+				x = beat * spacing
 		else:
 			# Working in milliseconds here. Using seconds gives modulus problems because they're floats
 			viewScale = self.project.viewScale / 1000.
-			viewStart = int(self.project.viewStart * 1000)
 			factor, displayMilliseconds = self.GetZoomFactor(viewScale)
 			
-			# Calculate our scroll offset
-			# sec : viewStart, truncated to 1000ms; the second that has past just before the beginning of our surface
-			msec = viewStart - (viewStart % 1000)
-			
-			# sec : move to the last 'line' that wasn't drawn
-			if (msec % factor) != 0:
-				msec -= (msec % factor)
-				
-			# offset: the amount of milliseconds since the last second before the timeline
-			offset = viewStart - msec
-
-			if offset > 0: # x = 0. atm, it should stay that way if offset == 0.
-				# offset : milliseconds
-				# viewScale : pixels / milliseconds
-				# offset * viewScale : offset in pixels
-				x -= offset * viewScale # return to the last 'active' second
-				x += viewScale * factor # positions the cursor at the first second to be drawn
-				msec += factor # cursor is at the first line to be drawn now
+			# the first line after the left edge
+			msec = int(leftEdge / viewScale)
+			if msec % factor:
+				msec += factor - (msec % factor)
+			x = msec * viewScale
 				
-			# Draw ticks up to the end of our display
-			while x < self.get_allocation().width:
-				ix = int(x)
+			# Draw ticks up to the end of the tile, including one on its right
+			# edge since the lines are wide enough to reach into this tile
+			while x <= tileStart + tileWidth:
+				ix = int(x) - tileStart
 				
 				if msec % (self._NUM_LINES * factor):
-					lineHeight = int(self.get_allocation().height/1.2)
+					lineHeight = int(height/1.2)
 				else:
-					lineHeight = int(self.get_allocation().height/2)
+					lineHeight = int(height/2)
 					
 					# Draw the bar number
 					if displayMilliseconds:
@@ -326,15 +321,14 @@ class TimeLine(gtk.DrawingArea):
 				
 				# Draw the bar itself
 				context.move_to(ix, lineHeight)
-				context.line_to(ix, self.get_allocation().height)
+				context.line_to(ix, height)
 				context.set_source_rgb(*self._BEAT_BAR_RGB)
 				context.stroke()
 				
 				msec += factor
-				x += viewScale * factor
+				x = msec * viewScale
 		
-		#set area to record where the cached surface goes
-		self.cachedDrawArea = rect
+		return source
 	
 	#_____________________________________________________________________
 		
@@ -466,7 +460,7 @@ class TimeLine(gtk.DrawingArea):
 				self.current_autoscroll_diff = xpos * self._AUTOSCROLL_SPEED
 			
 			if old_diff == 0:
-				gobject.timeout_add(self._AUTOSCROLL_UPDATE_INTERVAL, self.onUpdateAutoscroll)
+				FrameClock.clock.Subscribe(self.onUpdateAutoscroll, self._AUTOSCROLL_UPDATE_RATE)
 		
 	#_____________________________________________________________________
 	
@@ -14,6 +14,7 @@ import pygst
 pygst.require("0.10")
 import gst
 import gobject
+import FrameClock
 
 #=========================================================================
 
@@ -24,7 +25,13 @@ class TransportManager(gobject.GObject):
 	"""
 
 	""" Position update rate in Frames Per Second. """
-	FPS = 30.
+	FPS = FrameClock.FPS
+	
+	""" Largest difference in seconds between the interpolated and the reported position which is smoothed out. """
+	MAX_DRIFT = 0.1
+	
+	""" Fraction of the difference from the reported position which is corrected each frame. """
+	DRIFT_CORRECTION = 0.25
 	
 	""" Timing resolution - number of ticks ber beat. """
 	TICKS_PER_BEAT = 256
@@ -76,6 +83,7 @@ class TransportManager(gobject.GObject):
 		self.UpdateTimeout = False
 		self.stopPosition = 0
 		self.mode = initialMode
+		self.clockAnchor = None	#(position, pipeline clock time) in seconds of the last position update while playing
 
 	#_____________________________________________________________________
 	
@@ -115,6 +123,7 @@ class TransportManager(gobject.GObject):
 		"""
 		self.isPlaying = False
 		self.isPaused = True
+		self.clockAnchor = None
 		self.project.SetAudioState(self.project.AUDIO_PAUSED)
 		self.pipeline.set_state(gst.STATE_PAUSED)
 	
@@ -126,6 +135,7 @@ class TransportManager(gobject.GObject):
 		"""
 		self.isPlaying = False
 		self.isPaused = False
+		self.clockAnchor = None
 		self.project.SetAudioState(self.project.AUDIO_STOPPED)
 		self.SetPosition(0.0, True)
 		self.pipeline.set_state(gst.STATE_READY)
@@ -313,17 +323,17 @@ class TransportManager(gobject.GObject):
 
 	def StartUpdateTimeout(self):
 		"""
-		Starts the timeout that will control the playhead display.
+		Subscribes to the frame clock to control the playhead display.
 		"""
 		if not self.UpdateTimeout:
-			gobject.timeout_add(int(1000/self.FPS), self.OnUpdate)
+			FrameClock.clock.Subscribe(self.OnUpdate)
 			self.UpdateTimeout = True
 	
 	#_____________________________________________________________________
 	
 	def OnUpdate(self):
 		"""
-		The timeout callback - called every 1/FPS to move the 
+		The frame clock callback - called every 1/FPS to move the 
 		playhead display on.
 		
 		Returns:
@@ -340,6 +350,7 @@ class TransportManager(gobject.GObject):
 				#if pipeline should be playing and has not quite 
 				#yet started then ignore this time through
 				if self.pipeline.get_state(0)[1] == gst.STATE_PAUSED:
+					self.clockAnchor = None
 					return True
 				self.QueryPosition()
 			except gst.QueryError:
@@ -364,6 +375,7 @@ class TransportManager(gobject.GObject):
 		"""
 		#make sure we cant seek to before the beginning
 		pos = max(0, pos)
+		self.clockAnchor = None
 		if self.isPlaying or self.isPaused:
 			#if stopPos is set then pass it to gstreamer here anc clear
 			if stopPos:
@@ -385,9 +397,28 @@ class TransportManager(gobject.GObject):
 	def QueryPosition(self):
 		"""
 		Reads the current playhead cursor position by querying pipeline.
-		"""
-		pos = self.pipeline.query_position(gst.FORMAT_TIME)[0]
-		self.SetPosition(float(pos) / gst.SECOND)
+		The reported position only changes as often as the audio sink
+		takes a buffer, so between those steps the playhead is moved on
+		by the time passed on the pipeline clock, and the difference is
+		corrected a little every frame.
+		"""
+		pos = float(self.pipeline.query_position(gst.FORMAT_TIME)[0]) / gst.SECOND
+		clock = self.pipeline.get_clock()
+		if not clock:
+			self.clockAnchor = None
+			self.SetPosition(pos)
+			return
+		
+		now = float(clock.get_time()) / gst.SECOND
+		if self.clockAnchor:
+			anchorPos, anchorTime = self.clockAnchor
+			interpolated = anchorPos + now - anchorTime
+			#a larger difference means the position was changed by a seek
+			if abs(pos - interpolated) < self.MAX_DRIFT:
+				pos = interpolated + (pos - interpolated) * self.DRIFT_CORRECTION
+		
+		self.clockAnchor = (pos, now)
+		self.SetPosition(pos)
 		
 	#_____________________________________________________________________
 	
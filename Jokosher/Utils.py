@@ -14,6 +14,7 @@ import math, os.path, sys
 import gtk, gobject
 import webbrowser
 import Globals
+import LevelsList
 
 import gst
 try:	
@@ -109,44 +110,66 @@ def DbToFloat(f):
 
 #_____________________________________________________________________
 
+def DecibelsToLevel(decibels):
+	"""
+	Converts a level in decibels to the integer scale used by LevelsList.
+	
+	Parameters:
+		decibels -- level in decibels, which may be negative infinity.
+	
+	Returns:
+		an integer from 0 for levels DECIBEL_RANGE below 0dB or lower,
+		to LevelsList.MAX_LEVEL for 0dB.
+	"""
+	fraction = (max(decibels, -DECIBEL_RANGE) + DECIBEL_RANGE) / float(DECIBEL_RANGE)
+	return int(min(fraction, 1.0) * LevelsList.MAX_LEVEL)
+
+#_____________________________________________________________________
+
 def CalculateAudioLevelFromStructure(structure):
 	"""
-	Calculates an average for all channel levels.
+	Converts the levels in a message from a GStreamer level element into
+	the levels stored in a LevelsList.
 	
 	Parameters:
-		channelLevels -- list of levels from each channel.
+		structure -- the structure of the level element's message.
 		
 	Returns:
-		an average level, also taking into account negative infinity numbers,
-		which will be discarded in the average.
+		an (endtime, levels) tuple, where endtime is in milliseconds and levels
+		is the list returned by CalculateAudioLevel().
 	"""
-	# FIXME: currently everything is being averaged to a single channel
-	channelLevels = structure["rms"]
-
-	negInf = -1E+5000
-	peaktotal = 0
-	for peak in channelLevels:
-		#if peak > 0.001:
-		#	print channelLevels
-		#don't add -inf values cause 500 + -inf is still -inf
-		if peak != negInf:
-			peaktotal += peak
-		else:
-			peaktotal -= DECIBEL_RANGE
-	
-	peaktotal /= len(channelLevels)
-	
-	peaktotal += DECIBEL_RANGE
-	#convert to an integer
-	peaktotal = min(peaktotal, DECIBEL_RANGE)
-	peaktotal = max(peaktotal, -DECIBEL_RANGE)
-	peakint = int((peaktotal / DECIBEL_RANGE) * sys.maxint)
+	levels = CalculateAudioLevel(structure["peak"], structure["rms"])
 
 	endtime = structure["endtime"]
 	#convert number from gst.SECOND (i.e. nanoseconds) to milliseconds
 	endtime_millis = int(endtime / NANO_TO_MILLI_DIVISOR)
 
-	return (endtime_millis, [peakint])
+	return (endtime_millis, levels)
+
+#_____________________________________________________________________
+
+def CalculateAudioLevel(channelPeaks, channelRMS):
+	"""
+	Converts the peak and RMS decibel levels of each channel into
+	the levels stored in a LevelsList.
+	
+	Parameters:
+		channelPeaks -- list of the peak level of each channel in decibels.
+		channelRMS -- list of the RMS level of each channel in decibels.
+		
+	Returns:
+		the average RMS level of all the channels followed by the peak
+		and RMS level of each channel. Negative infinity values are counted as
+		DECIBEL_RANGE below 0dB in the average.
+	"""
+	#don't add -inf values cause 500 + -inf is still -inf
+	rmstotal = sum([max(rms, -DECIBEL_RANGE) for rms in channelRMS])
+	levels = [DecibelsToLevel(rmstotal / float(len(channelRMS)))]
+	for peak, rms in zip(channelPeaks, channelRMS):
+		levels.append(DecibelsToLevel(peak))
+		levels.append(DecibelsToLevel(rms))
+	
+	return levels
 
 #_____________________________________________________________________
 
@@ -37,6 +37,8 @@ class VUWidget(gtk.DrawingArea):
 	_MAX_VOLUME = 2
 	"""the amount to move the volume up or down by when scrolling or pressing the arrow keys"""
 	_VOLUME_STEP_AMOUNT = 0.2
+	""" the number of pixels the level must move by before the meter is redrawn """
+	_LEVEL_REDRAW_THRESHOLD = 2
 	
 	""" Both text height and width below depend on the font size. 
 	If you change the font size, figure out the new pixel sizes and update these values."""
@@ -101,6 +103,7 @@ class VUWidget(gtk.DrawingArea):
 		self.fader_active = False
 		self.fader_hover = False
 		self.message_id = None
+		self.levelYPos = None		# the top of the level bar as it is drawn on screen
 		
 		self.source = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.allocation.width, self.allocation.height)
 		
@@ -257,6 +260,30 @@ class VUWidget(gtk.DrawingArea):
 		
 	#_____________________________________________________________________
 
+	def UpdateLevel(self):
+		"""
+		Called at intervals during playback to update the level bar. Only
+		the strip between the old and new top of the bar is redrawn, and
+		nothing is redrawn if the level has hardly moved or the meter
+		can't be seen.
+		"""
+		if not self.window or not self.window.is_viewable():
+			return
+		toplevel = self.get_toplevel().window
+		if toplevel and toplevel.get_state() & gtk.gdk.WINDOW_STATE_ICONIFIED:
+			return
+		
+		newYPos = self.__GetLevelYPos()
+		oldYPos = self.levelYPos
+		if oldYPos is None:
+			self.levelYPos = newYPos
+			self.queue_draw()
+		elif abs(newYPos - oldYPos) >= self._LEVEL_REDRAW_THRESHOLD:
+			self.levelYPos = newYPos
+			self.queue_draw_area(0, min(oldYPos, newYPos), self.allocation.width, abs(newYPos - oldYPos))
+	
+	#_____________________________________________________________________
+
 	def OnSizeChanged(self, obj, evt):
 		"""
 		Toggles a redraw of the VUWidget if needed.
@@ -268,6 +295,8 @@ class VUWidget(gtk.DrawingArea):
 		if self.allocation.width != self.source.get_width() or self.allocation.height != self.source.get_height():
 			self.source = cairo.ImageSurface(cairo.FORMAT_ARGB32, self.allocation.width, self.allocation.height)
 			self.GenerateBackground()
+		# the level bar is measured from the new height on the next draw
+		self.levelYPos = None
 
 	#_____________________________________________________________________
 
@@ -306,8 +335,17 @@ class VUWidget(gtk.DrawingArea):
 		"""
 		
 		ctx = widget.window.cairo_create()
+		# Only paint the exposed area, which is a thin strip when just the level has changed
+		area = event.area
+		ctx.rectangle(area.x, area.y, area.width, area.height)
+		ctx.clip()
 		
 		rect = self.get_allocation()
+		
+		# Draw the level that UpdateLevel() last invalidated, so the parts
+		# of the meter which aren't exposed still match the ones which are.
+		if self.levelYPos is None:
+			self.levelYPos = self.__GetLevelYPos()
 
 		# Fill a black background		
 		ctx.rectangle(0, 0, rect.width, rect.height)
@@ -315,13 +353,14 @@ class VUWidget(gtk.DrawingArea):
 		ctx.fill()
 
 		# Blit across the cached gradient backgound
-		ctx.rectangle(0, rect.height * (1. - self.mixerstrip.GetLevel()), rect.width, rect.height)
+		ctx.save()
+		ctx.rectangle(0, self.levelYPos, rect.width, rect.height)
 		ctx.clip()
 		ctx.set_source_surface(self.source, 0, 0)	
 		ctx.paint()
 
 		# Reset the clip region
-		ctx.reset_clip()
+		ctx.restore()
 		
 		# Draw the current volume level bar, with highlight if appropriate
 		vpos = self.__GetVolumeHandleYPos()
@@ -396,6 +435,16 @@ class VUWidget(gtk.DrawingArea):
 	
 	#_____________________________________________________________________
 	
+	def __GetLevelYPos(self):
+		"""
+		Returns:
+			the Y value in pixels of the top of the level bar
+			for the mixer strip's current level.
+		"""
+		return int(self.get_allocation().height * (1. - self.mixerstrip.GetLevel()))
+	
+	#_____________________________________________________________________
+	
 	def __YPosOverVolumeHandle(self, yPos):
 		"""
 		Calculates if the given vertical position is located over top of the volume handle.
@@ -0,0 +1,303 @@
+#
+#	THIS FILE IS PART OF THE JOKOSHER PROJECT AND LICENSED UNDER THE GPL. SEE
+#	THE 'COPYING' FILE FOR DETAILS
+#
+#	WaveformCache.py
+#
+#	This module holds the rendered tiles of the waveforms of all events,
+#	so that scrolling and zooming back to an earlier scale can reuse them
+#	instead of drawing the levels again. The tiles are drawn by a pool of
+#	threads, so that the expose handlers never wait for them.
+#
+#-------------------------------------------------------------------------------
+
+import threading, Queue
+import gobject
+import Globals, WaveformScheduler
+
+# the width in pixels of each tile
+TILE_WIDTH = 256
+
+# the total size of the tiles kept in memory
+MAX_BYTES = 32 * 1024 * 1024
+
+#=========================================================================
+
+class WaveformCache:
+	"""
+	A cache of rendered waveform tiles with a limit on the memory used by
+	all of them. When the limit is reached, the least recently used tiles
+	are thrown away.
+	
+	Tiles are keyed by a tuple starting with the id of their event and the
+	version of its waveform, followed by anything else that changes what
+	the tile looks like, such as the zoom level and the tile index. Other
+	users of the class, such as the ruler of the TimeLine, can use keys
+	of their own as long as they don't call RemoveEvent().
+	"""
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, maxBytes):
+		"""
+		Creates a new instance of WaveformCache.
+		
+		Parameters:
+			maxBytes -- the total size of the tiles to keep.
+		"""
+		self.maxBytes = maxBytes
+		self.tiles = {}		#key -> [surface, size in bytes, time of last use]
+		self.size = 0
+		self.clock = 0		#counts every use so the oldest tile can be found
+		self.lastVersion = 0
+	
+	#_____________________________________________________________________
+	
+	def NewVersion(self):
+		"""
+		Returns:
+			a waveform version number which has never been used before,
+			so tiles drawn for any older version are never returned.
+		"""
+		self.lastVersion += 1
+		return self.lastVersion
+	
+	#_____________________________________________________________________
+	
+	def Get(self, key):
+		"""
+		Parameters:
+			key -- the key of the tile.
+		
+		Returns:
+			the cairo surface of the tile, or None if it isn't cached.
+		"""
+		tile = self.tiles.get(key)
+		if tile is None:
+			return None
+		
+		self.clock += 1
+		tile[2] = self.clock
+		return tile[0]
+	
+	#_____________________________________________________________________
+	
+	def Put(self, key, surface):
+		"""
+		Adds a tile to the cache, removing the least recently used
+		tiles if the cache has grown too large.
+		
+		Parameters:
+			key -- the key of the tile.
+			surface -- the cairo ImageSurface of the tile.
+		"""
+		self.Remove(key)
+		
+		size = surface.get_width() * surface.get_height() * 4
+		self.clock += 1
+		self.tiles[key] = [surface, size, self.clock]
+		self.size += size
+		
+		if self.size > self.maxBytes:
+			self.__Trim()
+	
+	#_____________________________________________________________________
+	
+	def Remove(self, key):
+		"""
+		Removes a tile from the cache, if it is there.
+		
+		Parameters:
+			key -- the key of the tile.
+		"""
+		tile = self.tiles.pop(key, None)
+		if tile:
+			self.size -= tile[1]
+	
+	#_____________________________________________________________________
+	
+	def Rename(self, oldKey, newKey):
+		"""
+		Moves a tile to a new key, for when a change to its
+		event's waveform doesn't affect what the tile looks like.
+		
+		Parameters:
+			oldKey -- the key the tile is cached under.
+			newKey -- the key to cache it under instead.
+		
+		Returns:
+			True if the tile was moved, False if it isn't cached.
+		"""
+		tile = self.tiles.pop(oldKey, None)
+		if tile is None:
+			return False
+		
+		self.Remove(newKey)
+		self.tiles[newKey] = tile
+		return True
+	
+	#_____________________________________________________________________
+	
+	def RemoveEvent(self, eventID, keepVersions=()):
+		"""
+		Removes the tiles of an event which are out of date.
+		
+		Parameters:
+			eventID -- the id of the event.
+			keepVersions -- the versions of the event's waveform whose
+					tiles are kept. If empty, all of them are removed.
+		"""
+		for key in self.tiles.keys():
+			if key[0] == eventID and key[1] not in keepVersions:
+				self.Remove(key)
+	
+	#_____________________________________________________________________
+	
+	def __Trim(self):
+		"""
+		Removes the least recently used tiles until the cache uses no
+		more than three quarters of its limit, so that it doesn't have
+		to be trimmed again after every new tile.
+		"""
+		entries = [(tile[2], key) for key, tile in self.tiles.iteritems()]
+		entries.sort()
+		for lastUse, key in entries:
+			if self.size <= self.maxBytes * 3 / 4:
+				break
+			self.Remove(key)
+	
+	#_____________________________________________________________________
+
+#=========================================================================
+
+class TileRenderer:
+	"""
+	A pool of threads which draw waveform tiles in the background. The
+	drawing functions must only use cairo and the data they are given,
+	because GTK and the events can only be used from the main thread.
+	Finished tiles are added to the cache in the main thread.
+	"""
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, cache, numThreads):
+		"""
+		Creates a new instance of TileRenderer.
+		
+		Parameters:
+			cache -- the WaveformCache the finished tiles are added to.
+			numThreads -- the number of tiles to draw at once.
+		"""
+		self.cache = cache
+		self.numThreads = numThreads
+		self.queue = Queue.Queue()
+		self.pending = {}		#key -> job of the tiles which are queued or being drawn
+		self.threads = []
+	
+	#_____________________________________________________________________
+	
+	def Render(self, key, draw, data, callback):
+		"""
+		Queues a tile to be drawn, unless it is already waiting.
+		
+		Parameters:
+			key -- the key the tile is cached under.
+			draw -- function called on a worker thread with data,
+					which returns the cairo ImageSurface of the tile.
+			data -- everything draw needs to know about the tile.
+			callback -- function called in the main thread with the
+					key once the tile has been added to the cache.
+		"""
+		if key in self.pending:
+			return
+		
+		# start the threads the first time they are needed
+		while len(self.threads) < self.numThreads:
+			thread = threading.Thread(target=self.__Run)
+			thread.setDaemon(True)
+			thread.start()
+			self.threads.append(thread)
+		
+		job = [key, draw, data, callback, False]	#the last item is set when the job is cancelled
+		self.pending[key] = job
+		self.queue.put(job)
+	
+	#_____________________________________________________________________
+	
+	def IsPending(self, key):
+		"""
+		Parameters:
+			key -- the key of a tile.
+		
+		Returns:
+			True if the tile is waiting to be drawn or being drawn.
+		"""
+		return key in self.pending
+	
+	#_____________________________________________________________________
+	
+	def CancelEvent(self, eventID, keepVersion=None):
+		"""
+		Cancels the tiles of an event which are no longer wanted.
+		
+		Parameters:
+			eventID -- the id of the event.
+			keepVersion -- the current version of the event's waveform, whose
+					tiles are still drawn. If None, all of them are cancelled.
+		"""
+		for key, job in self.pending.items():
+			if key[0] == eventID and key[1] != keepVersion:
+				job[4] = True
+				del self.pending[key]
+	
+	#_____________________________________________________________________
+	
+	def __Run(self):
+		"""
+		A worker thread. Draws the queued tiles one at a time.
+		"""
+		while True:
+			job = self.queue.get()
+			if job[4]:
+				continue
+			
+			try:
+				surface = job[1](job[2])
+			except Exception, e:
+				Globals.debug("Cannot draw waveform tile", job[0], e)
+				surface = None
+			gobject.idle_add(self.__Finished, job, surface)
+	
+	#_____________________________________________________________________
+	
+	def __Finished(self, job, surface):
+		"""
+		Adds a drawn tile to the cache and tells whoever asked for it.
+		
+		Parameters:
+			job -- the job of the tile.
+			surface -- the cairo ImageSurface of the tile,
+					or None if it couldn't be drawn.
+		
+		Returns:
+			False -- stops the idle callback.
+		"""
+		if job[4]:
+			return False
+		
+		key = job[0]
+		del self.pending[key]
+		if surface is not None:
+			self.cache.Put(key, surface)
+			job[3](key)
+		return False
+	
+	#_____________________________________________________________________
+
+#=========================================================================
+
+# the cache shared by all the EventViewers
+cache = WaveformCache(MAX_BYTES)
+
+# the threads which draw the tiles for all the EventViewers
+renderer = TileRenderer(cache, WaveformScheduler.CountProcessors())
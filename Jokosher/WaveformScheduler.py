@@ -0,0 +1,205 @@
+#
+#	THIS FILE IS PART OF THE JOKOSHER PROJECT AND LICENSED UNDER THE GPL. SEE
+#	THE 'COPYING' FILE FOR DETAILS
+#
+#	WaveformScheduler.py
+#
+#	This module limits how many events decode their audio files at once
+#	to generate their waveforms, starting the visible events first.
+#
+#-------------------------------------------------------------------------------
+
+import gobject
+import Globals
+
+try:
+	import multiprocessing
+except ImportError:
+	multiprocessing = None
+
+#=========================================================================
+
+class WaveformScheduler(gobject.GObject):
+	"""
+	Queues the waveform generation of every Event in a Project so that
+	only a few decoding pipelines run at the same time. Events which are
+	in view in the RecordingView are started before the others.
+	"""
+	
+	"""
+	Signals:
+		"progress" -- The number of finished or waiting waveforms has changed.
+				The number of waveforms finished and the total number
+				of waveforms since the scheduler was last idle are sent.
+	"""
+	
+	__gsignals__ = {
+		"progress"	: ( gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, (gobject.TYPE_INT, gobject.TYPE_INT) )
+	}
+	
+	#_____________________________________________________________________
+	
+	def __init__(self, project, maxRunning=None):
+		"""
+		Creates a new instance of WaveformScheduler.
+		
+		Parameters:
+			project -- the Project whose events are scheduled.
+			maxRunning -- the number of waveforms to generate at once.
+					Defaults to the number of processors.
+		"""
+		gobject.GObject.__init__(self)
+		
+		self.project = project
+		self.maxRunning = maxRunning or CountProcessors()
+		self.waiting = []		#(event, start function) pairs in the order they were scheduled
+		self.running = []		#events whose pipelines have been started
+		self.visibleRange = None	#(start, stop) in seconds of the part of the timeline in view
+		self.finishedCount = 0
+		self.totalCount = 0
+	
+	#_____________________________________________________________________
+	
+	def Schedule(self, event, start):
+		"""
+		Queues an event's waveform generation.
+		
+		Parameters:
+			event -- the Event to generate the waveform of.
+			start -- function which starts the event's loading pipeline. The
+					event must call Done() once the pipeline has stopped.
+		"""
+		if event in self.running:
+			# the event is restarting, for example after installing a plugin
+			start()
+			return
+		
+		for index, (waitingEvent, waitingStart) in enumerate(self.waiting):
+			if waitingEvent is event:
+				self.waiting[index] = (event, start)
+				return
+		
+		Globals.debug("Event", event.id, "is waiting to generate its waveform")
+		self.waiting.append((event, start))
+		self.totalCount += 1
+		self.__StartWaiting()
+		self.emit("progress", self.finishedCount, self.totalCount)
+	
+	#_____________________________________________________________________
+	
+	def Done(self, event):
+		"""
+		Frees the slot of an event whose pipeline has stopped, or takes an
+		event out of the queue if it had not been started yet.
+		
+		Parameters:
+			event -- the Event which has finished or been cancelled.
+		"""
+		if event in self.running:
+			self.running.remove(event)
+			self.finishedCount += 1
+		else:
+			waiting = [pair for pair in self.waiting if pair[0] is not event]
+			if len(waiting) == len(self.waiting):
+				return
+			self.waiting = waiting
+			self.totalCount -= 1
+		
+		self.__StartWaiting()
+		if not self.running and not self.waiting:
+			self.finishedCount = self.totalCount = 0
+		self.emit("progress", self.finishedCount, self.totalCount)
+	
+	#_____________________________________________________________________
+	
+	def CancelAll(self):
+		"""
+		Stops all running and waiting waveform generation.
+		"""
+		# empty the queue first so that no waiting event takes a freed slot
+		waiting = [pair[0] for pair in self.waiting]
+		self.waiting = []
+		for event in self.running + waiting:
+			event.StopGenerateWaveform(False)
+	
+	#_____________________________________________________________________
+	
+	def SetVisibleRange(self, start, stop):
+		"""
+		Sets the part of the timeline which is in view, so that the
+		waveforms of the events in it are generated first.
+		
+		Parameters:
+			start -- time in seconds at the left edge of the view.
+			stop -- time in seconds at the right edge of the view.
+		"""
+		self.visibleRange = (start, stop)
+	
+	#_____________________________________________________________________
+	
+	def IsVisible(self, event):
+		"""
+		Parameters:
+			event -- an Event in the project.
+		
+		Returns:
+			True if the event is in view.
+		"""
+		if not self.visibleRange or not event.instrument.isVisible:
+			return False
+		
+		start, stop = self.visibleRange
+		return event.start < stop and event.start + event.duration >= start
+	
+	#_____________________________________________________________________
+	
+	def GetProgress(self):
+		"""
+		Returns:
+			the fraction of the scheduled waveforms which has been generated,
+			including the part of each running waveform done so far.
+		"""
+		if not self.totalCount:
+			return 1.0
+		
+		done = float(self.finishedCount)
+		for event in self.running:
+			if event.duration:
+				done += min(event.loadingLength / event.duration, 1.0)
+		return done / self.totalCount
+	
+	#_____________________________________________________________________
+	
+	def __StartWaiting(self):
+		"""
+		Starts waiting events while there are free slots, visible ones first.
+		"""
+		while self.waiting and len(self.running) < self.maxRunning:
+			index = 0
+			for i, (event, start) in enumerate(self.waiting):
+				if self.IsVisible(event):
+					index = i
+					break
+			
+			event, start = self.waiting.pop(index)
+			self.running.append(event)
+			Globals.debug("Event", event.id, "started generating its waveform")
+			start()
+	
+	#_____________________________________________________________________
+
+#=========================================================================
+
+def CountProcessors():
+	"""
+	Returns:
+		the number of processors in the machine, or 1 if it is unknown.
+	"""
+	if multiprocessing:
+		try:
+			return multiprocessing.cpu_count()
+		except NotImplementedError:
+			pass
+	return 1
+
+#=========================================================================